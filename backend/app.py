@@ -1,15 +1,59 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import time
+import logging
+from flask import Flask, request, jsonify, send_from_directory, Response, g
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-from classifier import AviationClassifier
+from logconfig import configure_logging
+from startup import ModelService, NotReady
+from registry import UnknownModelError
+from jobs import ACTIVE, DEFAULT_PAGE_SIZE, JobNotFound, summarize
+from metrics import REGISTRY, REQUEST_SECONDS, REQUESTS_TOTAL, current_endpoint, timed
+from codec import FastJSONProvider, compress_response
 import json
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__, static_folder='../frontend/build')
+app.json = FastJSONProvider(app)
 CORS(app)
 
-classifier = AviationClassifier()
+# The classifier, its default model and the optional parallel scorer and
+# coalescer are built on a background thread; see startup.py
+service = ModelService().start()
+
+DEFAULT_JOB_CHUNK_SIZE = 5000
+
+# Endpoints whose first successful response counts as the first prediction
+PREDICTION_ENDPOINTS = frozenset(['/api/predict', '/api/batch-predict', '/api/compare'])
+
+@app.errorhandler(NotReady)
+def service_not_ready(e):
+    response = jsonify({'error': str(e), 'state': service.state})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    current_endpoint.set(rule)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = current_endpoint.get()
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint, method=request.method)
+    REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    if endpoint in PREDICTION_ENDPOINTS and response.status_code == 200:
+        service.record_prediction()
+    return response
+
+@app.after_request
+def compress_api_response(response):
+    # Only API responses: static files are served with ranges and their own caching
+    if request.path.startswith('/api/'):
+        return compress_response(response, request)
+    return response
 
 @app.route('/')
 def serve():
@@ -24,22 +68,77 @@ def serve_static(path):
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
+    classifier = service.get()
     try:
-        data = request.get_json()
+        with timed('decode'):
+            data = request.get_json(silent=True)
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object of feature values'}), 400
         
-        result = classifier.predict(data)
+        model_name = data.pop('model', None) or request.args.get('model')
+        try:
+            classifier.get_bundle(model_name)
+        except UnknownModelError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if service.coalescer is not None:
+            result = service.coalescer.predict(data, model_name)
+        else:
+            result = classifier.predict(data, model_name)
         
-        return jsonify(result)
+        with timed('serialization', result.get('model_used')):
+            return jsonify(result)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/compare', methods=['POST'])
+def compare_models():
+    """Score a record or a list of records with several models, plus a soft-voting ensemble"""
+    from compare import compare
+    classifier = service.get()
+    try:
+        with timed('decode'):
+            data = request.get_json(silent=True)
+
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+
+        records = data.get('records', data.get('record'))
+        if not isinstance(records, (dict, list)) or not records:
+            return jsonify({'error': "Provide a 'record' object or a 'records' list"}), 400
+        model_names = data.get('models')
+        if model_names is not None and (not isinstance(model_names, list)
+                                        or not all(isinstance(name, str) for name in model_names)):
+            return jsonify({'error': "'models' must be a list of model names"}), 400
+        model_names = model_names or classifier.get_available_models()
+        weights = data.get('weights')
+        if weights is not None and not isinstance(weights, dict):
+            return jsonify({'error': "'weights' must map model names to numbers"}), 400
+
+        try:
+            result = compare(classifier, records, model_names, data.get('ensemble', True), weights)
+        except UnknownModelError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with timed('serialization'):
+            return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/features', methods=['GET'])
 def get_features():
     """Get the list of features that the model expects"""
+    classifier = service.get()
     try:
         features = classifier.get_feature_names()
         return jsonify({'features': features})
@@ -49,19 +148,28 @@ def get_features():
 @app.route('/api/models', methods=['GET'])
 def get_available_models():
     """Get list of available models"""
+    classifier = service.get()
     try:
         models = classifier.get_available_models()
-        return jsonify({'models': models})
+        return jsonify({
+            'models': models,
+            'current_model': classifier.current_model_name,
+            'resident_models': classifier.registry.resident()
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/model/<model_name>', methods=['POST'])
 def switch_model(model_name):
     """Switch to a different model"""
+    classifier = service.get()
     try:
-        success = classifier.load_model(model_name)
+        success = classifier.switch_model(model_name)
         if success:
-            return jsonify({'message': f'Successfully switched to {model_name}', 'current_model': model_name})
+            response = jsonify({'message': f'Successfully switched to {model_name}', 'current_model': model_name})
+            # Tells the reverse proxy to drop its cached model metadata
+            response.headers['X-Cache-Invalidate'] = '/api/features'
+            return response
         else:
             return jsonify({'error': f'Failed to load model {model_name}'}), 400
     except Exception as e:
@@ -69,7 +177,10 @@ def switch_model(model_name):
 
 @app.route('/api/batch-predict', methods=['POST'])
 def batch_predict():
-    """Handle batch predictions from CSV file"""
+    """Handle batch predictions from a CSV, Parquet or Arrow file"""
+    from batch import (BatchPredictor, DEFAULT_CHUNK_SIZE, FORMATS, INPUT_FORMATS, input_format, negotiate_format,
+                       spool_upload)
+    classifier = service.get()
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -78,30 +189,182 @@ def batch_predict():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        if file and file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-
-            results = []
-            for index, row in df.iterrows():
-                row_data = row.to_dict()
-                prediction = classifier.predict(row_data)
-                results.append({
-                    'row_index': index,
-                    'prediction': prediction['prediction'],
-                    'confidence': prediction.get('confidence', 0)
-                })
-            
-            return jsonify({'predictions': results, 'total_rows': len(results)})
+        source_format = input_format(file.filename)
+        if file and source_format:
+            fmt = negotiate_format(request)
+            chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+            model_name = request.form.get('model') or request.args.get('model')
+            try:
+                classifier.get_bundle(model_name)
+            except UnknownModelError as e:
+                return jsonify({'error': str(e)}), 404
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            predictor = BatchPredictor(classifier, chunk_size=max(chunk_size, 1), model_name=model_name)
+            upload = spool_upload(file)
+            try:
+                body = predictor.stream(upload, fmt, source_format)
+            except Exception:
+                upload.close()
+                raise
+            response = Response(body, mimetype=FORMATS[fmt])
+            response.call_on_close(upload.close)
+            return response
         else:
-            return jsonify({'error': 'Please upload a CSV file'}), 400
+            return jsonify({'error': f"Please upload a {', '.join(INPUT_FORMATS)} file"}), 400
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a CSV file for asynchronous batch prediction"""
+    classifier = service.get()
+    try:
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            return jsonify({'error': 'No file provided'}), 400
+        if not file.filename.endswith('.csv'):
+            return jsonify({'error': 'Please upload a CSV file'}), 400
+
+        model_name = request.form.get('model') or request.args.get('model')
+        try:
+            bundle = classifier.get_bundle(model_name)
+        except UnknownModelError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        chunk_size = request.form.get('chunk_size', request.args.get('chunk_size', DEFAULT_JOB_CHUNK_SIZE), type=int)
+
+        state = service.jobs.submit(file.stream, file.filename, bundle.name, chunk_size)
+        response = jsonify(summarize(state))
+        response.headers['Location'] = f"/api/jobs/{state['id']}"
+        return response, 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """All known batch jobs, oldest first"""
+    service.get()
+    return jsonify({'jobs': [summarize(state) for state in service.jobs.store.list()]})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status, progress and throughput of one batch job"""
+    service.get()
+    try:
+        return jsonify(summarize(service.jobs.store.load(job_id)))
+    except JobNotFound:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """One page of finished results, from ?offset= (row) for ?limit= rows"""
+    service.get()
+    try:
+        state = service.jobs.store.load(job_id)
+    except JobNotFound:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    rows = service.jobs.store.read_results(state, offset, limit)
+    next_offset = offset + len(rows)
+    return jsonify({
+        'id': job_id,
+        'status': state['status'],
+        'offset': offset,
+        'results': rows,
+        'rows_done': state['rows_done'],
+        'next_offset': next_offset if next_offset < state['rows_done'] or state['status'] in ACTIVE else None,
+    })
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    """Stream every finished result row as CSV"""
+    service.get()
+    try:
+        state = service.jobs.store.load(job_id)
+    except JobNotFound:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    response = Response(service.jobs.store.iter_results_file(state), mimetype='text/csv')
+    response.headers['Content-Length'] = str(state['result_bytes'])
+    response.headers['Content-Disposition'] = f'attachment; filename="{job_id}.csv"'
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a batch job and delete its files"""
+    service.get()
+    try:
+        state = service.jobs.cancel(job_id)
+    except JobNotFound:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(summarize(state))
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Hit, miss and eviction counters of the prediction result cache"""
+    return jsonify(service.get().result_cache.stats())
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """Drop every cached prediction result"""
+    service.get().result_cache.clear()
+    return jsonify({'message': 'Result cache cleared'})
+
+@app.route('/api/coalescer', methods=['GET'])
+def coalescer_stats():
+    """Achieved batch sizes of the /api/predict coalescer"""
+    if service.coalescer is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(service.coalescer.stats(), enabled=True))
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request and per-stage metrics"""
+    gauges = {
+        'aviation_ready': ('1 once a model is loaded and warmed up', int(service.ready)),
+    }
+    for stage, seconds in service.timings.items():
+        gauges[f'aviation_startup_{stage}_seconds'] = (f'Seconds spent in the {stage} start-up stage', seconds)
+    if service.ready_seconds is not None:
+        gauges['aviation_ready_seconds'] = ('Seconds from process start until the service was ready',
+                                            service.ready_seconds)
+    if service.first_prediction_seconds is not None:
+        gauges['aviation_first_prediction_seconds'] = ('Seconds from process start until the first prediction',
+                                                       service.first_prediction_seconds)
+    if service.classifier is None:
+        return Response(REGISTRY.render(gauges), mimetype='text/plain; version=0.0.4')
+
+    cache = service.classifier.result_cache.stats()
+    registry = service.classifier.registry.stats()
+    gauges.update({
+        'aviation_result_cache_entries': ('Entries in the prediction result cache', cache['entries']),
+        'aviation_result_cache_hits_total': ('Prediction result cache hits', cache['hits'], 'counter'),
+        'aviation_result_cache_misses_total': ('Prediction result cache misses', cache['misses'], 'counter'),
+        'aviation_result_cache_evictions_total': ('Prediction result cache evictions', cache['evictions'], 'counter'),
+        'aviation_resident_models': ('Models held in memory by the registry', len(registry['resident'])),
+        'aviation_resident_model_bytes': ('Estimated bytes of resident models', registry['memory_bytes']),
+        'aviation_model_evictions_total': ('Models evicted from the registry', registry['evictions'], 'counter'),
+    })
+    if service.coalescer is not None:
+        stats = service.coalescer.stats()
+        gauges['aviation_coalescer_requests_total'] = ('Requests routed through the coalescer', stats['requests'], 'counter')
+        gauges['aviation_coalescer_batches_total'] = ('Batches run by the coalescer', stats['batches'], 'counter')
+    return Response(REGISTRY.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'Aviation Damage Prediction API is running'})
+    """Liveness check: the process is up, whether or not a model is loaded"""
+    return jsonify({'status': 'healthy', 'message': 'Aviation Damage Prediction API is running',
+                    'ready': service.ready})
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check: 200 only once a model is loaded and warmed up"""
+    status = service.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+Directory-based model bundle format.
+
+A bundle is a ``<name>.bundle`` directory next to the ``.pkl`` files:
+
+    manifest.json       feature names, encoder classes, scaler parameters
+    model.joblib        the estimator, written uncompressed by joblib
+    engine.<name>.npy   arrays of the compiled evaluator (see compiled.py)
+
+When the model can be compiled, its flattened tree node arrays or linear
+coefficients are saved as .npy files and loaded with ``mmap_mode='r'``:
+loading only maps them, their pages are read on demand and shared by every
+process that opens the same bundle, and nothing is unpickled. The engine
+scores batches of every size, so the estimator in model.joblib is only
+loaded if the engine fails or something asks for an attribute of the
+original model. Models that cannot be compiled are loaded from
+model.joblib right away. Encoders and a StandardScaler are plain JSON.
+
+Convert existing pickles with:
+
+    python artifact.py models/random_forest.pkl [more.pkl ...]
+"""
+
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from compiled import compile_model, engine_from_state, engine_state
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_SUFFIX = '.bundle'
+MANIFEST = 'manifest.json'
+MODEL_FILE = 'model.joblib'
+SCALER_FILE = 'scaler.joblib'
+FORMAT_VERSION = 1
+
+
+def is_bundle(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def bundle_files(path):
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+
+
+def bundle_fingerprint(path):
+    """(newest mtime, total size) of the files in a bundle directory"""
+    stats = [os.stat(f) for f in bundle_files(path)]
+    return (max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats))
+
+
+def bundle_size(path):
+    return sum(os.path.getsize(f) for f in bundle_files(path))
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _encode_scaler(scaler, path):
+    if scaler is None:
+        return None
+    if type(scaler) is StandardScaler:
+        return {
+            'type': 'StandardScaler',
+            'with_mean': scaler.with_mean,
+            'with_std': scaler.with_std,
+            'n_features_in': int(scaler.n_features_in_),
+            'mean': _to_json(scaler.mean_),
+            'scale': _to_json(scaler.scale_),
+            'var': _to_json(scaler.var_),
+            'n_samples_seen': _to_json(scaler.n_samples_seen_),
+        }
+    # Anything else is kept as an estimator file next to the model
+    joblib.dump(scaler, os.path.join(path, SCALER_FILE), compress=0)
+    return {'type': 'joblib', 'file': SCALER_FILE}
+
+
+def _decode_scaler(spec, path):
+    if spec is None:
+        return None
+    if spec['type'] == 'joblib':
+        return joblib.load(os.path.join(path, spec['file']), mmap_mode='r')
+    scaler = StandardScaler(with_mean=spec['with_mean'], with_std=spec['with_std'])
+    scaler.n_features_in_ = spec['n_features_in']
+    for attribute in ('mean', 'scale', 'var'):
+        value = spec[attribute]
+        setattr(scaler, f'{attribute}_', None if value is None else np.asarray(value, dtype=np.float64))
+    scaler.n_samples_seen_ = np.asarray(spec['n_samples_seen'])
+    return scaler
+
+
+class LazyEstimator:
+    """Stands in for a bundle's estimator and loads it on first use
+
+    classes_ and n_features_in_ come from the manifest, so a bundle served
+    by its compiled engine never unpickles the estimator.
+    """
+
+    def __init__(self, path, classes, n_features_in):
+        self.path = path
+        self.classes_ = classes
+        self.n_features_in_ = n_features_in
+        self._estimator = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._estimator is not None
+
+    def load(self):
+        with self._lock:
+            if self._estimator is None:
+                self._estimator = joblib.load(self.path, mmap_mode='r')
+                logger.info("Loaded estimator %s on first use", self.path)
+        return self._estimator
+
+    def predict_proba(self, X):
+        return self.load().predict_proba(X)
+
+    def predict(self, X):
+        return self.load().predict(X)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set above
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+def _encode_engine(model, scaler, path):
+    engine = compile_model(model, scaler)
+    if engine is None:
+        return None
+    spec, arrays = engine_state(engine)
+    spec['arrays'] = {}
+    for name, array in arrays.items():
+        filename = f'engine.{name}.npy'
+        np.save(os.path.join(path, filename), np.ascontiguousarray(array))
+        spec['arrays'][name] = filename
+    spec['classes'] = _to_json(model.classes_)
+    spec['n_features_in'] = int(model.n_features_in_)
+    return spec
+
+
+def _decode_classes(values):
+    classes = np.asarray(values)
+    # scikit-learn keeps string labels in an object array
+    return classes.astype(object) if classes.dtype.kind == 'U' else classes
+
+
+def _decode_encoder(classes):
+    encoder = LabelEncoder()
+    encoder.classes_ = np.asarray(classes)
+    return encoder
+
+
+def save_bundle(path, model, scaler=None, label_encoders=None, feature_names=None):
+    """Write a model and its preprocessing state as a bundle directory"""
+    staging = f'{path}.tmp-{os.getpid()}'
+    os.makedirs(staging, exist_ok=False)
+
+    joblib.dump(model, os.path.join(staging, MODEL_FILE), compress=0)
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'model_file': MODEL_FILE,
+        'model_type': f'{type(model).__module__}.{type(model).__name__}',
+        'feature_names': list(feature_names or []),
+        'label_encoders': {
+            column: _to_json(encoder.classes_)
+            for column, encoder in (label_encoders or {}).items()
+        },
+        'scaler': _encode_scaler(scaler, staging),
+        'engine': _encode_engine(model, scaler, staging),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished directory in so readers never see a partial bundle
+    if os.path.exists(path):
+        previous = f'{path}.old-{os.getpid()}'
+        os.rename(path, previous)
+        os.rename(staging, path)
+        for name in os.listdir(previous):
+            os.remove(os.path.join(previous, name))
+        os.rmdir(previous)
+    else:
+        os.rename(staging, path)
+
+
+def load_bundle(path):
+    """Open a bundle directory, returning the same dict shape as a saved pickle"""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle format: {manifest.get('format_version')}")
+
+    model_path = os.path.join(path, manifest['model_file'])
+    spec = manifest.get('engine')
+    engine = None
+    if spec is not None:
+        arrays = {name: np.load(os.path.join(path, filename), mmap_mode='r')
+                  for name, filename in spec['arrays'].items()}
+        classes = _decode_classes(spec['classes'])
+        engine = engine_from_state(spec, arrays, classes)
+        model = LazyEstimator(model_path, classes, spec['n_features_in'])
+    else:
+        model = joblib.load(model_path, mmap_mode='r')
+
+    return {
+        'model': model,
+        'engine': engine,
+        'scaler': _decode_scaler(manifest.get('scaler'), path),
+        'label_encoders': {
+            column: _decode_encoder(classes)
+            for column, classes in manifest.get('label_encoders', {}).items()
+        },
+        'feature_names': manifest.get('feature_names') or None,
+    }
+
+
+def convert_pickle(pickle_path, bundle_path=None):
+    """Convert a save_model pickle (or a bare pickled estimator) into a bundle"""
+    if bundle_path is None:
+        bundle_path = os.path.splitext(pickle_path)[0] + BUNDLE_SUFFIX
+    with open(pickle_path, 'rb') as f:
+        model_data = pickle.load(f)
+    if not isinstance(model_data, dict):
+        model_data = {'model': model_data}
+    save_bundle(
+        bundle_path,
+        model_data.get('model'),
+        scaler=model_data.get('scaler'),
+        label_encoders=model_data.get('label_encoders'),
+        feature_names=model_data.get('feature_names')
+    )
+    return bundle_path
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        print('usage: python artifact.py MODEL.pkl [MODEL.pkl ...]', file=sys.stderr)
+        return 2
+    for pickle_path in paths:
+        logger.info("Converted %s -> %s", pickle_path, convert_pickle(pickle_path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
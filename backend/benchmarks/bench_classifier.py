@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks for the classifier hot paths.
+
+Builds synthetic LogisticRegression+StandardScaler, RandomForest and
+GradientBoosting bundles in a temporary directory and measures, per model:
+load_model time, single-record latency, batch throughput at several batch
+sizes and peak traced memory of the largest batch. The result cache is
+disabled so that every call reaches the model, except for one case that
+scores a large batch of mostly one-off rows with the cache on and off: the
+cache must not make batch scoring slower.
+
+    python benchmarks/bench_classifier.py --output results.json
+    python benchmarks/bench_classifier.py --baseline results.json --threshold 0.2
+
+With --baseline the run exits with status 1 if any metric is worse than the
+baseline by more than the threshold (a fraction, 0.2 = 20%).
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import MODEL_KINDS, build_models, make_frame, make_records
+
+from cache import DEFAULT_MAX_ENTRIES
+from classifier import AviationClassifier
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+
+# Metrics are compared by suffix: lower is better unless listed here
+HIGHER_IS_BETTER = ('rows_per_s',)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(int(round(q / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def bench_load(classifier, name, repeat):
+    timings = []
+    for _ in range(repeat):
+        classifier.registry.clear()
+        start = time.perf_counter()
+        if not classifier.load_model(name):
+            raise RuntimeError(f'Could not load {name}')
+        timings.append(time.perf_counter() - start)
+    return {'load_model.median_ms': statistics.median(timings) * 1e3}
+
+
+def bench_single(classifier, name, records, repeat):
+    for record in records[:20]:
+        classifier.predict(record, name)
+    timings = []
+    for i in range(repeat):
+        record = records[i % len(records)]
+        start = time.perf_counter()
+        result = classifier.predict(record, name)
+        timings.append(time.perf_counter() - start)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+    return {
+        'single.p50_us': percentile(timings, 50) * 1e6,
+        'single.p95_us': percentile(timings, 95) * 1e6,
+        'single.p99_us': percentile(timings, 99) * 1e6,
+    }
+
+
+def bench_batch(classifier, name, frame, sizes, min_rows, max_rounds):
+    metrics = {}
+    for size in sizes:
+        chunk = frame.head(size)
+        classifier.predict_batch(chunk, name)
+        rounds = min(max(1, min_rows // size), max_rounds)
+        # Best of three passes, to keep scheduler noise out of the comparison
+        elapsed = float('inf')
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                classifier.predict_batch(chunk, name)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        metrics[f'batch_{size}.rows_per_s'] = rounds * size / elapsed
+    return metrics
+
+
+def bench_memory(classifier, name, frame):
+    tracemalloc.start()
+    try:
+        classifier.predict_batch(frame, name)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {f'batch_{len(frame)}.peak_bytes': peak}
+
+
+def bench_cache(classifier, name, frame):
+    """Time a batch with the result cache on against off; the ratio should stay near 1"""
+    cache = classifier.result_cache
+    timings = {}
+    try:
+        for max_entries in (0, DEFAULT_MAX_ENTRIES):
+            cache.max_entries = max_entries
+            elapsed = float('inf')
+            for _ in range(3):
+                cache.clear()
+                start = time.perf_counter()
+                classifier.predict_batch(frame, name)
+                elapsed = min(elapsed, time.perf_counter() - start)
+            timings[max_entries] = elapsed
+    finally:
+        cache.max_entries = 0
+        cache.clear()
+    return {f'batch_{len(frame)}.cache_slowdown': timings[DEFAULT_MAX_ENTRIES] / timings[0]}
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as models_directory:
+        names = build_models(models_directory, kinds=args.models, n_estimators=args.n_estimators,
+                             format=args.format)
+        classifier = AviationClassifier(models_directory=models_directory, load_default=False)
+        classifier.result_cache.max_entries = 0
+
+        frame = make_frame(max(args.batch_sizes), unseen_fraction=0.05, seed=1)
+        records = make_records(1000, unseen_fraction=0.05, seed=2)
+        cache_frame = make_frame(args.cache_rows, unseen_fraction=0.05, seed=3)
+
+        metrics = {}
+        for name in names:
+            model_metrics = {}
+            model_metrics.update(bench_load(classifier, name, args.load_repeat))
+            model_metrics.update(bench_single(classifier, name, records, args.repeat))
+            model_metrics.update(bench_batch(classifier, name, frame, args.batch_sizes,
+                                             args.min_rows, args.max_rounds))
+            model_metrics.update(bench_memory(classifier, name, frame))
+            model_metrics.update(bench_cache(classifier, name, cache_frame))
+            for key, value in model_metrics.items():
+                metrics[f'{name}.{key}'] = value
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+            'n_estimators': args.n_estimators,
+            'format': args.format,
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(metrics, baseline, threshold, higher_is_better=HIGHER_IS_BETTER):
+    """Return a list of human-readable regressions against a baseline"""
+    regressions = []
+    for key, old in sorted(baseline.items()):
+        new = metrics.get(key)
+        if new is None or not old:
+            continue
+        if key.endswith(higher_is_better):
+            change = (old - new) / old
+        else:
+            change = (new - old) / old
+        if change > threshold:
+            regressions.append(f'{key}: {old:.4g} -> {new:.4g} ({change:+.1%} worse)')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the classifier hot paths on synthetic models')
+    parser.add_argument('--output', help='write results as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results from a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative slowdown before a metric counts as a regression')
+    parser.add_argument('--models', nargs='+', choices=MODEL_KINDS, default=list(MODEL_KINDS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=list(BATCH_SIZES))
+    parser.add_argument('--repeat', type=int, default=500, help='single-record calls per model')
+    parser.add_argument('--load-repeat', type=int, default=5, help='load_model calls per model')
+    parser.add_argument('--min-rows', type=int, default=20000, help='rows scored per batch size')
+    parser.add_argument('--max-rounds', type=int, default=200, help='cap on calls per batch size')
+    parser.add_argument('--cache-rows', type=int, default=80000,
+                        help='rows in the batch scored with the result cache on and off')
+    parser.add_argument('--format', choices=('pickle', 'bundle'), default='pickle',
+                        help='save the synthetic models as pickles or memory-mappable bundles')
+    parser.add_argument('--n-estimators', type=int, default=100, help='trees in the ensemble models')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+        regressions = compare(results['metrics'], baseline, args.threshold)
+        if regressions:
+            print('Performance regressions beyond threshold:', file=sys.stderr)
+            for line in regressions:
+                print(f'  {line}', file=sys.stderr)
+            return 1
+        print(f'No regressions beyond {args.threshold:.0%} against {args.baseline}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""
+Load test for the API, optionally behind the reverse proxy.
+
+Trains small synthetic models into a temporary directory, starts the
+backend (server.py, or the werkzeug dev server with --server werkzeug) on a
+free local port, optionally starts reverseProxy.py in front of it, and then
+replays a weighted mix of /api/predict, /api/batch-predict, /api/models and
+/api/features requests. Nothing outside this machine is needed.
+
+Load is applied in steps, either closed-loop (--concurrency: N clients that
+each send the next request as soon as the previous one finished) or
+open-loop (--rate: requests started at a fixed rate whatever the response
+times; latency is measured from the scheduled start so a stalled server
+is not hidden). Each step reports throughput, error rate and p50/p95/p99
+latency overall and per endpoint. Server memory (RSS of each server process
+and its workers) is sampled throughout.
+
+    python benchmarks/load_test.py --concurrency 1 8 32 --duration 10
+    python benchmarks/load_test.py --proxy --rate 50 100 200 --output load.json
+    python benchmarks/load_test.py --baseline load.json --threshold 0.2
+
+With --baseline the run exits with status 1 if throughput or p99 latency
+of any step is worse than the baseline by more than the threshold.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_classifier import compare, percentile
+from synthetic import MODEL_KINDS, build_models, make_frame, make_records
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {'predict': 70, 'batch': 5, 'models': 15, 'features': 10}
+
+# Step metrics are compared by suffix: lower is better unless listed here
+HIGHER_IS_BETTER = ('throughput_rps',)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid):
+    """Resident memory of a process and its direct children (forked workers)"""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class Server:
+    """A server subprocess on a free local port"""
+
+    def __init__(self, role, app, args, env, cwd, health_path):
+        self.role = role
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.health_path = health_path
+        if args.server == 'werkzeug':
+            module, attribute = app.split(':')
+            command = [sys.executable, '-c',
+                       f'from {module} import {attribute} as app; '
+                       f'app.run(host="127.0.0.1", port={self.port}, threaded=True)']
+        else:
+            command = [sys.executable, os.path.join(BACKEND, 'server.py'), '--app', app,
+                       '--host', '127.0.0.1', '--port', str(self.port),
+                       '--processes', str(args.processes), '--threads', str(args.threads)]
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, cwd=cwd, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if requests.get(self.url + self.health_path, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        self.log.seek(0)
+        output = self.log.read().decode(errors='replace')[-2000:]
+        raise RuntimeError(f'{self.role} did not become ready:\n{output}')
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+
+class MemorySampler:
+    def __init__(self, servers, interval):
+        self.servers = servers
+        self.interval = interval
+        self.samples = {server.role: [] for server in servers}
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            offset = round(time.monotonic() - self._start, 3)
+            for server in self.servers:
+                self.samples[server.role].append({'t': offset, 'rss_bytes': rss_bytes(server.process.pid)})
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {role: {'peak_bytes': max((s['rss_bytes'] for s in samples), default=0), 'samples': samples}
+                for role, samples in self.samples.items()}
+
+
+class Traffic:
+    """Builds the requests of the configured endpoint mix"""
+
+    def __init__(self, base_url, mix, batch_rows, seed=0):
+        self.base_url = base_url
+        self.endpoints = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.endpoints]
+        self.records = make_records(1000, unseen_fraction=0.05, seed=seed)
+        self.batch_csv = make_frame(batch_rows, unseen_fraction=0.05, seed=seed + 1).to_csv(index=False).encode()
+
+    def send(self, session, rng):
+        endpoint = rng.choices(self.endpoints, self.weights)[0]
+        if endpoint == 'predict':
+            response = session.post(f'{self.base_url}/api/predict', json=rng.choice(self.records))
+        elif endpoint == 'batch':
+            response = session.post(f'{self.base_url}/api/batch-predict?format=csv',
+                                    files={'file': ('batch.csv', io.BytesIO(self.batch_csv), 'text/csv')})
+        elif endpoint == 'models':
+            response = session.get(f'{self.base_url}/api/models')
+        else:
+            response = session.get(f'{self.base_url}/api/features')
+        # Read the whole body so the connection is reused and the timing is complete
+        response.content
+        return endpoint, response.status_code
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def add(self, endpoint, status, seconds):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self, elapsed):
+        def describe(latencies, statuses):
+            count = len(latencies)
+            errors = sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400))
+            result = {
+                'requests': count,
+                'throughput_rps': count / elapsed if elapsed else 0.0,
+                'errors': errors,
+                'error_rate': errors / count if count else 0.0,
+                'status_counts': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+            }
+            if latencies:
+                result.update({
+                    'p50_ms': percentile(latencies, 50) * 1e3,
+                    'p95_ms': percentile(latencies, 95) * 1e3,
+                    'p99_ms': percentile(latencies, 99) * 1e3,
+                    'max_ms': max(latencies) * 1e3,
+                    'mean_ms': sum(latencies) / count * 1e3,
+                })
+            return result
+
+        every_latency = [seconds for values in self.latencies.values() for seconds in values]
+        every_status = Counter()
+        for statuses in self.statuses.values():
+            every_status.update(statuses)
+        summary = describe(every_latency, every_status)
+        summary['endpoints'] = {endpoint: describe(self.latencies[endpoint], self.statuses[endpoint])
+                                for endpoint in sorted(self.latencies)}
+        return summary
+
+
+def timed_send(traffic, session, rng, recorder, started):
+    try:
+        endpoint, status = traffic.send(session, rng)
+    except requests.RequestException as e:
+        endpoint, status = 'connection', type(e).__name__
+    recorder.add(endpoint, status, time.perf_counter() - started)
+
+
+def run_concurrency(traffic, clients, duration, timeout, seed):
+    """Closed loop: ``clients`` threads each send requests back to back"""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        with requests.Session() as session:
+            session.request = _with_timeout(session.request, timeout)
+            while time.perf_counter() < deadline:
+                timed_send(traffic, session, rng, recorder, time.perf_counter())
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - start)
+
+
+def run_rate(traffic, rate, duration, timeout, max_clients, seed):
+    """Open loop: start ``rate`` requests per second, timing each from its scheduled start"""
+    recorder = Recorder()
+    local = threading.local()
+    rng = random.Random(seed)
+
+    def send(scheduled, request_seed):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.request = _with_timeout(local.session.request, timeout)
+        timed_send(traffic, local.session, random.Random(request_seed), recorder, scheduled)
+
+    total = int(rate * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_clients) as pool:
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scheduled, rng.getrandbits(32))
+    return recorder.summary(time.perf_counter() - start)
+
+
+def _with_timeout(request, timeout):
+    def send(method, url, **kwargs):
+        kwargs.setdefault('timeout', timeout)
+        return request(method, url, **kwargs)
+    return send
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {name!r}, expected one of {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        models_directory = os.path.join(workdir, 'models')
+        build_models(models_directory, kinds=args.models, n_estimators=args.n_estimators)
+
+        env = dict(os.environ, PYTHONPATH=BACKEND, JOBS_DIRECTORY=os.path.join(workdir, 'jobs'),
+                   LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'))
+        servers = []
+        try:
+            backend = Server('backend', 'app:app', args, env, workdir, '/api/ready')
+            servers.append(backend)
+            backend.wait_ready(args.startup_timeout)
+            target = backend
+            if args.proxy:
+                proxy_env = dict(env, FLASK_API_URL=backend.url)
+                target = Server('proxy', 'reverseProxy:app', args, proxy_env, workdir, '/health')
+                servers.append(target)
+                target.wait_ready(args.startup_timeout)
+
+            traffic = Traffic(target.url, args.mix, args.batch_rows)
+            if args.warmup:
+                run_concurrency(traffic, 1, args.warmup, args.timeout, args.seed)
+
+            sampler = MemorySampler(servers, args.sample_interval).start()
+            steps = []
+            if args.rate:
+                for rate in args.rate:
+                    summary = run_rate(traffic, rate, args.duration, args.timeout, args.max_clients, args.seed)
+                    steps.append(dict({'mode': 'rate', 'level': rate}, **summary))
+            else:
+                for clients in args.concurrency:
+                    summary = run_concurrency(traffic, clients, args.duration, args.timeout, args.seed)
+                    steps.append(dict({'mode': 'concurrency', 'level': clients}, **summary))
+            memory = sampler.stop()
+        finally:
+            for server in reversed(servers):
+                server.stop()
+
+    metrics = {}
+    for step in steps:
+        prefix = f"{'c' if step['mode'] == 'concurrency' else 'r'}{step['level']:g}"
+        metrics[f'{prefix}.throughput_rps'] = step['throughput_rps']
+        if 'p99_ms' in step:
+            metrics[f'{prefix}.p99_ms'] = step['p99_ms']
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'server': args.server,
+            'processes': args.processes,
+            'threads': args.threads,
+            'proxy': args.proxy,
+            'models': args.models,
+            'mix': args.mix,
+            'duration_s': args.duration,
+            'batch_rows': args.batch_rows,
+        },
+        'steps': steps,
+        'memory': memory,
+        'metrics': metrics,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the API on synthetic models')
+    parser.add_argument('--output', help='write the report as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', help='report from a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative slowdown before a step counts as a regression')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32],
+                      help='closed-loop client counts, one step each')
+    load.add_argument('--rate', nargs='+', type=float, help='open-loop request rates per second, one step each')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of single-client traffic first')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='endpoint weights, e.g. predict=70,batch=5,models=15,features=10')
+    parser.add_argument('--batch-rows', type=int, default=1000, help='rows per batch-predict upload')
+    parser.add_argument('--proxy', action='store_true', help='send the traffic through reverseProxy.py')
+    parser.add_argument('--server', choices=['async', 'werkzeug'], default='async',
+                        help='serve with server.py or the werkzeug development server')
+    parser.add_argument('--processes', type=int, default=1, help='server.py worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='server.py inference threads per process')
+    parser.add_argument('--models', nargs='+', choices=MODEL_KINDS, default=['random_forest'],
+                        help='synthetic models to train; the first one is the default')
+    parser.add_argument('--n-estimators', type=int, default=50, help='trees in the ensemble models')
+    parser.add_argument('--max-clients', type=int, default=256, help='concurrent requests cap in --rate mode')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='seconds between memory samples')
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+        regressions = compare(report['metrics'], baseline, args.threshold, HIGHER_IS_BETTER)
+        if regressions:
+            print('Load regressions beyond threshold:', file=sys.stderr)
+            for line in regressions:
+                print(f'  {line}', file=sys.stderr)
+            return 1
+        print(f'No regressions beyond {args.threshold:.0%} against {args.baseline}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Synthetic models and data for benchmarks and load tests.
+
+Everything is generated offline from a fixed seed: categorical columns are
+drawn from small per-feature vocabularies, numeric columns from small
+integer ranges, and the label depends on a few of them so that the models
+have something to learn. Models are written in the same dict format as
+AviationClassifier.save_model so they load through the normal path.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import AviationClassifier, NUMERIC_FEATURES  # noqa: E402
+
+CATEGORICAL_FEATURES = [
+    'Investigation.Type', 'Location', 'Country', 'Injury.Severity',
+    'Aircraft.Category', 'Make', 'Amateur.Built', 'Engine.Type',
+    'Purpose.of.flight', 'Weather.Condition', 'Broad.phase.of.flight'
+]
+NUMERIC_COLUMNS = [
+    'Number.of.Engines', 'Total.Fatal.Injuries', 'Total.Serious.Injuries',
+    'Total.Minor.Injuries', 'Total.Uninjured'
+]
+FEATURES = CATEGORICAL_FEATURES + NUMERIC_COLUMNS
+
+VOCABULARIES = {
+    'Investigation.Type': ['Accident', 'Incident'],
+    'Location': [f'City {i}, ST' for i in range(60)],
+    'Country': ['United States', 'Canada', 'Mexico', 'Brazil', 'United Kingdom'],
+    'Injury.Severity': ['Fatal', 'Non-Fatal', 'Incident', 'Minor', 'Serious'],
+    'Aircraft.Category': ['Airplane', 'Helicopter', 'Glider', 'Balloon'],
+    'Make': ['Cessna', 'Piper', 'Beech', 'Boeing', 'Bell', 'Mooney', 'Cirrus', 'Airbus'],
+    'Amateur.Built': ['No', 'Yes'],
+    'Engine.Type': ['Reciprocating', 'Turbo Fan', 'Turbo Shaft', 'Turbo Prop', 'Unknown'],
+    'Purpose.of.flight': ['Personal', 'Instructional', 'Business', 'Aerial Application', 'Unknown'],
+    'Weather.Condition': ['VMC', 'IMC', 'UNK'],
+    'Broad.phase.of.flight': ['Landing', 'Takeoff', 'Cruise', 'Maneuvering', 'Approach', 'Taxi'],
+}
+LABELS = np.array(['Minor', 'Substantial', 'Destroyed'])
+
+MODEL_KINDS = ('logreg', 'random_forest', 'gradient_boosting')
+
+
+def make_frame(n_rows, unseen_fraction=0.0, seed=0):
+    """Raw input rows with every expected categorical and numeric column
+
+    ``unseen_fraction`` of the categorical cells are replaced by values that
+    are not in any encoder, to exercise the unknown-category path.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for feature in CATEGORICAL_FEATURES:
+        values = rng.choice(VOCABULARIES[feature], n_rows).astype(object)
+        if unseen_fraction:
+            unseen = rng.random(n_rows) < unseen_fraction
+            values[unseen] = [f'Unseen {feature} {i}' for i in range(int(unseen.sum()))]
+        data[feature] = values
+    for feature in NUMERIC_COLUMNS:
+        data[feature] = rng.integers(0, 5, n_rows)
+    return pd.DataFrame(data)
+
+
+def make_records(n_records, unseen_fraction=0.0, seed=0):
+    """Same as make_frame, as a list of request dicts"""
+    return make_frame(n_records, unseen_fraction, seed).to_dict('records')
+
+
+def make_labels(frame):
+    score = (
+        (frame['Weather.Condition'] == 'IMC').astype(int)
+        + (frame['Total.Fatal.Injuries'] > 2).astype(int) * 2
+        + frame['Make'].isin(['Boeing', 'Airbus']).astype(int)
+    )
+    return LABELS[np.clip(score.to_numpy(), 0, 2)]
+
+
+def fit_encoders(frame):
+    return {feature: LabelEncoder().fit(frame[feature].astype(str)) for feature in CATEGORICAL_FEATURES}
+
+
+def encode(frame, encoders):
+    matrix = np.empty((len(frame), len(FEATURES)), dtype=np.float64)
+    for i, feature in enumerate(FEATURES):
+        if feature in NUMERIC_FEATURES:
+            matrix[:, i] = frame[feature].to_numpy(dtype=np.float64)
+        else:
+            matrix[:, i] = encoders[feature].transform(frame[feature].astype(str))
+    return matrix
+
+
+def build_model(kind, X, y, n_estimators=100):
+    """Fit one synthetic model, returning (model, scaler)"""
+    if kind == 'logreg':
+        scaler = StandardScaler().fit(X)
+        return LogisticRegression(max_iter=1000).fit(scaler.transform(X), y), scaler
+    if kind == 'random_forest':
+        return RandomForestClassifier(n_estimators=n_estimators, random_state=0, n_jobs=1).fit(X, y), None
+    if kind == 'gradient_boosting':
+        return GradientBoostingClassifier(n_estimators=n_estimators, max_depth=3, random_state=0).fit(X, y), None
+    raise ValueError(f'Unknown model kind: {kind}')
+
+
+def build_models(directory, kinds=MODEL_KINDS, n_train=5000, n_estimators=100, seed=0, format='pickle'):
+    """Train synthetic models and save them into ``directory`` as pickles or bundles
+
+    Returns the list of model names written.
+    """
+    frame = make_frame(n_train, seed=seed)
+    encoders = fit_encoders(frame)
+    X = encode(frame, encoders)
+    y = make_labels(frame)
+
+    saver = AviationClassifier(models_directory=directory, load_default=False)
+
+    names = []
+    for kind in kinds:
+        model, scaler = build_model(kind, X, y, n_estimators)
+        name = f'synthetic_{kind}'
+        if not saver.save_model(name, model, scaler=scaler, label_encoders=encoders,
+                               feature_names=FEATURES, format=format):
+            raise RuntimeError(f'Could not save synthetic model {name}')
+        names.append(name)
+    return names
@@ -0,0 +1,100 @@
+"""
+Bounded LRU cache of prediction results.
+
+Keys are built from the model name, the fingerprint of the model file and
+the encoded feature row (after defaults are filled in), so the same input
+for the same model version is only scored once, and a switched or reloaded
+model never serves stale results.
+
+Only small requests go through the cache: looking rows up one at a time
+costs more than scoring a large batch, and a batch of one-off rows would
+flush the entries that repeated small requests hit.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_SIZE', 10000))
+DEFAULT_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL', 300))
+# Requests with more distinct rows than this are scored without the cache
+DEFAULT_MAX_ROWS = int(os.environ.get('RESULT_CACHE_MAX_ROWS', 100))
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_rows=DEFAULT_MAX_ROWS):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def accepts(self, n_rows):
+        """Whether a request with ``n_rows`` distinct rows should use the cache"""
+        return self.enabled and n_rows <= min(self.max_rows, self.max_entries)
+
+    @staticmethod
+    def make_key(bundle, row):
+        """Cache key for one encoded (unscaled) feature row"""
+        return (bundle.name, bundle.fingerprint, row.tobytes())
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_model(self, name, keep_fingerprint=None):
+        """Drop results for ``name`` except those of the given file version"""
+        with self._lock:
+            stale = [key for key in self._entries
+                     if key[0] == name and key[1] != keep_fingerprint]
+            for key in stale:
+                del self._entries[key]
+
+    def reset_locks(self):
+        """Fresh lock for a forked child; another thread may have held it at fork time"""
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'max_rows': self.max_rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -1,18 +1,221 @@
+import copy
 import pickle
+import logging
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder, StandardScaler
 import os
 import glob
+import hashlib
+import threading
+import time
+from encoding import compile_encoders, UNENCODED
+from registry import ModelRegistry, UnknownModelError
+from cache import ResultCache
+from metrics import timed, ROWS_PREDICTED, current_endpoint
+from compiled import compile_model, compile_scaler
+from artifact import BUNDLE_SUFFIX, LazyEstimator, is_bundle, bundle_fingerprint, bundle_size, load_bundle, save_bundle
+
+logger = logging.getLogger(__name__)
+
+# Set COMPILE_MODELS=0 to always score with the original estimators
+COMPILE_MODELS = os.environ.get('COMPILE_MODELS', '1') != '0'
+
+# The default model chosen with switch_model is shared through this file by
+# every process serving the API (server.py sets it for --processes > 1)
+DEFAULT_MODEL_FILE = os.environ.get('DEFAULT_MODEL_FILE') or None
+
+# A models-directory listing is reused while the directory's mtime is
+# unchanged, once the directory has been quiet for this long: a change within
+# the same tick of a coarse filesystem clock would not move the mtime
+LISTING_SETTLE_NS = 2 * 10**9
+
+# Numeric features are coerced to numbers with missing values as 0, every
+# other feature is treated as a categorical string
+NUMERIC_FEATURES = frozenset([
+    'Number.of.Engines', 'Total.Fatal.Injuries', 'Total.Serious.Injuries',
+    'Total.Minor.Injuries', 'Total.Uninjured'
+])
+
+
+def is_valid_model_name(model_name):
+    """Whether a requested model name can only refer to a file inside the models directory
+
+    Hidden names are refused as well, as get_available_models never lists them.
+    """
+    return (isinstance(model_name, str) and model_name != '' and not model_name.startswith('.')
+            and '..' not in model_name and os.sep not in model_name
+            and (os.altsep is None or os.altsep not in model_name))
+
+
+def unique_rows(matrix):
+    """Distinct rows of a matrix, and for every row the index of its distinct row
+
+    Rows are hashed and the hashes factorized, which is several times
+    faster than np.unique(axis=0). A hash collision shows up when the rows
+    are rebuilt from the result, and falls back to np.unique.
+    """
+    if len(matrix) == 1:
+        return matrix, np.zeros(1, dtype=np.intp)
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(matrix), index=False).to_numpy()
+    inverse, distinct = pd.factorize(hashes)
+    first = np.empty(len(distinct), dtype=np.intp)
+    first[inverse] = np.arange(len(matrix))
+    rows = matrix[first]
+    if not np.array_equal(rows[inverse], matrix):
+        rows, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    return rows, inverse.reshape(-1)
+
+
+class ModelBundle:
+    """A loaded model together with the preprocessing state it was trained with
+
+    A bundle is a snapshot: it is fully built before it is published and is
+    never changed afterwards, so a request that took a reference to it keeps
+    a consistent model, scaler, encoders, feature list and compiled engine
+    until it finishes. If the engine fails, on_engine_failure(bundle) is
+    called so the owner can swap in a copy made with without_engine().
+    """
+
+    def __init__(self, name, model, scaler, label_encoders, feature_names, size_bytes=0, fingerprint=None,
+                 engine=None, on_engine_failure=None):
+        self.name = name
+        self.fingerprint = fingerprint
+        self.model = model
+        self.scaler = scaler
+        self.label_encoders = label_encoders
+        self.encoding_tables = compile_encoders(label_encoders)
+        self.feature_names = feature_names
+        self.size_bytes = size_bytes
+        # Set once validate() has run sample predictions through this bundle
+        self.warmed = False
+
+        # Per-feature encoding plan for the single-record fast path
+        self.record_plan = tuple(
+            (feature, None if feature in NUMERIC_FEATURES else self.encoding_tables.get(feature, UNENCODED))
+            for feature in feature_names
+        )
+        # Identifies the encoded input layout: bundles with equal layouts
+        # can share one encoded matrix
+        digest = hashlib.sha1()
+        for feature, table in self.record_plan:
+            digest.update(repr((feature, None if table is None else (table.classes, table.unknown_code))).encode())
+        self.layout = digest.hexdigest()
+
+        # StandardScaler folded into one multiply-add, checked against
+        # scaler.transform; None keeps using the scaler itself
+        fused = compile_scaler(scaler, len(feature_names)) if scaler is not None else None
+        self.scale_factor, self.scale_offset = fused if fused is not None else (None, None)
+
+        self.classes = getattr(model, 'classes_', None)
+        self.has_proba = hasattr(model, 'predict_proba') and self.classes is not None
+
+        # Array evaluator equivalent to model.predict_proba, or None. A bundle
+        # directory brings its own, already verified when it was saved.
+        if not (COMPILE_MODELS and self.has_proba):
+            engine = None
+        elif engine is None:
+            engine = compile_model(model, scaler, len(feature_names))
+        self.engine = engine
+        self.on_engine_failure = on_engine_failure
+
+    def without_engine(self):
+        """A copy of this bundle that scores with the original estimator"""
+        bundle = copy.copy(self)
+        bundle.engine = None
+        return bundle
+
+    def encode_record(self, record):
+        """Encode one input dict straight into a (1, n_features) float row"""
+        row = np.empty((1, len(self.record_plan)), dtype=np.float64)
+        values = row[0]
+        for i, (feature, table) in enumerate(self.record_plan):
+            value = record.get(feature)
+            if table is None:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    number = 0.0
+                values[i] = 0.0 if number != number else number
+            else:
+                missing = value is None or (isinstance(value, float) and value != value)
+                values[i] = table.encode_value('Unknown' if missing else str(value))
+        return row
+
+    def transform(self, matrix):
+        """Apply the model's scaler to an encoded matrix, unless the compiled engine applies it"""
+        engine = self.engine
+        if engine is not None and engine.fuses_scaler:
+            return matrix
+        return self._scale(matrix)
+
+    def _scale(self, matrix):
+        if self.scale_factor is not None:
+            return matrix * self.scale_factor + self.scale_offset
+        if self.scaler:
+            return self.scaler.transform(matrix)
+        return matrix
+
+    def _predict_proba(self, matrix):
+        engine = self.engine
+        # Above max_rows the estimator is faster, but only worth it when it is
+        # already in memory: a bundle's estimator is never unpickled for speed
+        if engine is not None and (engine.max_rows is None or len(matrix) <= engine.max_rows
+                                   or (isinstance(self.model, LazyEstimator) and not self.model.loaded)):
+            try:
+                return engine.predict_proba(matrix)
+            except Exception as engine_error:
+                logger.warning("Compiled evaluator failed, using the original model: %s", engine_error)
+                if self.on_engine_failure is not None:
+                    self.on_engine_failure(self)
+                # transform() left the scaling to this engine, so apply it here
+                if engine.fuses_scaler:
+                    matrix = self._scale(matrix)
+        return self.model.predict_proba(matrix)
+
+    def proba(self, matrix):
+        """Class probabilities for a preprocessed matrix, or None if the model has none"""
+        if self.has_proba:
+            try:
+                with timed('predict_proba', self.name):
+                    return self._predict_proba(matrix)
+            except Exception as prob_error:
+                logger.warning("Could not get prediction probabilities: %s", prob_error)
+        return None
+
+    def infer(self, matrix):
+        """Return (labels, confidences) for a preprocessed matrix
+
+        Labels are taken from the arg-max of a single predict_proba call
+        rather than running predict and predict_proba separately.
+        """
+        proba = self.proba(matrix)
+        if proba is not None:
+            best = proba.argmax(axis=1)
+            labels = np.asarray(self.classes)[best]
+            return labels, proba[np.arange(len(best)), best] * 100
+
+        with timed('predict', self.name):
+            labels = np.asarray(self.model.predict(matrix))
+        return labels, np.zeros(len(labels))
+
 
 class AviationClassifier:
-    def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.label_encoders = {}
-        self.feature_names = []
-        self.current_model_name = None
-        self.models_directory = "models"
+    def __init__(self, models_directory="models", load_default=True):
+        # The default model's snapshot. It is only ever replaced as a whole,
+        # with one reference assignment, never updated field by field.
+        self.bundle = None
+        self._publish_lock = threading.Lock()
+        self.default_model_file = DEFAULT_MODEL_FILE
+        # (inode, mtime) of the shared default file when it was last followed
+        self._shared_default_version = None
+        self._shared_default_name = None
+        self.models_directory = models_directory
+        # (directory, mtime, names) of the last settled listing
+        self._listing = None
+        self.registry = ModelRegistry(self.read_model, self.model_fingerprint)
+        self.result_cache = ResultCache()
+        # Optional parallel.ParallelScorer for large batches
+        self.parallel = None
         
         # Define the important features (matching frontend)
         self.important_features = [
@@ -39,182 +242,371 @@ class AviationClassifier:
             'FAR.Description'
         ]
         
-        self.load_default_model()
+        if load_default:
+            self.load_default_model()
+
+    # Read-only views of the default snapshot, kept for existing callers
+    @property
+    def current_model_name(self):
+        bundle = self.bundle
+        return bundle.name if bundle is not None else None
+
+    @property
+    def model(self):
+        bundle = self.bundle
+        return bundle.model if bundle is not None else None
+
+    @property
+    def scaler(self):
+        bundle = self.bundle
+        return bundle.scaler if bundle is not None else None
+
+    @property
+    def label_encoders(self):
+        bundle = self.bundle
+        return bundle.label_encoders if bundle is not None else {}
+
+    @property
+    def encoding_tables(self):
+        bundle = self.bundle
+        return bundle.encoding_tables if bundle is not None else {}
+
+    @property
+    def feature_names(self):
+        bundle = self.bundle
+        return bundle.feature_names if bundle is not None else []
 
     def load_default_model(self):
-        """Load the first available model as default"""
+        """Load the shared default model if there is one, else the first available model"""
         try:
+            if self.sync_default():
+                return
             available_models = self.get_available_models()
             if available_models:
                 self.load_model(available_models[0])
-                print(f"Loaded default model: {available_models[0]}")
+                logger.info("Loaded default model: %s", available_models[0])
             else:
-                print("No models found in the models directory")
+                logger.warning("No models found in the models directory")
         except Exception as e:
-            print(f"Error loading default model: {str(e)}")
+            logger.error("Error loading default model: %s", e)
 
     def get_available_models(self):
-        """Get list of available pickle models"""
+        """Get list of available pickle models and bundles
+
+        The directory is only listed again when its mtime changes, which
+        saving, replacing or removing a model always does.
+        """
         try:
-            if not os.path.exists(self.models_directory):
-                print(f"Models directory '{self.models_directory}' does not exist")
+            directory = self.models_directory
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                logger.warning("Models directory '%s' does not exist", directory)
                 return []
-            
-            model_files = glob.glob(os.path.join(self.models_directory, "*.pkl"))
+            listing = self._listing
+            if listing is not None and listing[:2] == (directory, mtime):
+                return list(listing[2])
+
+            model_files = glob.glob(os.path.join(directory, "*.pkl"))
             models = [os.path.basename(f).replace('.pkl', '') for f in model_files]
-            print(f"Found models: {models}")
+            for path in glob.glob(os.path.join(directory, f"*{BUNDLE_SUFFIX}")):
+                name = os.path.basename(path)[:-len(BUNDLE_SUFFIX)]
+                if is_bundle(path) and name not in models:
+                    models.append(name)
+            logger.debug("Found models: %s", models)
+            if time.time_ns() - mtime > LISTING_SETTLE_NS:
+                self._listing = (directory, mtime, tuple(models))
             return models
         except Exception as e:
-            print(f"Error getting available models: {str(e)}")
+            logger.error("Error getting available models: %s", e)
             return []
 
-    def load_model(self, model_name):
-        """Load a specific model from pickle file"""
+    def model_path(self, model_name):
+        """Path of a model: its bundle directory if there is one, else the pickle file
+
+        Raises ValueError for a name that could point outside the models
+        directory; names come straight from requests and files are unpickled.
+        """
+        if not is_valid_model_name(model_name):
+            raise ValueError(f'Invalid model name: {model_name!r}')
+        bundle_path = os.path.join(self.models_directory, f"{model_name}{BUNDLE_SUFFIX}")
+        if is_bundle(bundle_path):
+            return bundle_path
+        return os.path.join(self.models_directory, f"{model_name}.pkl")
+
+    def model_fingerprint(self, model_name):
+        """Identify the version of a model on disk, or None if it is missing"""
+        model_path = self.model_path(model_name)
         try:
-            model_path = os.path.join(self.models_directory, f"{model_name}.pkl")
-            
-            if not os.path.exists(model_path):
-                print(f"Model file not found: {model_path}")
-                return False
-
+            if os.path.isdir(model_path):
+                return bundle_fingerprint(model_path)
+            stat = os.stat(model_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read_model(self, model_name):
+        """Read a model pickle or bundle into a ModelBundle without touching the active model"""
+        model_path = self.model_path(model_name)
+        fingerprint = self.model_fingerprint(model_name)
+        if os.path.isdir(model_path):
+            model_data = load_bundle(model_path)
+            size_bytes = bundle_size(model_path)
+        else:
             with open(model_path, 'rb') as f:
                 model_data = pickle.load(f)
-            
-            if isinstance(model_data, dict):
-                self.model = model_data.get('model')
-                self.scaler = model_data.get('scaler')
-                self.label_encoders = model_data.get('label_encoders', {})
-                stored_features = model_data.get('feature_names', self.expected_features)
+            size_bytes = os.path.getsize(model_path)
+
+        engine = None
+        if isinstance(model_data, dict):
+            model = model_data.get('model')
+            engine = model_data.get('engine')
+            scaler = model_data.get('scaler')
+            label_encoders = model_data.get('label_encoders', {})
+            stored_features = model_data.get('feature_names') or self.expected_features
+        else:
+            model = model_data
+            scaler = None
+            label_encoders = {}
+            stored_features = self.expected_features
+
+        if hasattr(model, 'n_features_in_'):
+            expected_feature_count = model.n_features_in_
+            logger.debug("Model expects %d features", expected_feature_count)
+
+            if len(stored_features) >= expected_feature_count:
+                feature_names = stored_features[:expected_feature_count]
             else:
-                self.model = model_data
-                self.scaler = None
-                self.label_encoders = {}
-                stored_features = self.expected_features
-
-            if hasattr(self.model, 'n_features_in_'):
-                expected_feature_count = self.model.n_features_in_
-                print(f"Model expects {expected_feature_count} features")
-                
-                if len(stored_features) >= expected_feature_count:
-                    self.feature_names = stored_features[:expected_feature_count]
-                else:
-                    self.feature_names = stored_features + self.expected_features[:expected_feature_count - len(stored_features)]
-                    self.feature_names = self.feature_names[:expected_feature_count]
-            else:
-                self.feature_names = stored_features
+                feature_names = stored_features + self.expected_features[:expected_feature_count - len(stored_features)]
+                feature_names = feature_names[:expected_feature_count]
+        else:
+            feature_names = stored_features
+
+        return ModelBundle(
+            name=model_name,
+            model=model,
+            scaler=scaler,
+            label_encoders=label_encoders,
+            feature_names=list(feature_names),
+            size_bytes=size_bytes,
+            fingerprint=fingerprint,
+            engine=engine,
+            on_engine_failure=self.drop_engine
+        )
 
-            self.current_model_name = model_name
-            print(f"Successfully loaded model: {model_name}")
-            print(f"Model type: {type(self.model)}")
-            print(f"Feature count used: {len(self.feature_names)}")
-            print(f"Features: {self.feature_names}")
+    def load_model(self, model_name):
+        """Make a model the default for requests that do not name one"""
+        try:
+            try:
+                bundle = self.named_bundle(model_name)
+            except UnknownModelError:
+                logger.warning("Model not found: %s", model_name)
+                return False
+
+            self.publish(bundle)
+            logger.info("Successfully loaded model: %s (%s, %d features)",
+                        model_name, type(bundle.model).__name__, len(bundle.feature_names))
+            logger.debug("Features: %s", bundle.feature_names)
             return True
 
         except Exception as e:
-            print(f"Error loading model {model_name}: {str(e)}")
+            logger.error("Error loading model %s: %s", model_name, e)
+            return False
+
+    def switch_model(self, model_name):
+        """Make a model the default here and in every process sharing default_model_file"""
+        if not self.load_model(model_name):
+            return False
+        if self.default_model_file:
+            staging = f'{self.default_model_file}.{os.getpid()}.tmp'
+            with open(staging, 'w') as f:
+                f.write(model_name)
+            # A new inode every time, so other processes see each switch
+            os.replace(staging, self.default_model_file)
+            self._shared_default_version = self._default_file_version()
+            self._shared_default_name = model_name
+        return True
+
+    def _default_file_version(self):
+        try:
+            stat = os.stat(self.default_model_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def sync_default(self):
+        """Follow a default model switched by another process
+
+        Returns whether the shared default model is the one loaded here.
+        """
+        if not self.default_model_file:
             return False
+        version = self._default_file_version()
+        if version is None:
+            return False
+        if version != self._shared_default_version:
+            # Recorded first, so a name that fails to load is not retried on every request
+            self._shared_default_version = version
+            try:
+                with open(self.default_model_file) as f:
+                    self._shared_default_name = f.read().strip()
+            except OSError:
+                return False
+            if self._shared_default_name != self.current_model_name and \
+                    not self.load_model(self._shared_default_name):
+                logger.warning("Could not follow the shared default model %s", self._shared_default_name)
+        return self.current_model_name == self._shared_default_name
+
+    def publish(self, bundle, replace_only=False):
+        """Make a fully loaded bundle the default with a single reference swap
+
+        Requests that already hold the previous bundle finish with it; readers
+        never lock. With ``replace_only`` the bundle is published only if
+        there is no default yet or the default is an older version of the
+        same model. Returns whether it was published.
+
+        A bundle that has not been validated yet is validated (and so warmed
+        up) first, so a default model is never cold; this raises if it
+        cannot predict.
+        """
+        if not bundle.warmed:
+            self.validate(bundle)
+        with self._publish_lock:
+            current = self.bundle
+            if replace_only and current is not None and current.name != bundle.name:
+                return False
+            self.result_cache.invalidate_model(bundle.name, bundle.fingerprint)
+            self.bundle = bundle
+            return True
+
+    def drop_engine(self, bundle):
+        """Replace a bundle whose compiled engine failed with a copy that uses the estimator
+
+        The failed bundle itself is left alone: requests holding it finish
+        with it, later ones get the copy from the registry or as the default.
+        """
+        replacement = bundle.without_engine()
+        self.registry.replace(bundle.name, bundle.fingerprint, bundle, replacement)
+        with self._publish_lock:
+            if self.bundle is bundle:
+                self.bundle = replacement
+
+    def validate(self, bundle):
+        """Score the sample record with a bundle, raising if it cannot predict
+
+        Both the single-record and the DataFrame paths are run, which also
+        warms the bundle up: first-call costs are paid here, not by a request.
+        """
+        sample = self.create_sample_data()
+        bundle.infer(bundle.transform(bundle.encode_record(sample)))
+        bundle.infer(self.preprocess_data(pd.DataFrame([sample]), bundle))
+        bundle.warmed = True
+
+    def get_bundle(self, model_name=None):
+        """Return the bundle for a named model, or the default one
+
+        Raises UnknownModelError if the name is not a model in the models
+        directory, ValueError if no model is named and none is loaded.
+        """
+        bundle = self.bundle
+        if not model_name or (bundle is not None and model_name == bundle.name):
+            if bundle is None:
+                raise ValueError('No model loaded')
+            return bundle
+        return self.named_bundle(model_name)
+
+    def named_bundle(self, model_name):
+        """Return the current version of a named model, loading it if needed
+
+        The name is checked by the registry's fingerprint lookup (one stat),
+        not by listing the models directory. Raises UnknownModelError.
+        """
+        if not is_valid_model_name(model_name):
+            raise UnknownModelError(model_name)
+        try:
+            return self.registry.get(model_name)
+        except KeyError:
+            raise UnknownModelError(model_name)
+
+    def preprocess_data(self, data, bundle=None, scale=True):
+        """Preprocess the input data for prediction
 
-    def preprocess_data(self, data):
-        """Preprocess the input data for prediction"""
+        With scale=False the encoded matrix is returned before the model's
+        scaler is applied.
+        """
         try:
+            bundle = bundle or self.get_bundle()
+
             if isinstance(data, dict):
                 df = pd.DataFrame([data])
             else:
                 df = pd.DataFrame(data)
 
-            print(f"Input data columns: {list(df.columns)}")
-            print(f"Input data shape: {df.shape}")
-            print(f"Model expects features: {self.feature_names}")
+            logger.debug("Input data shape: %s, columns: %s", df.shape, list(df.columns))
 
-            processed_df = pd.DataFrame()
-            
-            for feature in self.feature_names:
-                if feature in df.columns:
-                    processed_df[feature] = df[feature]
-                elif feature in ['Number.of.Engines', 'Total.Fatal.Injuries', 
-                               'Total.Serious.Injuries', 'Total.Minor.Injuries', 
-                               'Total.Uninjured']:
-                    processed_df[feature] = 0
-                else:
-                    processed_df[feature] = 'Unknown'
-
-            numeric_columns = ['Number.of.Engines', 
-                             'Total.Fatal.Injuries', 'Total.Serious.Injuries',
-                             'Total.Minor.Injuries', 'Total.Uninjured']
-            
-            for col in numeric_columns:
-                if col in processed_df.columns:
-                    processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0)
+            with timed('defaults', bundle.name):
+                processed_df = pd.DataFrame(index=df.index)
 
-            categorical_columns = [col for col in processed_df.columns if col not in numeric_columns]
-            
-            for col in categorical_columns:
-                if col in processed_df.columns:
-                    processed_df[col] = processed_df[col].astype(str).fillna('Unknown')
-                    
-                    if col in self.label_encoders:
-                        le = self.label_encoders[col]
-                        unique_values = processed_df[col].unique()
-                        for val in unique_values:
-                            if val not in le.classes_:
-                                le.classes_ = np.append(le.classes_, val)
-                        try:
-                            processed_df[col] = le.transform(processed_df[col])
-                        except ValueError as ve:
-                            print(f"Label encoding error for {col}: {ve}")
-                            le = LabelEncoder()
-                            processed_df[col] = le.fit_transform(processed_df[col])
-                            self.label_encoders[col] = le
+                for feature in bundle.feature_names:
+                    if feature in df.columns:
+                        processed_df[feature] = df[feature]
+                    elif feature in NUMERIC_FEATURES:
+                        processed_df[feature] = 0
                     else:
-                        le = LabelEncoder()
-                        processed_df[col] = le.fit_transform(processed_df[col])
-                        self.label_encoders[col] = le
+                        processed_df[feature] = 'Unknown'
 
-            processed_df = processed_df.fillna(0)
+                numeric_columns = [col for col in processed_df.columns if col in NUMERIC_FEATURES]
 
-            print(f"Processed data shape: {processed_df.shape}")
-            print(f"Processed data columns: {list(processed_df.columns)}")
+                for col in numeric_columns:
+                    if col in processed_df.columns:
+                        processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0)
 
-            if processed_df.shape[1] != len(self.feature_names):
-                raise ValueError(f"Feature count mismatch: expected {len(self.feature_names)}, got {processed_df.shape[1]}")
+            categorical_columns = [col for col in processed_df.columns if col not in numeric_columns]
 
-            if self.scaler:
-                df_scaled = self.scaler.transform(processed_df)
-                print("Applied scaling to data")
-                return df_scaled
-            else:
-                print("No scaler available, using raw data")
-                return processed_df.values
+            with timed('encoding', bundle.name):
+                for col in categorical_columns:
+                    if col in processed_df.columns:
+                        values = processed_df[col].fillna('Unknown').astype(str)
+                        table = bundle.encoding_tables.get(col, UNENCODED)
+                        processed_df[col] = table.encode(values)
+
+                processed_df = processed_df.fillna(0)
+
+            logger.debug("Processed data shape: %s", processed_df.shape)
+
+            if processed_df.shape[1] != len(bundle.feature_names):
+                raise ValueError(f"Feature count mismatch: expected {len(bundle.feature_names)}, got {processed_df.shape[1]}")
+
+            matrix = processed_df.to_numpy(dtype=np.float64)
+            if not scale:
+                return matrix
+            with timed('scaling', bundle.name):
+                return bundle.transform(matrix)
 
         except Exception as e:
-            print(f"Error in preprocessing: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in preprocessing: %s", e)
             raise e
 
-    def predict(self, data):
-        """Make prediction on input data"""
+    def predict(self, data, model_name=None):
+        """Make prediction on input data, optionally with a specific model"""
         try:
-            if self.model is None:
-                return {'error': 'No model loaded'}
-
-            print(f"Making prediction with model: {self.current_model_name}")
-            print(f"Input data: {data}")
+            try:
+                bundle = self.get_bundle(model_name)
+            except ValueError as e:
+                return {'error': str(e)}
 
-            processed_data = self.preprocess_data(data)
-            print(f"Processed data shape: {processed_data.shape}")
+            logger.debug("Making prediction with model %s", bundle.name)
 
-            prediction = self.model.predict(processed_data)
-            print(f"Raw prediction: {prediction}")
+            if isinstance(data, dict):
+                # Single record: skip pandas and encode straight into a row,
+                # filling defaults on the way
+                with timed('encoding', bundle.name):
+                    processed_data = bundle.encode_record(data)
+            else:
+                processed_data = self.preprocess_data(data, bundle, scale=False)
 
-            try:
-                prediction_proba = self.model.predict_proba(processed_data)
-                confidence = np.max(prediction_proba) * 100
-                print(f"Prediction probabilities: {prediction_proba}")
-                print(f"Confidence: {confidence}")
-            except Exception as prob_error:
-                print(f"Could not get prediction probabilities: {prob_error}")
-                confidence = 0
+            prediction, confidences = self.score(processed_data, bundle)
+            confidence = np.max(confidences) if len(confidences) else 0
 
             if hasattr(prediction, 'tolist'):
                 prediction = prediction.tolist()
@@ -225,50 +617,163 @@ class AviationClassifier:
             result = {
                 'prediction': str(prediction),
                 'confidence': float(confidence),
-                'model_used': self.current_model_name or 'Unknown'
+                'model_used': bundle.name or 'Unknown'
             }
             
-            print(f"Final result: {result}")
+            logger.debug("Prediction result: %s", result)
             return result
 
         except Exception as e:
             error_msg = f'Prediction failed: {str(e)}'
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
+            logger.exception(error_msg)
             return {'error': error_msg}
 
+    def predict_batch(self, df, model_name=None):
+        """Make predictions for every row of a DataFrame in one pass
+
+        Returns a tuple of (predictions, confidences) as NumPy arrays aligned
+        with the rows of ``df``. Raises instead of returning an error dict so
+        that callers streaming results can abort cleanly.
+        """
+        bundle = self.get_bundle(model_name)
+        processed_data = self.preprocess_data(df, bundle, scale=False)
+        return self.score(processed_data, bundle)
+
+    def score(self, encoded, bundle):
+        """Score an encoded, unscaled matrix, collapsing duplicate rows first
+
+        Small requests go through the result cache: cached rows are answered
+        from it and only the remaining distinct rows reach the model. A batch
+        with more distinct rows than the cache takes is scored in one call.
+        """
+        ROWS_PREDICTED.inc(len(encoded), model=bundle.name, endpoint=current_endpoint.get())
+        cache = self.result_cache
+        if not cache.enabled:
+            return self._infer_encoded(encoded, bundle)
+
+        with timed('dedupe', bundle.name):
+            distinct, inverse = unique_rows(encoded)
+        if not cache.accepts(len(distinct)):
+            labels, confidences = self._infer_encoded(distinct, bundle)
+            return labels[inverse], confidences[inverse]
+
+        labels = np.empty(len(distinct), dtype=object)
+        confidences = np.empty(len(distinct), dtype=np.float64)
+        keys = [cache.make_key(bundle, row) for row in distinct]
+        missing = []
+        for i, key in enumerate(keys):
+            cached = cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                labels[i], confidences[i] = cached
+
+        if missing:
+            new_labels, new_confidences = self._infer_encoded(distinct[missing], bundle)
+            new_labels = new_labels.tolist()
+            new_confidences = new_confidences.tolist()
+            for i, label, confidence in zip(missing, new_labels, new_confidences):
+                labels[i] = label
+                confidences[i] = confidence
+                cache.put(keys[i], (label, confidence))
+
+        return labels[inverse], confidences[inverse]
+
+    def _infer_encoded(self, encoded, bundle):
+        """Scale and score an encoded matrix, across worker processes if enabled"""
+        if self.parallel is not None and self.parallel.should_parallelize(len(encoded)):
+            with timed('parallel_infer', bundle.name):
+                return self.parallel.infer(bundle, encoded)
+        with timed('scaling', bundle.name):
+            scaled = bundle.transform(encoded)
+        return bundle.infer(scaled)
+
+    def predict_records(self, records, model_name=None):
+        """Make predictions for a list of input dicts in a single model call
+
+        Returns one result dict per record, in the same shape as predict().
+        If the vectorized call fails, each record is retried on its own so
+        that one bad record cannot fail the others.
+        """
+        try:
+            bundle = self.get_bundle(model_name)
+        except ValueError as e:
+            return [{'error': str(e)} for _ in records]
+
+        try:
+            predictions, confidences = self.predict_batch(pd.DataFrame(records), bundle.name)
+        except Exception as e:
+            logger.warning("Batched prediction failed, falling back to single records: %s", e)
+            return [self.predict(record, bundle.name) for record in records]
+
+        return [
+            {
+                'prediction': str(prediction),
+                'confidence': float(confidence),
+                'model_used': bundle.name or 'Unknown'
+            }
+            for prediction, confidence in zip(predictions.tolist(), confidences.tolist())
+        ]
+
     def get_feature_names(self):
         """Return the list of important feature names for frontend"""
         return self.important_features
 
     def get_all_feature_names(self):
         """Return the list of all feature names used by the model"""
-        return self.feature_names
-
-    def save_model(self, model_name, model, scaler=None, label_encoders=None):
-        """Save model to pickle file"""
+        bundle = self.bundle
+        return bundle.feature_names if bundle is not None else []
+
+    def save_model(self, model_name, model, scaler=None, label_encoders=None, format='pickle',
+                   feature_names=None):
+        """Save model to pickle file, or to a memory-mappable bundle with format='bundle'
+
+        feature_names defaults to the features of the default model. A
+        bundle directory takes precedence over a pickle of the same name
+        when the model is loaded.
+        """
+        if feature_names is None:
+            feature_names = self.feature_names
         try:
             if not os.path.exists(self.models_directory):
                 os.makedirs(self.models_directory)
 
+            if format == 'bundle':
+                model_path = os.path.join(self.models_directory, f"{model_name}{BUNDLE_SUFFIX}")
+                save_bundle(model_path, model, scaler=scaler, label_encoders=label_encoders,
+                            feature_names=list(feature_names))
+                logger.info("Model saved successfully: %s", model_path)
+                return True
+
             model_data = {
                 'model': model,
                 'scaler': scaler,
                 'label_encoders': label_encoders or {},
-                'feature_names': self.feature_names
+                'feature_names': list(feature_names)
             }
 
             model_path = os.path.join(self.models_directory, f"{model_name}.pkl")
             with open(model_path, 'wb') as f:
                 pickle.dump(model_data, f)
 
-            print(f"Model saved successfully: {model_path}")
+            logger.info("Model saved successfully: %s", model_path)
             return True
 
         except Exception as e:
-            print(f"Error saving model: {str(e)}")
+            logger.error("Error saving model: %s", e)
+            return False
+
+    def warm_up(self):
+        """Warm up the default model, returning False if there is none or it cannot predict"""
+        bundle = self.bundle
+        if bundle is None:
+            return False
+        try:
+            self.validate(bundle)
+        except Exception as e:
+            logger.warning("Warm-up prediction failed: %s", e)
             return False
+        return True
 
     def create_sample_data(self):
         """Create sample data for testing"""
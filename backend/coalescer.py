@@ -0,0 +1,95 @@
+"""
+Micro-batching coalescer for single-record predictions.
+
+Concurrent /api/predict calls are queued and a background thread gathers
+whatever arrives within a short window (or until the batch is full) into a
+single vectorized predict_records call, then hands each caller its own
+result. This trades up to ``window_ms`` of added latency for far fewer
+per-call model invocations under load.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from metrics import current_endpoint
+
+DEFAULT_WINDOW_MS = float(os.environ.get('COALESCE_WINDOW_MS', 0))
+DEFAULT_MAX_BATCH = int(os.environ.get('COALESCE_MAX_BATCH', 64))
+
+
+class PredictionCoalescer:
+    def __init__(self, classifier, window_ms=2.0, max_batch=64):
+        self.classifier = classifier
+        self.window = window_ms / 1000.0
+        self.max_batch = max(int(max_batch), 1)
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+        self._worker = threading.Thread(target=self._run, name='prediction-coalescer', daemon=True)
+        self._worker.start()
+
+    def submit(self, record, model_name=None):
+        """Queue a record and return a Future for its result dict"""
+        future = Future()
+        self._queue.put((record, model_name, current_endpoint.get(), future))
+        return future
+
+    def predict(self, record, model_name=None):
+        """Blocking equivalent of AviationClassifier.predict"""
+        return self.submit(record, model_name).result()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'window_ms': self.window * 1000.0,
+                'max_batch': self.max_batch,
+                'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Window closed, but still take anything already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            with self._stats_lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self._batch_sizes[len(batch)] += 1
+
+            groups = {}
+            for record, model_name, endpoint, future in batch:
+                groups.setdefault((model_name, endpoint), []).append((record, future))
+
+            for (model_name, endpoint), items in groups.items():
+                # Attribute stage timings to the endpoint that queued the records
+                current_endpoint.set(endpoint)
+                records = [record for record, _ in items]
+                try:
+                    results = self.classifier.predict_records(records, model_name)
+                except Exception as e:
+                    results = [{'error': f'Prediction failed: {str(e)}'}] * len(records)
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
@@ -0,0 +1,124 @@
+"""
+JSON codec and response compression for the API.
+
+JSON is encoded and decoded with orjson when it is installed (JSON_CODEC
+selects 'orjson' or 'json' explicitly). Both backends write NumPy arrays
+and scalars directly, so result arrays need no per-element conversion.
+FastJSONProvider plugs the codec into Flask, which makes jsonify,
+returned dicts and request.get_json use it.
+
+Responses of API routes are gzip-compressed when the client accepts gzip
+and the body is a compressible type of at least COMPRESS_MIN_BYTES.
+Streamed bodies are compressed piece by piece, so they stay streamed.
+RESPONSE_COMPRESS_LEVEL sets the zlib level; 0 turns compression off.
+"""
+
+import json
+import os
+import zlib
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CODEC = os.environ.get('JSON_CODEC', 'orjson' if orjson is not None else 'json')
+COMPRESS_LEVEL = int(os.environ.get('RESPONSE_COMPRESS_LEVEL', 1))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+COMPRESSIBLE_TYPES = frozenset([
+    'application/json', 'application/x-ndjson', 'application/vnd.aviation.columnar+json',
+    'text/csv', 'text/plain', 'text/html',
+])
+
+
+def _default(value):
+    # NumPy is only imported once a NumPy value shows up, so importing the
+    # app does not pull it in ahead of the lazy model start-up
+    if type(value).__module__ != 'numpy':
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    import numpy as np
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if JSON_CODEC == 'orjson':
+    if orjson is None:
+        raise ImportError("JSON_CODEC is 'orjson' but orjson is not installed")
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Encode ``obj`` as compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(obj):
+        """Encode ``obj`` as compact UTF-8 JSON bytes"""
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by this module's codec"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand the encoded bytes to the response without a str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
+
+
+def accepts_gzip(request):
+    return request.accept_encodings['gzip'] > 0
+
+
+def _gzip_stream(pieces, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        for piece in pieces:
+            if isinstance(piece, str):
+                piece = piece.encode('utf-8')
+            # Flush every piece so a streamed body reaches the client as it is produced
+            yield compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        close = getattr(pieces, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, request, level=COMPRESS_LEVEL, min_bytes=COMPRESS_MIN_BYTES):
+    """Gzip a response in place if the client accepts it and it is worth it"""
+    if level <= 0 or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not accepts_gzip(request):
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response, level)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(zlib.compress(data, level, wbits=31))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
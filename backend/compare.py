@@ -0,0 +1,186 @@
+"""
+Scoring one input with several models at once.
+
+Models are grouped by their input layout (feature list plus encoding
+tables, see ModelBundle.layout), the input is encoded once per distinct
+layout, and the models then run concurrently on a shared thread pool, each
+applying only its own scaler. Optionally the class probabilities of the
+models that share a label set are averaged into a soft-voting ensemble.
+Comparing models trained on the same features costs one preprocessing pass
+plus one evaluation per model.
+"""
+
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed, ROWS_PREDICTED, current_endpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THREADS = int(os.environ.get('COMPARE_THREADS', min(4, os.cpu_count() or 1)))
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(DEFAULT_THREADS, 1), thread_name_prefix='compare')
+    return _executor
+
+
+class ModelComparison:
+    def __init__(self, classifier, model_names):
+        """Resolve every model up front; raises ValueError for unknown names"""
+        if isinstance(model_names, str):
+            raise ValueError('Model names must be given as a list, not a string')
+        self.classifier = classifier
+        self.bundles = [classifier.get_bundle(name) for name in dict.fromkeys(model_names)]
+        if not self.bundles:
+            raise ValueError('No models to compare')
+
+    def encode(self, data):
+        """Encode ``data`` once per distinct layout, returning {layout: matrix}"""
+        encoded = {}
+        for bundle in self.bundles:
+            if bundle.layout in encoded:
+                continue
+            with timed('encoding', bundle.name):
+                if isinstance(data, dict):
+                    encoded[bundle.layout] = bundle.encode_record(data)
+                else:
+                    encoded[bundle.layout] = self.classifier.preprocess_data(data, bundle, scale=False)
+        return encoded
+
+    @staticmethod
+    def _evaluate(bundle, matrix):
+        ROWS_PREDICTED.inc(len(matrix), model=bundle.name, endpoint=current_endpoint.get())
+        scaled = bundle.transform(matrix)
+        proba = bundle.proba(scaled)
+        if proba is None:
+            with timed('predict', bundle.name):
+                labels = np.asarray(bundle.model.predict(scaled))
+            return labels, np.zeros(len(labels)), None
+        best = proba.argmax(axis=1)
+        return np.asarray(bundle.classes)[best], proba[np.arange(len(best)), best] * 100, proba
+
+    def run(self, data, ensemble=True, weights=None):
+        """Score ``data`` (one record dict or a DataFrame) with every model
+
+        Returns {'models': {name: result}, 'ensemble': result or None,
+        'layouts': number of distinct encodings}. A result holds 'labels'
+        and 'confidences' arrays, or 'error' for a model that failed.
+        """
+        encoded = self.encode(data)
+        futures = {
+            bundle.name: executor().submit(contextvars.copy_context().run, self._evaluate,
+                                           bundle, encoded[bundle.layout])
+            for bundle in self.bundles
+        }
+
+        results, votes = {}, []
+        for bundle in self.bundles:
+            try:
+                labels, confidences, proba = futures[bundle.name].result()
+            except Exception as e:
+                logger.warning("Model %s failed in comparison: %s", bundle.name, e)
+                results[bundle.name] = {'error': str(e)}
+                continue
+            results[bundle.name] = {'labels': labels, 'confidences': confidences}
+            weight = 1.0 if weights is None else float(weights.get(bundle.name, 1.0))
+            if weight > 0:
+                votes.append((bundle, labels, proba, weight))
+
+        return {
+            'models': results,
+            'ensemble': self.ensemble(votes) if ensemble and votes else None,
+            'layouts': len(encoded),
+        }
+
+    @staticmethod
+    def label_set(bundle, labels):
+        """Classes a model can predict, falling back to the labels it did predict"""
+        classes = bundle.classes if bundle.classes is not None else np.unique(labels)
+        return frozenset(str(label) for label in classes)
+
+    def ensemble(self, votes):
+        """Soft vote over the models that predict the same classes as the first one
+
+        Averaging probabilities over unrelated label sets (say True/False
+        and Minor/Substantial) means nothing, so models with a different
+        set are left out and listed under 'excluded'.
+        """
+        reference = self.label_set(votes[0][0], votes[0][1])
+        members, excluded = [], []
+        for vote in votes:
+            bundle, labels = vote[0], vote[1]
+            (members if self.label_set(bundle, labels) == reference else excluded).append(vote)
+        result = self.soft_vote(members)
+        result['members'] = [vote[0].name for vote in members]
+        result['excluded'] = [vote[0].name for vote in excluded]
+        return result
+
+    @staticmethod
+    def soft_vote(votes):
+        """Weighted mean of the models' class probabilities
+
+        Classes are aligned by label across models. A model without
+        probabilities votes with all its weight on the label it predicted.
+        """
+        classes = sorted({str(label) for bundle, labels, proba, _ in votes
+                          for label in (bundle.classes if proba is not None else labels)})
+        column = {label: i for i, label in enumerate(classes)}
+        n_rows = len(votes[0][1])
+        total = np.zeros((n_rows, len(classes)))
+        weight_sum = 0.0
+        for bundle, labels, proba, weight in votes:
+            if proba is not None:
+                positions = [column[str(label)] for label in bundle.classes]
+                total[:, positions] += weight * proba
+            else:
+                total[np.arange(n_rows), [column[str(label)] for label in labels]] += weight
+            weight_sum += weight
+        total /= weight_sum
+        best = total.argmax(axis=1)
+        return {
+            'labels': np.asarray(classes, dtype=object)[best],
+            'confidences': total[np.arange(n_rows), best] * 100,
+            'classes': classes,
+            'probabilities': total,
+        }
+
+
+def compare(classifier, data, model_names, ensemble=True, weights=None):
+    """Compare models on a record dict or a list of records, as a JSON-ready dict"""
+    single = isinstance(data, dict)
+    comparison = ModelComparison(classifier, model_names)
+    outcome = comparison.run(data if single else pd.DataFrame(data), ensemble, weights)
+
+    def shape(result):
+        if 'error' in result:
+            return result
+        predictions = [str(label) for label in result['labels'].tolist()]
+        confidences = result['confidences'].tolist()
+        shaped = ({'prediction': predictions[0], 'confidence': confidences[0]} if single
+                  else {'predictions': predictions, 'confidences': confidences})
+        if 'probabilities' in result:
+            probabilities = [dict(zip(result['classes'], row)) for row in result['probabilities'].tolist()]
+            shaped['probabilities'] = probabilities[0] if single else probabilities
+        if 'members' in result:
+            shaped['members'] = result['members']
+            shaped['excluded'] = result['excluded']
+        return shaped
+
+    response = {
+        'models': {name: shape(result) for name, result in outcome['models'].items()},
+        'ensemble': shape(outcome['ensemble']) if outcome['ensemble'] is not None else None,
+        'feature_layouts': outcome['layouts'],
+    }
+    if not single:
+        response['total_rows'] = len(data)
+    return response
@@ -0,0 +1,481 @@
+"""
+Compiled array-based evaluators for tree ensembles and linear models.
+
+At load time supported estimators are turned into a compact engine with a
+``predict_proba`` that works on plain NumPy arrays:
+
+* tree ensembles (RandomForest/ExtraTrees, DecisionTree, GradientBoosting,
+  AdaBoost, XGBoost) become one set of flattened node arrays that is walked
+  for every (row, tree) pair of the batch at once, each step only touching
+  the pairs that have not reached a leaf yet. Every tree contributes a leaf
+  vector that is summed and passed through the model's link function.
+* LogisticRegression becomes one weight matrix and bias; when the bundle has
+  a StandardScaler it is folded into the weights, so the engine consumes
+  the encoded matrix directly.
+* A StandardScaler on its own becomes one multiply-add (compile_scaler).
+
+Every engine is checked against the original estimator on a probe batch
+before it is used; anything unsupported or not matching within tolerance
+returns None and the bundle keeps using the original estimator.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOLERANCE = 1e-6
+PROBE_ROWS = 512
+
+# Upper bound on (row, tree) pairs walked at once, to cap scratch memory
+MAX_PAIRS_PER_BLOCK = 1 << 18
+
+MAX_TREE_ROWS = int(os.environ.get('COMPILED_TREE_MAX_ROWS', 64))
+
+
+def _softmax(raw):
+    raw = raw - raw.max(axis=1, keepdims=True)
+    np.exp(raw, out=raw)
+    raw /= raw.sum(axis=1, keepdims=True)
+    return raw
+
+
+def _expit(raw):
+    return 1.0 / (1.0 + np.exp(-raw))
+
+
+def _binary(p):
+    return np.column_stack([1.0 - p, p])
+
+
+def make_link(spec):
+    """Build an engine's link function from its JSON-serializable description"""
+    name = spec['name']
+    if name == 'mean':
+        n_trees = spec['n_trees']
+        return lambda s: s / n_trees
+    if name == 'binary':
+        factor, offset = spec.get('factor', 1.0), spec.get('offset', 0.0)
+        return lambda s: _binary(_expit(factor * (s[:, 0] + offset)))
+    if name == 'softmax':
+        offset = np.asarray(spec.get('offset', 0.0), dtype=np.float64)
+        divisor = spec.get('divisor', 1.0)
+        return lambda s: _softmax((s + offset) / divisor)
+    if name == 'samme_binary':
+        def link(s):
+            decision = s[:, 1] - s[:, 0]
+            return _softmax(np.column_stack([-decision, decision]) / 2)
+        return link
+    if name == 'ovr':
+        def link(z):
+            p = _expit(z)
+            return p / p.sum(axis=1, keepdims=True)
+        return link
+    raise ValueError(f'Unknown link {name!r}')
+
+
+class TreeEnsemble:
+    """Flattened node arrays of many trees, evaluated together"""
+
+    def __init__(self, trees, n_outputs, outputs=None, input_dtype=np.float32):
+        """
+        trees is a list of (left, right, feature, threshold, leaf_values)
+        per tree, where children are -1 at leaves and a row goes left when
+        x[feature] <= threshold. leaf_values has shape (n_nodes, n_outputs),
+        or (n_nodes,) when ``outputs`` gives the single output column each
+        tree adds to (one tree per class and round, as in boosting).
+        """
+        lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+        offset = 0
+        for left, right, feature, threshold, leaf_values in trees:
+            n_nodes = len(left)
+            is_leaf = left < 0
+            node_ids = np.arange(n_nodes) + offset
+            # Leaves point at themselves so finished walks stay put
+            lefts.append(np.where(is_leaf, node_ids, left + offset))
+            rights.append(np.where(is_leaf, node_ids, right + offset))
+            features.append(np.where(is_leaf, 0, feature))
+            thresholds.append(np.where(is_leaf, 0.0, threshold))
+            leaf_values = np.asarray(leaf_values, dtype=np.float64)
+            values.append(leaf_values if outputs is not None else leaf_values.reshape(n_nodes, n_outputs))
+            roots.append(offset)
+            offset += n_nodes
+
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.values = np.concatenate(values)
+        self.is_leaf = self.left == np.arange(offset)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.n_trees = len(roots)
+        self.n_outputs = n_outputs
+        self.input_dtype = input_dtype
+
+        # Tree -> output column routing, applied as one matrix product
+        self.routing = None
+        if outputs is not None:
+            self.routing = np.zeros((self.n_trees, n_outputs))
+            self.routing[np.arange(self.n_trees), outputs] = 1.0
+
+    ARRAYS = ('left', 'right', 'feature', 'threshold', 'values', 'is_leaf', 'roots', 'routing')
+
+    @classmethod
+    def from_arrays(cls, arrays, n_outputs, input_dtype):
+        """Rebuild an ensemble from the arrays named in ARRAYS (routing may be missing)"""
+        ensemble = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(ensemble, name, arrays.get(name))
+        ensemble.n_trees = len(ensemble.roots)
+        ensemble.n_outputs = n_outputs
+        ensemble.input_dtype = np.dtype(input_dtype).type
+        return ensemble
+
+    def feature_ranges(self, n_features):
+        """(low, high) split thresholds seen per feature, for building probes"""
+        low = np.zeros(n_features)
+        high = np.ones(n_features)
+        internal = ~self.is_leaf
+        for f in range(n_features):
+            used = self.threshold[internal & (self.feature == f)]
+            if used.size:
+                low[f], high[f] = used.min(), used.max()
+        return low, high
+
+    def leaves(self, X):
+        """Leaf node index for every (row, tree) pair, shape (n_rows * n_trees,)"""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        active = np.flatnonzero(~self.is_leaf[node])
+        while active.size:
+            current = node[active]
+            go_left = flat[row_offset[active] + self.feature[current]] <= self.threshold[current]
+            following = np.where(go_left, self.left[current], self.right[current])
+            node[active] = following
+            active = active[~self.is_leaf[following]]
+        return node
+
+    def sum_values(self, X):
+        """Sum of the leaf values reached by each row, shape (n_rows, n_outputs)"""
+        # Trees compare in their training precision (float32 for sklearn
+        # and XGBoost), so inputs are rounded the same way first
+        X = np.ascontiguousarray(X, dtype=self.input_dtype).astype(np.float64)
+        block = max(1, MAX_PAIRS_PER_BLOCK // max(self.n_trees, 1))
+        out = np.empty((len(X), self.n_outputs))
+        for start in range(0, len(X), block):
+            chunk = X[start:start + block]
+            reached = self.values[self.leaves(chunk)]
+            if self.routing is not None:
+                out[start:start + len(chunk)] = reached.reshape(len(chunk), self.n_trees) @ self.routing
+            else:
+                out[start:start + len(chunk)] = reached.reshape(len(chunk), self.n_trees, -1).sum(axis=1)
+        return out
+
+
+class TreeEngine:
+    fuses_scaler = False
+    # Above this many rows the estimator's own compiled code is faster than
+    # walking the flattened arrays (about 3x at 20k rows for a 100-tree
+    # forest), so larger batches go to the original when it is in memory.
+    # A bundle whose estimator has not been loaded uses the engine for every
+    # batch size, walking blocks of MAX_PAIRS_PER_BLOCK pairs.
+    max_rows = MAX_TREE_ROWS
+
+    def __init__(self, ensemble, classes, link_spec, kind):
+        self.ensemble = ensemble
+        self.classes_ = classes
+        self.link_spec = link_spec
+        self.link = make_link(link_spec)
+        self.kind = kind
+
+    def predict_proba(self, X):
+        return self.link(self.ensemble.sum_values(X))
+
+    def probe(self, n_features, rng):
+        low, high = self.ensemble.feature_ranges(n_features)
+        span = np.maximum(high - low, 1.0)
+        return rng.uniform(low - 0.25 * span, high + 0.25 * span, size=(PROBE_ROWS, n_features))
+
+
+class LinearEngine:
+    max_rows = None
+
+    def __init__(self, weights, bias, classes, link_spec, fuses_scaler, kind):
+        self.weights = weights
+        self.bias = bias
+        self.classes_ = classes
+        self.link_spec = link_spec
+        self.link = make_link(link_spec)
+        self.fuses_scaler = fuses_scaler
+        self.kind = kind
+
+    def predict_proba(self, X):
+        return self.link(X @ self.weights + self.bias)
+
+    def probe(self, n_features, rng):
+        return rng.normal(0.0, 5.0, size=(PROBE_ROWS, n_features)) + rng.integers(0, 20, size=(1, n_features))
+
+
+def _sklearn_tree(tree, leaf_values):
+    return (tree.children_left, tree.children_right, tree.feature, tree.threshold, leaf_values)
+
+
+def _normalized_leaf_values(tree):
+    value = tree.value[:, 0, :].astype(np.float64)
+    totals = value.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1.0
+    return value / totals
+
+
+def _compile_forest(model):
+    if getattr(model, 'n_outputs_', 1) != 1:
+        return None
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        estimators = [model]
+    trees = [_sklearn_tree(e.tree_, _normalized_leaf_values(e.tree_)) for e in estimators]
+    ensemble = TreeEnsemble(trees, len(model.classes_))
+    return TreeEngine(ensemble, model.classes_, {'name': 'mean', 'n_trees': len(trees)}, type(model).__name__)
+
+
+def _compile_gradient_boosting(model):
+    if model.init_ != 'zero' and type(model.init_).__name__ != 'DummyClassifier':
+        return None
+    n_classes = len(model.classes_)
+    k_trees = model.estimators_.shape[1]
+    trees = []
+    for stage in model.estimators_:
+        for k, estimator in enumerate(stage):
+            tree = estimator.tree_
+            trees.append(_sklearn_tree(tree, tree.value[:, 0, 0] * model.learning_rate))
+    ensemble = TreeEnsemble(trees, k_trees, outputs=[i % k_trees for i in range(len(trees))])
+
+    n_features = model.n_features_in_
+    init = model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0]
+    loss = getattr(model, 'loss', 'log_loss')
+
+    if n_classes == 2:
+        link = {'name': 'binary', 'factor': 2.0 if loss == 'exponential' else 1.0, 'offset': float(init[0])}
+    else:
+        link = {'name': 'softmax', 'offset': init.tolist()}
+    return TreeEngine(ensemble, model.classes_, link, type(model).__name__)
+
+
+def _compile_adaboost(model):
+    if getattr(model, 'algorithm', 'SAMME') not in ('SAMME', 'deprecated'):
+        return None
+    classes = list(model.classes_)
+    n_classes = len(classes)
+    if n_classes < 2:
+        return None
+    total_weight = float(np.sum(model.estimator_weights_))
+    trees = []
+    for estimator, weight in zip(model.estimators_, model.estimator_weights_):
+        if not hasattr(estimator, 'tree_'):
+            return None
+        tree = estimator.tree_
+        voted = np.asarray([classes.index(c) for c in estimator.classes_])[tree.value[:, 0, :].argmax(axis=1)]
+        leaf_values = np.full((tree.node_count, n_classes), -weight / (n_classes - 1))
+        leaf_values[np.arange(tree.node_count), voted] = weight
+        trees.append(_sklearn_tree(tree, leaf_values / total_weight))
+    ensemble = TreeEnsemble(trees, n_classes)
+
+    if n_classes == 2:
+        link = {'name': 'samme_binary'}
+    else:
+        link = {'name': 'softmax', 'divisor': n_classes - 1}
+    return TreeEngine(ensemble, model.classes_, link, type(model).__name__)
+
+
+def _xgboost_tree(node_json, feature_index):
+    """Flatten one XGBoost JSON tree dump into sklearn-style node arrays"""
+    nodes = {}
+    stack = [node_json]
+    while stack:
+        node = stack.pop()
+        nodes[node['nodeid']] = node
+        stack.extend(node.get('children', []))
+    n_nodes = max(nodes) + 1
+    left = np.full(n_nodes, -1)
+    right = np.full(n_nodes, -1)
+    feature = np.zeros(n_nodes, dtype=np.intp)
+    threshold = np.zeros(n_nodes)
+    leaf = np.zeros(n_nodes)
+    for node_id, node in nodes.items():
+        if 'leaf' in node:
+            leaf[node_id] = node['leaf']
+            continue
+        if node.get('missing') not in (node['yes'], node['no']):
+            return None
+        left[node_id] = node['yes']
+        right[node_id] = node['no']
+        feature[node_id] = feature_index[node['split']]
+        # XGBoost goes left when x < t in float32; x <= the next float32
+        # below t is the same test
+        split = np.float32(node['split_condition'])
+        threshold[node_id] = float(np.nextafter(split, np.float32(-np.inf)))
+    return left, right, feature, threshold, leaf
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    config = json.loads(booster.save_config())
+    objective = config['learner']['objective']['name']
+    names = booster.feature_names or [f'f{i}' for i in range(model.n_features_in_)]
+    feature_index = {name: i for i, name in enumerate(names)}
+    feature_index.update({f'f{i}': i for i in range(len(names))})
+
+    n_classes = len(model.classes_)
+    groups = 1 if n_classes == 2 else n_classes
+    base_score = config['learner']['learner_model_param']['base_score']
+    base = np.asarray(json.loads(base_score) if base_score.startswith('[') else [float(base_score)], dtype=np.float64)
+
+    trees = []
+    for i, dump in enumerate(booster.get_dump(dump_format='json')):
+        parsed = _xgboost_tree(json.loads(dump), feature_index)
+        if parsed is None:
+            return None
+        left, right, feature, threshold, leaf = parsed
+        trees.append((left, right, feature, threshold, leaf))
+    ensemble = TreeEnsemble(trees, groups, outputs=[i % groups for i in range(len(trees))])
+
+    if objective == 'binary:logistic':
+        link = {'name': 'binary', 'offset': float(np.log(base[0] / (1.0 - base[0])))}
+    elif objective in ('multi:softprob', 'multi:softmax'):
+        link = {'name': 'softmax', 'offset': base.tolist()}
+    else:
+        return None
+    return TreeEngine(ensemble, model.classes_, link, type(model).__name__)
+
+
+def engine_state(engine):
+    """Split an engine into a JSON-serializable description and its named arrays"""
+    spec = {'kind': engine.kind, 'link': engine.link_spec}
+    if isinstance(engine, TreeEngine):
+        ensemble = engine.ensemble
+        spec.update(type='tree', n_outputs=ensemble.n_outputs, input_dtype=np.dtype(ensemble.input_dtype).name)
+        arrays = {name: getattr(ensemble, name) for name in TreeEnsemble.ARRAYS
+                  if getattr(ensemble, name) is not None}
+    else:
+        spec.update(type='linear', fuses_scaler=engine.fuses_scaler)
+        arrays = {'weights': engine.weights, 'bias': engine.bias}
+    return spec, arrays
+
+
+def engine_from_state(spec, arrays, classes):
+    """Rebuild an engine from engine_state output; the arrays may be memory-mapped"""
+    if spec['type'] == 'tree':
+        ensemble = TreeEnsemble.from_arrays(arrays, spec['n_outputs'], spec['input_dtype'])
+        return TreeEngine(ensemble, classes, spec['link'], spec['kind'])
+    return LinearEngine(arrays['weights'], arrays['bias'], classes, spec['link'], spec['fuses_scaler'], spec['kind'])
+
+
+def standard_scaler_terms(scaler, n_features):
+    """(mean, scale) that a StandardScaler applies as (x - mean) / scale, or None
+
+    A step switched off with with_mean=False or with_std=False is returned
+    as zeros or ones, whatever the fitted mean_ and scale_ hold.
+    """
+    if type(scaler).__name__ != 'StandardScaler' or getattr(scaler, 'n_features_in_', n_features) != n_features:
+        return None
+    mean = scaler.mean_ if scaler.with_mean and scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std and scaler.scale_ is not None else np.ones(n_features)
+    return np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+def compile_scaler(scaler, n_features, seed=0):
+    """Return a verified (factor, offset) with x * factor + offset == scaler.transform(x), or None"""
+    terms = standard_scaler_terms(scaler, n_features)
+    if terms is None:
+        return None
+    mean, scale = terms
+    factor = 1.0 / scale
+    offset = -mean * factor
+
+    rng = np.random.default_rng(seed)
+    probe = rng.normal(0.0, 5.0, size=(PROBE_ROWS, n_features)) + rng.integers(0, 20, size=(1, n_features))
+    try:
+        expected = scaler.transform(probe)
+    except Exception as e:
+        logger.warning("Could not verify the fused scaler, using scaler.transform: %s", e)
+        return None
+    if not np.allclose(probe * factor + offset, expected, rtol=1e-9, atol=TOLERANCE):
+        logger.warning("Fused scaler does not match scaler.transform, using scaler.transform")
+        return None
+    return factor, offset
+
+
+def _compile_logistic_regression(model, scaler):
+    weights = np.asarray(model.coef_, dtype=np.float64).T.copy()
+    bias = np.asarray(model.intercept_, dtype=np.float64).copy()
+    fuses_scaler = False
+    if scaler is not None:
+        terms = standard_scaler_terms(scaler, weights.shape[0])
+        if terms is None:
+            return None
+        mean, scale = terms
+        weights = weights / scale[:, None]
+        bias = bias - mean @ weights
+        fuses_scaler = True
+
+    if len(model.classes_) == 2:
+        link = {'name': 'binary'}
+    elif getattr(model, 'solver', None) == 'liblinear':
+        link = {'name': 'ovr'}
+    else:
+        link = {'name': 'softmax'}
+    return LinearEngine(weights, bias, model.classes_, link, fuses_scaler, type(model).__name__)
+
+
+COMPILERS = {
+    'RandomForestClassifier': _compile_forest,
+    'ExtraTreesClassifier': _compile_forest,
+    'DecisionTreeClassifier': _compile_forest,
+    'ExtraTreeClassifier': _compile_forest,
+    'GradientBoostingClassifier': _compile_gradient_boosting,
+    'AdaBoostClassifier': _compile_adaboost,
+    'XGBClassifier': _compile_xgboost,
+}
+
+
+def compile_model(model, scaler=None, n_features=None, seed=0):
+    """Return a verified compiled engine for ``model``, or None to keep the original"""
+    kind = type(model).__name__
+    n_features = n_features or getattr(model, 'n_features_in_', None)
+    if n_features is None:
+        return None
+
+    try:
+        if kind == 'LogisticRegression':
+            engine = _compile_logistic_regression(model, scaler)
+        elif kind in COMPILERS:
+            engine = COMPILERS[kind](model)
+        else:
+            return None
+    except Exception as e:
+        logger.warning("Could not compile %s, using the original estimator: %s", kind, e)
+        return None
+    if engine is None:
+        return None
+
+    probe = engine.probe(n_features, np.random.default_rng(seed))
+    try:
+        if engine.fuses_scaler:
+            expected = model.predict_proba(scaler.transform(probe))
+        else:
+            expected = model.predict_proba(probe)
+        actual = engine.predict_proba(probe)
+    except Exception as e:
+        logger.warning("Could not verify compiled %s, using the original estimator: %s", kind, e)
+        return None
+
+    if actual.shape != expected.shape or not np.allclose(actual, expected, rtol=0, atol=TOLERANCE):
+        logger.warning("Compiled %s does not match the original estimator, using the original", kind)
+        return None
+    logger.debug("Compiled %s into a %s", kind, type(engine).__name__)
+    return engine
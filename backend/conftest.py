@@ -0,0 +1,63 @@
+"""
+Shared test fixtures
+Builds a tiny model on the fly so no .pkl files are needed
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder
+from sklearn.tree import DecisionTreeClassifier
+
+from classifier import AviationClassifier
+
+FEATURES = ['Make', 'Weather.Condition', 'Number.of.Engines']
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """A classifier serving 'tiny', saved in tmp_path, and the rows it was trained on"""
+    rng = np.random.default_rng(0)
+    makes = rng.choice(['Cessna', 'Piper', 'Boeing'], 200)
+    weather = rng.choice(['VMC', 'IMC'], 200)
+    engines = rng.integers(1, 4, 200)
+    encoders = {
+        'Make': LabelEncoder().fit(makes),
+        'Weather.Condition': LabelEncoder().fit(weather),
+    }
+    X = np.column_stack([encoders['Make'].transform(makes),
+                         encoders['Weather.Condition'].transform(weather),
+                         engines])
+    y = np.where(weather == 'IMC', 'Substantial', 'Minor')
+
+    classifier = AviationClassifier()
+    classifier.models_directory = str(tmp_path)
+    classifier.save_model('tiny', LogisticRegression().fit(X, y), label_encoders=encoders, feature_names=FEATURES)
+    assert classifier.load_model('tiny')
+
+    rows = pd.DataFrame({'Make': makes, 'Weather.Condition': weather,
+                         'Number.of.Engines': engines, 'Ignored': 'x'})
+    return classifier, rows
+
+
+@pytest.fixture
+def save_tree(tiny_model):
+    """Save a decision tree fitted on the tiny_model rows as save_tree(name, y, features=FEATURES, **params)"""
+    classifier, rows = tiny_model
+    encoders = classifier.bundle.label_encoders
+
+    def save(name, y, features=FEATURES, **params):
+        X = np.column_stack([encoders[feature].transform(rows[feature]) if feature in encoders else rows[feature]
+                             for feature in features])
+        path = os.path.join(classifier.models_directory, f'{name}.pkl')
+        before = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+        assert classifier.save_model(name, DecisionTreeClassifier(**params).fit(X, y),
+                                     label_encoders={f: encoders[f] for f in features if f in encoders},
+                                     feature_names=features)
+        # Make sure the fingerprint changes even on coarse filesystem clocks
+        os.utime(path, ns=(before + 10**9, before + 10**9))
+
+    return save
@@ -0,0 +1,72 @@
+"""
+Immutable categorical encoding tables.
+
+Each fitted LabelEncoder stored with a model is compiled once, at load time,
+into an EncodingTable: a frozen hash index from category string to code with
+an explicit code for values that were not seen during training. Encoding a
+column is then a single vectorized lookup and never mutates shared state, so
+one table can serve any number of concurrent requests.
+"""
+
+import logging
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class EncodingTable:
+    """Frozen category -> integer code lookup"""
+
+    __slots__ = ('_index', '_codes', 'unknown_code')
+
+    def __init__(self, classes, unknown_code=None):
+        labels = [str(value) for value in classes]
+        index = pd.Index(labels, dtype=object)
+        if not index.is_unique:
+            raise ValueError('Encoding classes must be unique')
+        object.__setattr__(self, '_index', index)
+        object.__setattr__(self, '_codes', MappingProxyType({label: code for code, label in enumerate(labels)}))
+        # Unseen values get the code right after the known classes, which is
+        # what the encoder used to hand out when it was grown on the fly
+        object.__setattr__(self, 'unknown_code', len(labels) if unknown_code is None else unknown_code)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('EncodingTable is immutable')
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def classes(self):
+        return tuple(self._index)
+
+    def encode(self, values):
+        """Encode an array-like of strings into an int64 array"""
+        codes = self._index.get_indexer(pd.Index(values, dtype=object)).astype(np.int64)
+        codes[codes < 0] = self.unknown_code
+        return codes
+
+    def encode_value(self, value):
+        """Encode a single string value"""
+        return self._codes.get(value, self.unknown_code)
+
+
+# Columns that arrive without a fitted encoder cannot be mapped to the codes
+# the model was trained on; every value gets the same stable code instead of
+# a per-request refit.
+UNENCODED = EncodingTable((), unknown_code=0)
+
+
+def compile_encoders(label_encoders):
+    """Compile a {column: LabelEncoder} dict into {column: EncodingTable}"""
+    tables = {}
+    for column, encoder in (label_encoders or {}).items():
+        classes = getattr(encoder, 'classes_', None)
+        if classes is None:
+            logger.warning("Skipping unfitted label encoder for %s", column)
+            continue
+        tables[column] = EncodingTable(classes)
+    return MappingProxyType(tables)
@@ -0,0 +1,332 @@
+"""
+Asynchronous batch prediction jobs backed by the local filesystem.
+
+Each job is a directory under the jobs directory:
+
+    job.json      state and progress, replaced atomically on every update
+    input.csv     the uploaded file
+    results.csv   row_index,prediction,confidence for every finished chunk
+    lock          held (flock) by the process that is running the job
+
+A worker thread scores the input chunk by chunk. After every chunk the new
+result lines are fsynced before job.json records the chunk as done, so an
+interrupted job resumes from its last completed chunk. Anything written
+after that is cut off on resume. Queued and interrupted jobs are picked
+up again when a process starts.
+"""
+
+import bisect
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+from metrics import current_endpoint
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIRECTORY = os.environ.get('JOBS_DIRECTORY', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 100000
+
+STATE_FILE = 'job.json'
+INPUT_FILE = 'input.csv'
+RESULTS_FILE = 'results.csv'
+LOCK_FILE = 'lock'
+RESULTS_HEADER = b'row_index,prediction,confidence\n'
+
+ACTIVE = ('queued', 'running')
+
+
+class JobNotFound(KeyError):
+    pass
+
+
+class JobStore:
+    def __init__(self, directory=JOBS_DIRECTORY):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job_id, name=''):
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            raise JobNotFound(job_id)
+        return os.path.join(self.directory, job_id, name)
+
+    def create(self, upload, filename, model, chunk_size):
+        """Store an uploaded file-like object as a new queued job"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.path(job_id))
+        with open(self.path(job_id, INPUT_FILE), 'wb') as f:
+            shutil.copyfileobj(upload, f, 1024 * 1024)
+        now = time.time()
+        state = {
+            'id': job_id,
+            'status': 'queued',
+            'filename': filename,
+            'model': model,
+            'chunk_size': chunk_size,
+            'created': now,
+            'started': None,
+            'finished': None,
+            'updated': now,
+            'total_rows': None,
+            'rows_done': 0,
+            'chunks_done': 0,
+            'chunk_offsets': [],
+            'chunk_rows': [],
+            'result_bytes': len(RESULTS_HEADER),
+            'elapsed_seconds': 0.0,
+            'attempts': 0,
+            'error': None,
+        }
+        self._write(job_id, state)
+        return state
+
+    def load(self, job_id):
+        try:
+            with open(self.path(job_id, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise JobNotFound(job_id)
+
+    def _write(self, job_id, state):
+        staging = self.path(job_id, f'{STATE_FILE}.tmp')
+        with open(staging, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, self.path(job_id, STATE_FILE))
+
+    def update(self, job_id, **changes):
+        with self._lock:
+            state = self.load(job_id)
+            state.update(changes, updated=time.time())
+            self._write(job_id, state)
+            return state
+
+    def list(self):
+        states = []
+        for job_id in sorted(os.listdir(self.directory)):
+            try:
+                states.append(self.load(job_id))
+            except (JobNotFound, ValueError):
+                continue
+        return sorted(states, key=lambda state: state['created'])
+
+    def remove(self, job_id):
+        shutil.rmtree(self.path(job_id), ignore_errors=True)
+
+    def try_lock(self, job_id):
+        """Take the job's cross-process lock, returning the open lock file or None"""
+        try:
+            handle = open(self.path(job_id, LOCK_FILE), 'a')
+        except FileNotFoundError:
+            raise JobNotFound(job_id)
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return None
+        return handle
+
+    def read_results(self, state, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """Return up to ``limit`` finished result rows starting at row ``offset``"""
+        offset = max(int(offset), 0)
+        limit = min(max(int(limit), 0), MAX_PAGE_SIZE)
+        rows = []
+        if offset >= state['rows_done'] or not limit:
+            return rows
+        # Seek straight to the chunk holding the first requested row;
+        # chunk_rows holds the rows done after each chunk
+        chunk = bisect.bisect_right(state['chunk_rows'], offset)
+        start = state['chunk_offsets'][chunk - 1] if chunk else len(RESULTS_HEADER)
+        skip = offset - (state['chunk_rows'][chunk - 1] if chunk else 0)
+        end = state['result_bytes']
+        with open(self.path(state['id'], RESULTS_FILE), 'rb') as f:
+            f.seek(start)
+            lines = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            position = start
+            for line in lines:
+                position += len(line.encode('utf-8'))
+                if position > end:
+                    break
+                if skip:
+                    skip -= 1
+                    continue
+                row_index, prediction, confidence = next(csv.reader([line]))
+                rows.append({'row_index': int(row_index), 'prediction': prediction,
+                             'confidence': float(confidence)})
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    def iter_results_file(self, state, block_size=64 * 1024):
+        """Yield the committed part of the results file in blocks"""
+        remaining = state['result_bytes']
+        with open(self.path(state['id'], RESULTS_FILE), 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(block_size, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+
+def summarize(state):
+    """Public view of a job's state, with progress and throughput"""
+    summary = {key: value for key, value in state.items() if key not in ('chunk_offsets', 'chunk_rows')}
+    elapsed = state['elapsed_seconds']
+    summary['rows_per_second'] = state['rows_done'] / elapsed if elapsed else 0.0
+    total = state['total_rows']
+    if total:
+        summary['progress'] = min(state['rows_done'] / total, 1.0) if state['status'] != 'completed' else 1.0
+        if summary['rows_per_second'] and state['status'] in ACTIVE:
+            summary['eta_seconds'] = max(total - state['rows_done'], 0) / summary['rows_per_second']
+    return summary
+
+
+def count_rows(path):
+    """Estimate the number of data rows by counting line breaks"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+
+class JobRunner:
+    def __init__(self, classifier, store):
+        self.classifier = classifier
+        self.store = store
+        self._queue = queue.Queue()
+        self._cancelled = set()
+        self._worker = threading.Thread(target=self._run, name='batch-jobs', daemon=True)
+
+    def start(self):
+        """Start the worker and re-queue jobs left queued or running by a previous process"""
+        for state in self.store.list():
+            if state['status'] in ACTIVE:
+                self._queue.put(state['id'])
+        self._worker.start()
+        return self
+
+    def submit(self, upload, filename, model=None, chunk_size=5000):
+        model = model or self.classifier.current_model_name
+        state = self.store.create(upload, filename, model, max(int(chunk_size), 1))
+        self._queue.put(state['id'])
+        return state
+
+    def cancel(self, job_id):
+        """Cancel a job and delete its files once nothing is running it"""
+        state = self.store.load(job_id)
+        if state['status'] in ACTIVE:
+            self._cancelled.add(job_id)
+            state = self.store.update(job_id, status='cancelled', finished=time.time())
+        lock = self.store.try_lock(job_id)
+        if lock is not None:
+            lock.close()
+            self.store.remove(job_id)
+        return state
+
+    def _run(self):
+        current_endpoint.set('jobs')
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except JobNotFound:
+                pass
+            except Exception as e:
+                logger.exception("Batch job %s failed", job_id)
+                try:
+                    self.store.update(job_id, status='failed', error=str(e), finished=time.time())
+                except JobNotFound:
+                    pass
+
+    def _process(self, job_id):
+        lock = self.store.try_lock(job_id)
+        if lock is None:
+            logger.info("Batch job %s is running in another process", job_id)
+            return
+        try:
+            state = self.store.load(job_id)
+            if state['status'] not in ACTIVE:
+                return
+            self._score(state)
+        finally:
+            lock.close()
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                self.store.remove(job_id)
+
+    def _score(self, state):
+        from batch import BatchPredictor
+
+        job_id = state['id']
+        input_path = self.store.path(job_id, INPUT_FILE)
+        if state['total_rows'] is None:
+            state = self.store.update(job_id, total_rows=count_rows(input_path))
+        state = self.store.update(job_id, status='running', attempts=state['attempts'] + 1,
+                                  started=state['started'] or time.time())
+        if state['chunks_done']:
+            logger.info("Resuming batch job %s after chunk %d", job_id, state['chunks_done'])
+
+        predictor = BatchPredictor(self.classifier, chunk_size=state['chunk_size'], model_name=state['model'])
+        results_path = self.store.path(job_id, RESULTS_FILE)
+        mode = 'r+b' if os.path.exists(results_path) else 'w+b'
+        with open(results_path, mode) as results:
+            # Drop anything written after the last recorded chunk
+            results.truncate(state['result_bytes'])
+            results.seek(0)
+            results.write(RESULTS_HEADER)
+            results.seek(state['result_bytes'])
+
+            for chunk_number, chunk in enumerate(predictor.iter_chunks(input_path)):
+                if chunk_number < state['chunks_done']:
+                    continue
+                if job_id in self._cancelled or self.store.load(job_id)['status'] == 'cancelled':
+                    self._cancelled.add(job_id)
+                    return
+                started = time.perf_counter()
+                buffer = io.StringIO()
+                # Every counted row gets a result line, defaults included
+                if len(chunk):
+                    predictions, confidences = self.classifier.predict_batch(chunk, state['model'])
+                    csv.writer(buffer).writerows(zip(chunk.index.tolist(), map(str, predictions.tolist()),
+                                                     confidences.tolist()))
+                data = buffer.getvalue().encode('utf-8')
+                results.write(data)
+                results.flush()
+                os.fsync(results.fileno())
+
+                offset = state['result_bytes'] + len(data)
+                rows_done = state['rows_done'] + len(chunk)
+                state = self.store.update(
+                    job_id,
+                    rows_done=rows_done,
+                    chunks_done=chunk_number + 1,
+                    chunk_offsets=state['chunk_offsets'] + [offset],
+                    chunk_rows=state['chunk_rows'] + [rows_done],
+                    result_bytes=offset,
+                    elapsed_seconds=state['elapsed_seconds'] + time.perf_counter() - started
+                )
+
+        self.store.update(job_id, status='completed', finished=time.time(), total_rows=state['rows_done'])
+        logger.info("Batch job %s completed: %d rows", job_id, state['rows_done'])
@@ -0,0 +1,45 @@
+"""
+Logging setup for the API processes.
+
+LOG_LEVEL picks the level (INFO by default, so per-request DEBUG records
+are never formatted) and LOG_FORMAT=json switches to one JSON object per
+line for log shippers. Fields passed via ``extra=`` are included in the
+JSON output.
+"""
+
+import json
+import logging
+import os
+
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level=None, fmt=None):
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'text')
+
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -0,0 +1,189 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are keyed by label values and rendered on demand by
+the /api/metrics endpoint. ``timed`` records how long each inference stage
+takes, labelled by stage, model and the endpoint that is currently being
+served (tracked in a context variable so the classifier does not need to
+know about Flask).
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+current_endpoint = contextvars.ContextVar('current_endpoint', default='none')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _format_number(bound) + '"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def reset_locks(self):
+        """Give every metric a fresh lock, for a forked child whose parent may have held one"""
+        for metric in self._metrics:
+            metric._lock = threading.Lock()
+
+    def render(self, gauges=None):
+        """Render every metric, plus ad-hoc values given as {name: (help, value[, type])}
+
+        The ad-hoc values are read from component stats at scrape time and
+        default to the gauge type.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, spec in sorted((gauges or {}).items()):
+            documentation, value = spec[0], spec[1]
+            metric_type = spec[2] if len(spec) > 2 else 'gauge'
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {_format_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'aviation_stage_seconds',
+    'Time spent in each inference stage',
+    ('stage', 'model', 'endpoint')
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'aviation_request_seconds',
+    'Time from request start until the response is returned by the view',
+    ('endpoint', 'method')
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    'aviation_requests_total',
+    'HTTP requests served',
+    ('endpoint', 'method', 'status')
+)
+ROWS_PREDICTED = REGISTRY.counter(
+    'aviation_rows_predicted_total',
+    'Rows scored by a model, including cache hits',
+    ('model', 'endpoint')
+)
+SERVER_QUEUE_SECONDS = REGISTRY.histogram(
+    'aviation_server_queue_seconds',
+    'Time an admitted request waited for an inference thread (async server)'
+)
+SERVER_REJECTED = REGISTRY.counter(
+    'aviation_server_rejected_total',
+    'Requests turned away by the async server before reaching the app',
+    ('reason',)
+)
+
+
+class timed:
+    """Context manager that records the duration of a stage"""
+
+    __slots__ = ('stage', 'model', 'start')
+
+    def __init__(self, stage, model=None):
+        self.stage = stage
+        self.model = model
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(
+            time.perf_counter() - self.start,
+            stage=self.stage,
+            model=self.model or 'none',
+            endpoint=current_endpoint.get()
+        )
+        return False
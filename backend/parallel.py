@@ -0,0 +1,129 @@
+"""
+Multi-core batch inference with a pool of forked worker processes.
+
+The pool is forked lazily from the serving process, so every model that is
+resident in the classifier's registry at that point is shared with the
+workers copy-on-write instead of being pickled per task. Models loaded
+later are read from disk once per worker and then kept. Workers score the
+exact version (fingerprint) the caller holds; if the file has changed since,
+the batch is scored in the calling process instead of mixing versions.
+The encoded matrix of each batch is written once to a memory-mapped
+scratch file that all workers read their slice from, and results are
+reassembled in row order. Locks that scoring takes are recreated in each
+worker, since another thread may have held one when the pool was forked.
+"""
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('BATCH_WORKERS', 0))
+DEFAULT_MIN_ROWS = int(os.environ.get('BATCH_PARALLEL_MIN_ROWS', 1000))
+
+# Scratch files go to RAM-backed storage when the platform has it
+SCRATCH_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Set in the parent right before forking and inherited by the workers
+_classifier = None
+
+
+class ModelChanged(Exception):
+    """A worker could not get the exact model version the caller holds"""
+
+
+def _init_worker():
+    # Any lock scoring can take may have been held by another thread at
+    # fork time, and would then stay locked forever in this process
+    from metrics import REGISTRY
+    _classifier.registry.reset_locks()
+    _classifier.result_cache.reset_locks()
+    REGISTRY.reset_locks()
+
+
+def _worker_bundle(model_name, fingerprint):
+    """The caller's version of a model: inherited at fork time, or read from disk if unchanged"""
+    registry = _classifier.registry
+    bundle = registry.peek(model_name, fingerprint)
+    if bundle is None:
+        bundle = _classifier.read_model(model_name)
+        if bundle.fingerprint != fingerprint:
+            raise ModelChanged(f'{model_name} changed on disk since the batch started')
+        registry.put(model_name, bundle)
+    return bundle
+
+
+def _score_slice(model_name, fingerprint, path, shape, start, stop):
+    bundle = _worker_bundle(model_name, fingerprint)
+    matrix = np.memmap(path, dtype=np.float64, mode='r', shape=shape)
+    encoded = np.array(matrix[start:stop])
+    del matrix
+    labels, confidences = bundle.infer(bundle.transform(encoded))
+    return labels, confidences
+
+
+class ParallelScorer:
+    def __init__(self, classifier, workers=DEFAULT_WORKERS, min_rows=DEFAULT_MIN_ROWS):
+        self.classifier = classifier
+        self.workers = max(int(workers), 1)
+        self.min_rows = min_rows
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.workers > 1 and 'fork' in multiprocessing.get_all_start_methods()
+
+    def should_parallelize(self, n_rows):
+        return self.available and n_rows >= self.min_rows
+
+    def _get_pool(self):
+        global _classifier
+        with self._lock:
+            if self._pool is None:
+                _classifier = self.classifier
+                context = multiprocessing.get_context('fork')
+                self._pool = context.Pool(self.workers, initializer=_init_worker)
+                logger.info("Started %d batch inference workers", self.workers)
+            return self._pool
+
+    def infer(self, bundle, encoded):
+        """Score an encoded, unscaled matrix across the worker pool
+
+        Returns (labels, confidences) in the original row order.
+        """
+        n_rows = len(encoded)
+        bounds = np.linspace(0, n_rows, self.workers + 1).astype(int)
+        with tempfile.NamedTemporaryFile(dir=SCRATCH_DIRECTORY, suffix='.f64') as scratch:
+            shared = np.memmap(scratch.name, dtype=np.float64, mode='w+', shape=encoded.shape)
+            shared[:] = encoded
+            shared.flush()
+            del shared
+
+            tasks = [(bundle.name, bundle.fingerprint, scratch.name, encoded.shape, int(start), int(stop))
+                     for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            try:
+                parts = self._get_pool().starmap(_score_slice, tasks)
+            except ModelChanged as e:
+                # The workers cannot reach this snapshot any more; score it here
+                logger.info("Scoring batch in-process: %s", e)
+                return bundle.infer(bundle.transform(encoded))
+            except Exception:
+                self.close()
+                raise
+
+        labels = np.concatenate([part[0] for part in parts])
+        confidences = np.concatenate([part[1] for part in parts])
+        return labels, confidences
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,163 @@
+"""
+Response cache for the reverse proxy.
+
+Entries are whole upstream responses (status, headers and body) kept for a
+per-route TTL in an LRU bounded by total body size. Every entry carries an
+ETag so clients can revalidate with If-None-Match and get a 304. Concurrent
+misses for the same key share one upstream fetch: the first caller loads,
+the others wait for its result.
+
+Invalidation is by path prefix. A generation counter makes sure a fetch that
+started before an invalidation is never stored after it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_MAX_BYTES = int(os.environ.get('PROXY_CACHE_MB', 64)) * 1024 * 1024
+DEFAULT_MAX_BODY_BYTES = int(os.environ.get('PROXY_CACHE_MAX_BODY_MB', 8)) * 1024 * 1024
+FETCH_TIMEOUT = 300.0
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'created', 'expires')
+
+    def __init__(self, status, headers, body, ttl):
+        self.status = status
+        self.headers = [(name, value) for name, value in headers
+                        if name.lower() not in ('etag', 'content-length', 'date')]
+        self.body = body
+        etag = dict((name.lower(), value) for name, value in headers).get('etag')
+        self.etag = etag or '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        self.created = time.monotonic()
+        self.expires = self.created + ttl
+
+    @property
+    def storable(self):
+        if self.status != 200:
+            return False
+        headers = dict((name.lower(), value.lower()) for name, value in self.headers)
+        cache_control = headers.get('cache-control', '')
+        return 'set-cookie' not in headers and 'no-store' not in cache_control and 'private' not in cache_control
+
+    def age(self):
+        return int(time.monotonic() - self.created)
+
+    def matches(self, if_none_match):
+        """True if an If-None-Match header value covers this entry's ETag"""
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        weak = self.etag[2:] if self.etag.startswith('W/') else self.etag
+        return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == weak for tag in tags)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_body_bytes = max_body_bytes
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def fetch(self, key, load):
+        """Return (entry, state) for ``key``, calling ``load`` on a miss
+
+        ``load`` returns a CachedResponse, or None if the response cannot
+        be buffered. State is 'HIT', 'MISS' (this caller loaded it) or
+        'SHARED' (another caller's in-flight load was reused). Waiting
+        callers get None back when the loader's response was not buffered
+        and then have to fetch for themselves.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, 'HIT'
+                self._remove(key)
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                leader = True
+                generation = self._generation
+                self.misses += 1
+            else:
+                leader = False
+                self.shared += 1
+
+        if not leader:
+            return pending.result(FETCH_TIMEOUT), 'SHARED'
+
+        entry = None
+        try:
+            entry = load()
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if entry is not None and entry.storable and generation == self._generation:
+                    self._store(key, entry)
+            pending.set_result(entry)
+        return entry, 'MISS'
+
+    def _store(self, key, entry):
+        if len(entry.body) > min(self.max_body_bytes, self.max_bytes):
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.bytes += len(entry.body)
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry.body)
+
+    def invalidate(self, prefixes):
+        """Drop every entry whose path starts with one of ``prefixes``"""
+        prefixes = tuple(prefixes)
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries if key[1].startswith(prefixes)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += 1
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.shared,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,140 @@
+"""
+In-memory registry of loaded models.
+
+Several models stay resident at once so that requests can pick a model
+without a global switch or a fresh pickle.load. Entries are keyed by model
+name plus the file's fingerprint (mtime and size), so a retrained file on
+disk is picked up automatically, and are evicted least-recently-used first
+once the configured memory budget is exceeded.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_CACHE_MB', 1024))
+
+
+class UnknownModelError(ValueError):
+    """A requested model name does not refer to a model in the models directory"""
+
+    def __init__(self, model_name):
+        super().__init__(f'Model not found: {model_name}')
+        self.model_name = model_name
+
+
+class ModelRegistry:
+    def __init__(self, loader, fingerprint, max_bytes=DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024):
+        """
+        loader(name) returns a loaded model bundle with a ``size_bytes``
+        attribute, fingerprint(name) returns a hashable value identifying the
+        current version of the model on disk (or None if it does not exist).
+        """
+        self.loader = loader
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name):
+        """Return the bundle for ``name``, loading it if it is not resident"""
+        version = self.fingerprint(name)
+        if version is None:
+            raise KeyError(f"Model not found: {name}")
+        key = (name, version)
+
+        with self._lock:
+            bundle = self._entries.get(key)
+            if bundle is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return bundle
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Only one thread loads a given model, the rest wait for its result
+        with load_lock:
+            with self._lock:
+                bundle = self._entries.get(key)
+                if bundle is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return bundle
+
+            bundle = self.loader(name)
+
+            with self._lock:
+                self.misses += 1
+                for stale in [k for k in self._entries if k[0] == name]:
+                    del self._entries[stale]
+                self._entries[key] = bundle
+                self._evict()
+        return bundle
+
+    def peek(self, name, version):
+        """Return the resident bundle for one version of ``name`` without loading, or None"""
+        with self._lock:
+            return self._entries.get((name, version))
+
+    def reset_locks(self):
+        """Fresh locks for a forked child; other threads may have held them at fork time"""
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def put(self, name, bundle):
+        """Register an already-loaded bundle under the current fingerprint"""
+        version = self.fingerprint(name)
+        if version is None:
+            return
+        with self._lock:
+            for stale in [k for k in self._entries if k[0] == name]:
+                del self._entries[stale]
+            self._entries[(name, version)] = bundle
+            self._evict()
+
+    def replace(self, name, version, bundle, replacement):
+        """Swap one resident bundle for another of the same version, if it is still resident"""
+        with self._lock:
+            if self._entries.get((name, version)) is bundle:
+                self._entries[(name, version)] = replacement
+
+    def discard(self, name):
+        """Drop every resident version of ``name``"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == name]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def resident(self):
+        """Names of the models currently held in memory, most recent last"""
+        with self._lock:
+            return [name for name, _ in self._entries]
+
+    def memory_used(self):
+        with self._lock:
+            return sum(bundle.size_bytes for bundle in self._entries.values())
+
+    def stats(self):
+        return {
+            'resident': self.resident(),
+            'memory_bytes': self.memory_used(),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone is
+        # over budget, otherwise the model just requested would be dropped
+        total = sum(bundle.size_bytes for bundle in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.size_bytes
+            self.evictions += 1
@@ -1,49 +1,242 @@
-from flask import Flask, request, Response
+"""
+Reverse proxy in front of the Flask API and the React dev server.
+
+Upstream calls go through one pooled keep-alive session. Request and
+response bodies are passed through as raw bytes in fixed-size pieces, never
+parsed or buffered whole, so proxying a large batch upload or download
+takes constant memory. Hop-by-hop headers are dropped in both directions;
+Content-Length and Content-Encoding are kept because the bytes are
+forwarded unchanged.
+
+GET responses of metadata routes and fingerprinted frontend assets are
+cached in memory (see proxycache.py) with per-route TTLs and ETag
+revalidation. Other frontend files, such as the dev server's bundle.js,
+are always fetched: their content changes without their name changing. The
+backend invalidates entries by sending an X-Cache-Invalidate header with a
+comma-separated list of path prefixes, as its model-switch route does.
+
+Configuration (environment variables):
+
+    FLASK_API_URL           backend base URL (http://localhost:5000)
+    REACT_DEV_SERVER_URL    frontend base URL (http://localhost:3000)
+    PROXY_POOL_SIZE         keep-alive connections kept per upstream (32)
+    PROXY_CONNECT_TIMEOUT   seconds to establish an upstream connection (5)
+    PROXY_READ_TIMEOUT      seconds to wait for upstream data (300)
+    PROXY_CACHE_MB          response cache size, 0 disables caching (64)
+    PROXY_CACHE_MAX_BODY_MB largest response body that is cached (8)
+"""
+
+from flask import Flask, request, Response, jsonify
 import requests
+from requests.adapters import HTTPAdapter
+import itertools
 import os
+import re
+from proxycache import CachedResponse, ResponseCache
 
-app = Flask(__name__)
+# No static folder: /static/ belongs to the React dev server
+app = Flask(__name__, static_folder=None)
 
 # Configuration
-FLASK_API_URL = "http://localhost:5000"
-REACT_DEV_SERVER_URL = "http://localhost:3000"
+FLASK_API_URL = os.environ.get('FLASK_API_URL', "http://localhost:5000")
+REACT_DEV_SERVER_URL = os.environ.get('REACT_DEV_SERVER_URL', "http://localhost:3000")
+POOL_SIZE = int(os.environ.get('PROXY_POOL_SIZE', 32))
+TIMEOUT = (float(os.environ.get('PROXY_CONNECT_TIMEOUT', 5)), float(os.environ.get('PROXY_READ_TIMEOUT', 300)))
+CHUNK_SIZE = 64 * 1024
+
+# Headers that describe a single connection and must not be forwarded
+HOP_BY_HOP = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade',
+])
+
+# Cache TTLs in seconds for GET responses, by path prefix (first match wins).
+# /api/models is not cached: it reports the current and resident models,
+# which change on watcher reloads and registry evictions without a switch.
+API_CACHE_TTLS = (
+    ('/api/features', 300),
+)
+FRONTEND_CACHE_TTLS = (
+    ('/static/', 3600),
+)
+# Build output names carry a content hash (main.3f9a1c2e.js,
+# 2.8d4b7e61.chunk.css); only those files are cached
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}(\.chunk)?\.[a-z0-9]+$')
+
+# Upstream response header listing path prefixes to drop from the cache
+INVALIDATE_HEADER = 'X-Cache-Invalidate'
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+}
+
+
+def create_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    # Forward the client's headers as they are, without requests' defaults
+    # (such as Accept-Encoding) or proxy settings from the environment
+    session.headers.clear()
+    session.trust_env = False
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = create_session()
+cache = ResponseCache()
+
+
+class UploadBody:
+    """Request body of known length, read from the client as it is sent upstream"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=CHUNK_SIZE):
+        return self.stream.read(size)
+
+
+def filter_headers(headers):
+    # Headers named in Connection are hop-by-hop as well
+    listed = {name.strip().lower() for name in headers.get('Connection', '').split(',')}
+    return [(name, value) for name, value in headers.items()
+            if name.lower() not in HOP_BY_HOP and name.lower() not in listed]
+
+
+def request_body():
+    if request.content_length is not None:
+        return UploadBody(request.stream, request.content_length) if request.content_length else None
+    if 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+        # Unknown length: forwarded upstream with chunked encoding
+        return iter(lambda: request.stream.read(CHUNK_SIZE), b'')
+    return None
+
+
+def cache_ttl(rules, target):
+    for prefix, ttl in rules:
+        if target.startswith(prefix):
+            return ttl
+    return 0
+
+
+def send_upstream(base_url, path, for_cache=False):
+    """Send the current request upstream, returning the unread upstream response
+
+    With ``for_cache`` the request is always a full, unconditional GET, so
+    the cache gets a complete body to answer every later variant from.
+    """
+    url = f"{base_url}/{path}"
+    if request.query_string:
+        url = f"{url}?{request.query_string.decode('latin-1')}"
+
+    dropped = ('host', 'if-none-match', 'if-modified-since') if for_cache else ('host',)
+    headers = [(name, value) for name, value in filter_headers(request.headers) if name.lower() not in dropped]
+    headers.append(('X-Forwarded-For', request.remote_addr or ''))
+    headers.append(('X-Forwarded-Host', request.host))
+    headers.append(('X-Forwarded-Proto', request.scheme))
+
+    upstream = session.request(
+        'GET' if for_cache else request.method, url,
+        headers=dict(headers),
+        data=request_body(),
+        stream=True,
+        allow_redirects=False,
+        timeout=TIMEOUT
+    )
+
+    invalidate = upstream.headers.get(INVALIDATE_HEADER)
+    if invalidate and upstream.ok:
+        cache.invalidate(prefix.strip() for prefix in invalidate.split(',') if prefix.strip())
+    return upstream
+
+
+def relay(upstream, body):
+    """Stream an upstream response back to the client"""
+    response = Response(
+        body,
+        status=upstream.status_code,
+        headers=[(name, value) for name, value in filter_headers(upstream.headers)
+                 if name.lower() != INVALIDATE_HEADER.lower()]
+    )
+    # Fully read responses return their connection to the pool; anything
+    # abandoned halfway closes it
+    response.call_on_close(upstream.close)
+    return response
+
+
+def forward(base_url, path):
+    """Send the current request upstream and stream the reply back"""
+    upstream = send_upstream(base_url, path)
+    # decode_content=False passes compressed bodies through untouched
+    return relay(upstream, upstream.raw.stream(CHUNK_SIZE, decode_content=False))
+
+
+def forward_cached(base_url, path, ttl, revalidate=False):
+    """Serve a GET/HEAD from the response cache, fetching it once on a miss"""
+    target = '/' + path
+    if request.query_string:
+        target = f"{target}?{request.query_string.decode('latin-1')}"
+    key = (base_url, target, request.headers.get('Accept-Encoding', ''))
+    passthrough = []
+
+    def load():
+        upstream = send_upstream(base_url, path, for_cache=True)
+        stream = upstream.raw.stream(CHUNK_SIZE, decode_content=False)
+        chunks, size = [], 0
+        for chunk in stream:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > cache.max_body_bytes:
+                # Too large to keep: hand the rest straight to this client
+                passthrough.append(relay(upstream, itertools.chain(chunks, stream)))
+                return None
+        upstream.close()
+        headers = filter_headers(upstream.headers)
+        if revalidate and not upstream.headers.get('Cache-Control'):
+            headers.append(('Cache-Control', 'no-cache'))
+        return CachedResponse(upstream.status_code, headers, b''.join(chunks), ttl)
+
+    entry, state = cache.fetch(key, load)
+    if entry is None:
+        return passthrough[0] if passthrough else forward(base_url, path)
+
+    if entry.status == 200 and entry.matches(request.headers.get('If-None-Match')):
+        response = Response(status=304)
+        response.headers.extend((name, value) for name, value in entry.headers if name.lower() == 'cache-control')
+    else:
+        response = Response(entry.body, status=entry.status, headers=entry.headers)
+    response.headers['ETag'] = entry.etag
+    response.headers['Age'] = str(entry.age())
+    response.headers['X-Cache'] = state
+    return response
+
 
 @app.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def proxy_api(path):
     """Proxy API requests to Flask backend"""
     try:
-        url = f"{FLASK_API_URL}/api/{path}"
-
-        if request.method == 'GET':
-            resp = requests.get(url, params=request.args)
-        elif request.method == 'POST':
-            if request.files:
-                files = {}
-                for key, file in request.files.items():
-                    files[key] = (file.filename, file.stream, file.content_type)
-                resp = requests.post(url, files=files, data=request.form)
-            else:
-                resp = requests.post(url, json=request.get_json(), params=request.args)
-        elif request.method == 'PUT':
-            resp = requests.put(url, json=request.get_json(), params=request.args)
-        elif request.method == 'DELETE':
-            resp = requests.delete(url, params=request.args)
-
-        response = Response(
-            resp.content,
-            status=resp.status_code,
-            headers=dict(resp.headers)
-        )
-        
+        ttl = cache_ttl(API_CACHE_TTLS, f"/api/{path}")
+        if ttl and cache.enabled and request.method in ('GET', 'HEAD'):
+            response = forward_cached(FLASK_API_URL, f"api/{path}", ttl, revalidate=True)
+        else:
+            response = forward(FLASK_API_URL, f"api/{path}")
+
         # Add CORS headers
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        
+        response.headers.update(CORS_HEADERS)
+
         return response
-        
+
     except requests.exceptions.ConnectionError:
         return {"error": "Flask backend server is not running"}, 503
+    except requests.exceptions.Timeout:
+        return {"error": "Flask backend server timed out"}, 504
     except Exception as e:
         return {"error": str(e)}, 500
 
@@ -52,27 +245,32 @@ def proxy_api(path):
 def proxy_react(path):
     """Proxy all other requests to React development server"""
     try:
-        url = f"{REACT_DEV_SERVER_URL}/{path}"
-        
-        if request.method == 'GET':
-            resp = requests.get(url, params=request.args, stream=True)
-        else:
+        if request.method not in ('GET', 'HEAD'):
             return "Method not allowed", 405
-        
-        # Create response
-        response = Response(
-            resp.iter_content(chunk_size=1024),
-            status=resp.status_code,
-            headers=dict(resp.headers)
-        )
-        
-        return response
-        
+
+        ttl = cache_ttl(FRONTEND_CACHE_TTLS, f"/{path}") if FINGERPRINTED.search(path) else 0
+        if ttl and cache.enabled:
+            return forward_cached(REACT_DEV_SERVER_URL, path, ttl)
+        return forward(REACT_DEV_SERVER_URL, path)
+
     except requests.exceptions.ConnectionError:
         return "React development server is not running. Please start it with 'npm start'", 503
+    except requests.exceptions.Timeout:
+        return "React development server timed out", 504
     except Exception as e:
         return f"Error: {str(e)}", 500
 
+@app.route('/proxy/cache', methods=['GET'])
+def cache_stats():
+    """Hit, miss and size counters of the proxy response cache"""
+    return jsonify(cache.stats())
+
+@app.route('/proxy/cache', methods=['DELETE'])
+def clear_cache():
+    """Drop every cached response"""
+    cache.clear()
+    return jsonify({'message': 'Proxy cache cleared'})
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
@@ -82,6 +280,7 @@ if __name__ == '__main__':
     print("Starting reverse proxy server...")
     print(f"Proxying API requests to: {FLASK_API_URL}")
     print(f"Proxying frontend requests to: {REACT_DEV_SERVER_URL}")
+    print(f"Upstream connection pool size: {POOL_SIZE}")
     print("Server will be available at: http://localhost:8080")
-    
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+
+    app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,522 @@
+"""
+Asynchronous serving mode for the Flask API.
+
+Request and response I/O runs on an asyncio event loop, so a slow upload or
+a slow reader only costs an idle coroutine. Once a request body has been
+fully received it is handed to the WSGI app on a bounded thread pool, where
+preprocessing and inference run. Streamed responses are pulled from the app
+one chunk at a time, so a thread is only held while a chunk is produced.
+
+Admission is bounded: at most ``threads + queue`` requests are admitted at
+once and anything beyond that is answered immediately with 429 and a
+Retry-After header. A request that waited longer than ``queue_timeout`` for
+a thread, or arrived while the server is shutting down, gets 503.
+
+    python server.py --port 5000 --processes 2 --threads 4 --queue 64
+
+With more than one process, the listening socket is opened once and each
+forked worker runs its own event loop and imports the app itself. Workers
+share the default model chosen through /api/model/<name> via the file named
+by DEFAULT_MODEL_FILE, which is set to a private temporary file unless it
+is given.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import importlib
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import unquote
+
+from metrics import SERVER_QUEUE_SECONDS, SERVER_REJECTED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROCESSES = int(os.environ.get('SERVER_PROCESSES', 1))
+DEFAULT_THREADS = int(os.environ.get('SERVER_THREADS', os.cpu_count() or 1))
+DEFAULT_QUEUE = int(os.environ.get('SERVER_QUEUE', 64))
+DEFAULT_QUEUE_TIMEOUT = float(os.environ.get('SERVER_QUEUE_TIMEOUT', 30))
+MAX_BODY_BYTES = int(os.environ.get('SERVER_MAX_BODY_MB', 512)) * 1024 * 1024
+
+MAX_HEADER_BYTES = 64 * 1024
+SPOOL_BYTES = 1024 * 1024
+READ_CHUNK = 64 * 1024
+READ_TIMEOUT = 60.0
+KEEPALIVE_TIMEOUT = 15.0
+SHUTDOWN_GRACE = 30.0
+
+# Marks the end of a streamed response body
+_DONE = object()
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class BoundedExecutor:
+    """Thread pool that refuses work beyond ``threads + queue`` admitted requests"""
+
+    def __init__(self, threads=DEFAULT_THREADS, max_queue=DEFAULT_QUEUE, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.threads = max(int(threads), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix='inference')
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self):
+        return self.threads + self.max_queue
+
+    def try_admit(self):
+        with self._lock:
+            if self.admitted >= self.capacity:
+                self.rejected += 1
+                return False
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.admitted -= 1
+
+    def run(self, context, fn, *args):
+        """Run ``fn`` on the pool inside ``context``, returning an awaitable"""
+        return asyncio.get_running_loop().run_in_executor(self._pool, context.run, fn, *args)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': self.threads,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class AsyncServer:
+    def __init__(self, app, executor, multiprocess=False):
+        self.app = app
+        self.executor = executor
+        self.multiprocess = multiprocess
+        self.draining = False
+        self._idle = None
+
+    async def handle(self, reader, writer):
+        """Serve every request on one connection until it closes"""
+        peer = writer.get_extra_info('peername') or ('', 0)
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # asyncio only disables Nagle for sockets created with an explicit
+            # IPPROTO_TCP, which create_server's are not; without it the body
+            # write of a kept-alive response waits for the client's delayed ACK
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, writer)
+                except HttpError as e:
+                    await self._write_error(writer, e.status, str(e), close=True)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._dispatch(request, peer, writer)
+                if not keep_alive or self.draining:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            logger.exception("Error on connection from %s", peer[0])
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Incomplete request')
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Request headers too large')
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Malformed request line')
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            # Whitespace around a name (or a folded line) could make a proxy
+            # and this server disagree on which header it is
+            if not sep or not name or name != name.strip():
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Malformed header')
+            headers.append((name.lower(), value.strip()))
+        header_map = dict(headers)
+
+        # The body's framing must be unambiguous, or a proxy in front could
+        # read a different request boundary than this server (smuggling)
+        lengths = [value for name, value in headers if name == 'content-length']
+        codings = [coding.strip().lower() for name, value in headers if name == 'transfer-encoding'
+                   for coding in value.split(',')]
+        if len(lengths) > 1:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Duplicate Content-Length')
+        if lengths and codings:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Both Content-Length and Transfer-Encoding')
+        if codings and codings != ['chunked']:
+            raise HttpError(HTTPStatus.NOT_IMPLEMENTED, 'Unsupported Transfer-Encoding')
+
+        if header_map.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        try:
+            if codings:
+                length = await self._read_chunked(reader, body)
+            else:
+                value = lengths[0] if lengths else '0'
+                # int() would also accept signs, spaces and underscores
+                if not value.isdigit() or not value.isascii():
+                    raise HttpError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length')
+                length = int(value)
+                if length > MAX_BODY_BYTES:
+                    raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+                await self._copy(reader, body, length)
+        except BaseException:
+            body.close()
+            raise
+        body.seek(0)
+        return method, target, version, headers, body, length
+
+    @staticmethod
+    async def _read(awaitable):
+        """Await one read from the client, giving up after READ_TIMEOUT idle seconds"""
+        return await asyncio.wait_for(awaitable, READ_TIMEOUT)
+
+    async def _copy(self, reader, body, length):
+        remaining = length
+        while remaining:
+            data = await self._read(reader.read(min(READ_CHUNK, remaining)))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            body.write(data)
+            remaining -= len(data)
+
+    async def _read_chunked(self, reader, body):
+        total = 0
+        while True:
+            line = await self._read(reader.readuntil(b'\r\n'))
+            try:
+                digits = line.split(b';', 1)[0].strip()
+                if not digits or digits.lstrip(b'0123456789abcdefABCDEF'):
+                    raise ValueError(digits)
+                size = int(digits, 16)
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Malformed chunk size')
+            if size == 0:
+                # Skip any trailer fields
+                while await self._read(reader.readuntil(b'\r\n')) != b'\r\n':
+                    pass
+                return total
+            total += size
+            if total > MAX_BODY_BYTES:
+                raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+            await self._copy(reader, body, size)
+            if await self._read(reader.readexactly(2)) != b'\r\n':
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Malformed chunk')
+
+    def _environ(self, request, peer, writer):
+        method, target, version, headers, body, length = request
+        path, _, query = target.partition('?')
+        sockname = writer.get_extra_info('sockname') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(sockname[0]),
+            'SERVER_PORT': str(sockname[1]),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': str(peer[0]),
+            'REMOTE_PORT': str(peer[1]),
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.multiprocess,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name not in ('content-length', 'transfer-encoding'):
+                key = 'HTTP_' + name.upper().replace('-', '_')
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _start_app(self, environ, queued_at):
+        """Run the app up to its first body chunk, on an executor thread"""
+        waited = time.monotonic() - queued_at
+        SERVER_QUEUE_SECONDS.observe(waited)
+        if waited > self.executor.queue_timeout:
+            return None
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.app(environ, start_response)
+        # Plain list bodies (jsonify and friends) are finished here in one go
+        if isinstance(result, (list, tuple)):
+            return response['status'], response['headers'], b''.join(result), None
+        iterator = iter(result)
+        first = next(iterator, _DONE)
+        return response['status'], response['headers'], first, (result, iterator)
+
+    async def _dispatch(self, request, peer, writer):
+        method, target, version, headers, body, length = request
+        header_map = dict(headers)
+        connection = header_map.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        if self.draining:
+            body.close()
+            SERVER_REJECTED.inc(reason='shutting_down')
+            await self._write_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, 'Server is shutting down', close=True)
+            return False
+        if not self.executor.try_admit():
+            body.close()
+            SERVER_REJECTED.inc(reason='queue_full')
+            await self._write_error(writer, HTTPStatus.TOO_MANY_REQUESTS, 'Server is busy, retry later',
+                                    close=not keep_alive, retry_after=1)
+            return keep_alive
+
+        context = contextvars.copy_context()
+        stream = None
+        try:
+            try:
+                started = await self.executor.run(context, self._start_app, self._environ(request, peer, writer),
+                                                  time.monotonic())
+            except Exception:
+                logger.exception("Unhandled error in %s %s", method, target)
+                await self._write_error(writer, HTTPStatus.INTERNAL_SERVER_ERROR, 'Internal server error',
+                                        close=not keep_alive)
+                return keep_alive
+            if started is None:
+                SERVER_REJECTED.inc(reason='queue_timeout')
+                await self._write_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, 'Timed out waiting for capacity',
+                                        close=not keep_alive, retry_after=1)
+                return keep_alive
+
+            status, response_headers, first, stream = started
+            return await self._write_response(writer, context, method, version, keep_alive,
+                                              status, response_headers, first, stream)
+        finally:
+            if stream is not None and hasattr(stream[0], 'close'):
+                try:
+                    await self.executor.run(context, stream[0].close)
+                except Exception:
+                    logger.exception("Error closing response for %s %s", method, target)
+            body.close()
+            self.executor.release()
+            if self._idle is not None and self.executor.admitted == 0:
+                self._idle.set()
+
+    async def _write_response(self, writer, context, method, version, keep_alive,
+                              status, headers, first, stream):
+        code = int(status.split(' ', 1)[0])
+        names = {name.lower() for name, _ in headers}
+        bodiless = method == 'HEAD' or code in (204, 304) or 100 <= code < 200
+        complete = stream is None or first is _DONE
+
+        if complete and not bodiless and 'content-length' not in names:
+            data = b'' if first is _DONE else first
+            headers = headers + [('Content-Length', str(len(data)))]
+            names.add('content-length')
+        chunked = not bodiless and 'content-length' not in names and version == 'HTTP/1.1'
+        if not bodiless and 'content-length' not in names and not chunked:
+            # HTTP/1.0 without a length: the body ends when the connection closes
+            keep_alive = False
+
+        lines = [f'{version} {status}']
+        lines.extend(f'{name}: {value}' for name, value in headers if name.lower() != 'connection')
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        lines.append('Connection: ' + ('keep-alive' if keep_alive and not self.draining else 'close'))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        if bodiless:
+            await writer.drain()
+            return keep_alive
+
+        chunk = first
+        while chunk is not _DONE:
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if stream is None:
+                break
+            try:
+                chunk = await self.executor.run(context, next, stream[1], _DONE)
+            except Exception:
+                # Headers are already out, so the only signal left is a cut connection
+                logger.exception("Error while streaming a response body")
+                return False
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return keep_alive
+
+    async def _write_error(self, writer, status, message, close=False, retry_after=None):
+        body = json.dumps({'error': message}).encode()
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}',
+                 'Content-Type: application/json',
+                 f'Content-Length: {len(body)}',
+                 'Connection: ' + ('close' if close else 'keep-alive')]
+        if retry_after is not None:
+            lines.append(f'Retry-After: {retry_after}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, sock):
+        """Accept connections on ``sock`` until SIGTERM/SIGINT, then drain"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+
+        server = await asyncio.start_server(self.handle, sock=sock, limit=MAX_HEADER_BYTES)
+        logger.info("Serving on %s (pid %d, %d threads, queue %d)", sock.getsockname(), os.getpid(),
+                    self.executor.threads, self.executor.max_queue)
+        async with server:
+            await stop.wait()
+            self.draining = True
+            server.close()
+            self._idle = asyncio.Event()
+            if self.executor.admitted:
+                try:
+                    await asyncio.wait_for(self._idle.wait(), SHUTDOWN_GRACE)
+                except asyncio.TimeoutError:
+                    logger.warning("Shutting down with %d requests still running", self.executor.admitted)
+        self.executor.shutdown()
+
+
+def load_app(spec):
+    """Import a WSGI app given as ``module:attribute``"""
+    module_name, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attribute or 'app')
+
+
+def _run_worker(sock, args, multiprocess):
+    app = load_app(args.app)
+    executor = BoundedExecutor(args.threads, args.queue, args.queue_timeout)
+    asyncio.run(AsyncServer(app, executor, multiprocess=multiprocess).serve(sock))
+
+
+def _fork_worker(sock, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _run_worker(sock, args, multiprocess=True)
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(args):
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    sock.setblocking(False)
+    if args.processes <= 1:
+        _run_worker(sock, args, multiprocess=False)
+        return 0
+
+    # The parent only supervises: it never imports the app, and each worker
+    # builds its own classifier and background threads after the fork
+    shared_directory = None
+    if not os.environ.get('DEFAULT_MODEL_FILE'):
+        shared_directory = tempfile.mkdtemp(prefix='aviation-server-')
+        os.environ['DEFAULT_MODEL_FILE'] = os.path.join(shared_directory, 'default-model')
+    stopping = False
+    workers = {_fork_worker(sock, args) for _ in range(args.processes)}
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+            time.sleep(1)
+            workers.add(_fork_worker(sock, args))
+    if shared_directory is not None:
+        shutil.rmtree(shared_directory, ignore_errors=True)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the API with async I/O and bounded inference concurrency')
+    parser.add_argument('--app', default='app:app', help='WSGI app as module:attribute')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES, help='forked worker processes')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='inference threads per process')
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE,
+                        help='requests that may wait for a thread before new ones get 429')
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help='seconds a request may wait for a thread before it gets 503')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from logconfig import configure_logging
+    configure_logging()
+    return serve(parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Background start-up of the model-serving state.
+
+Importing the API only pulls in Flask. The heavy imports (pandas, NumPy,
+scikit-learn), the scan of the models directory, loading of the default
+model and a warm-up prediction all happen on a background thread, so the
+process can answer liveness checks right away. Requests that need the
+classifier wait for it for up to READY_WAIT_SECONDS and are then answered
+with 503.
+
+Each stage is timed, and so is the time from process start until the
+service was ready and until the first real prediction was served.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from metrics import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+STARTED = time.perf_counter()
+
+READY_WAIT_SECONDS = float(os.environ.get('READY_WAIT_SECONDS', 10))
+
+
+def process_uptime():
+    """Seconds since this process started, or since this module was imported without /proc"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - STARTED
+
+
+class NotReady(Exception):
+    pass
+
+
+class ModelService:
+    def __init__(self, models_directory='models', parallel_workers=None, coalesce_window_ms=None,
+                 coalesce_max_batch=None, jobs_directory=None, watch_interval=None):
+        self.models_directory = models_directory
+        self.jobs_directory = jobs_directory
+        self.watch_interval = watch_interval
+        self.parallel_workers = parallel_workers
+        self.coalesce_window_ms = coalesce_window_ms
+        self.coalesce_max_batch = coalesce_max_batch
+        self.classifier = None
+        self.coalescer = None
+        self.jobs = None
+        self.watcher = None
+        self.state = 'starting'
+        self.error = None
+        self.timings = {}
+        self.ready_seconds = None
+        self.first_prediction_seconds = None
+        self._constructed = threading.Event()
+        self._warmed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='model-startup', daemon=True)
+        self._thread.start()
+        return self
+
+    def _stage(self, name, fn):
+        self.state = name
+        start = time.perf_counter()
+        result = fn()
+        self.timings[name] = time.perf_counter() - start
+        return result
+
+    def _import(self):
+        # Imported here so that importing the API does not pay for them
+        from classifier import AviationClassifier
+        from coalescer import PredictionCoalescer, DEFAULT_WINDOW_MS, DEFAULT_MAX_BATCH
+        from parallel import ParallelScorer, DEFAULT_WORKERS
+        from jobs import JobRunner, JobStore, JOBS_DIRECTORY
+        from watcher import ModelWatcher, WATCH_INTERVAL
+        classes = {
+            'classifier': AviationClassifier,
+            'coalescer': PredictionCoalescer,
+            'parallel': ParallelScorer,
+            'job_runner': JobRunner,
+            'job_store': JobStore,
+            'watcher': ModelWatcher,
+        }
+        return classes, {
+            'workers': DEFAULT_WORKERS if self.parallel_workers is None else self.parallel_workers,
+            'window_ms': DEFAULT_WINDOW_MS if self.coalesce_window_ms is None else self.coalesce_window_ms,
+            'max_batch': DEFAULT_MAX_BATCH if self.coalesce_max_batch is None else self.coalesce_max_batch,
+            'jobs_directory': JOBS_DIRECTORY if self.jobs_directory is None else self.jobs_directory,
+            'watch_interval': WATCH_INTERVAL if self.watch_interval is None else self.watch_interval,
+        }
+
+    def _build(self, classes, settings):
+        classifier = classes['classifier'](models_directory=self.models_directory)
+        # Multi-process scoring of large batch chunks, enabled by setting
+        # BATCH_WORKERS to more than one
+        if settings['workers'] > 1:
+            classifier.parallel = classes['parallel'](classifier, settings['workers'])
+        # Micro-batching of concurrent /api/predict calls, enabled by
+        # setting COALESCE_WINDOW_MS to a positive value
+        if settings['window_ms'] > 0:
+            self.coalescer = classes['coalescer'](classifier, settings['window_ms'], settings['max_batch'])
+        # Asynchronous batch jobs; unfinished ones from earlier runs resume
+        store = classes['job_store'](settings['jobs_directory'])
+        self.jobs = classes['job_runner'](classifier, store).start()
+        # Hot reloading of changed model files, enabled by setting
+        # MODEL_WATCH_SECONDS to a positive value
+        if settings['watch_interval'] > 0:
+            self.watcher = classes['watcher'](classifier, settings['watch_interval']).start()
+        return classifier
+
+    def _run(self):
+        current_endpoint.set('startup')
+        try:
+            classes, settings = self._stage('import', self._import)
+            self.classifier = self._stage('load', lambda: self._build(classes, settings))
+            self._constructed.set()
+            if self.classifier.bundle is None:
+                self.state = 'no_model'
+                logger.warning("No model could be loaded at start-up; waiting for one to be selected")
+            else:
+                self._stage('warmup', self.classifier.warm_up)
+                self.state = 'ready'
+            self.ready_seconds = process_uptime()
+            self._warmed.set()
+            logger.info("Start-up finished in %.3fs (%s)", self.ready_seconds,
+                        ', '.join(f'{name} {seconds:.3f}s' for name, seconds in self.timings.items()))
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.exception("Start-up failed")
+            self._constructed.set()
+
+    @property
+    def ready(self):
+        """True once start-up has finished and a model is loaded
+
+        Stays accurate after a switch or a reload: the classifier only
+        publishes bundles that have been validated, which warms them up.
+        """
+        return self._warmed.is_set() and self.classifier is not None and self.classifier.bundle is not None
+
+    def get(self, timeout=READY_WAIT_SECONDS):
+        """Return the classifier, waiting for start-up for up to ``timeout`` seconds"""
+        if not self._constructed.wait(timeout) or self.classifier is None:
+            raise NotReady(self.error or 'The model service is still starting')
+        self.classifier.sync_default()
+        return self.classifier
+
+    def record_prediction(self):
+        if self.first_prediction_seconds is None:
+            self.first_prediction_seconds = process_uptime()
+            logger.info("First prediction served %.3fs after start", self.first_prediction_seconds)
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'state': 'ready' if self.ready else self.state,
+            'error': self.error,
+            'current_model': self.classifier.current_model_name if self.classifier is not None else None,
+            'stage_seconds': dict(self.timings),
+            'ready_seconds': self.ready_seconds,
+            'first_prediction_seconds': self.first_prediction_seconds,
+            'watcher': self.watcher.stats() if self.watcher is not None else None,
+        }
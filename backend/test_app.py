@@ -0,0 +1,62 @@
+"""
+Tests for request validation in the API routes
+"""
+
+import io
+import json
+
+import pytest
+
+import app as api
+from startup import ModelService
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, tiny_model):
+    service = ModelService(models_directory=str(tmp_path), parallel_workers=0, coalesce_window_ms=0,
+                           jobs_directory=str(tmp_path / 'jobs'), watch_interval=0).start()
+    service._thread.join(30)
+    monkeypatch.setattr(api, 'service', service)
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize('body', [[{'Make': 'Cessna'}], '"Cessna"', '42', 'not json'])
+def test_predict_rejects_bodies_that_are_not_objects(client, body):
+    data = body if isinstance(body, str) else json.dumps(body)
+    response = client.post('/api/predict', data=data, content_type='application/json')
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+
+def test_predict_returns_404_for_an_unknown_model(client):
+    response = client.post('/api/predict', json={'Make': 'Cessna', 'model': 'missing'})
+    assert response.status_code == 404
+    assert response.json == {'error': 'Model not found: missing'}
+
+    response = client.post('/api/predict?model=tiny', json={'Make': 'Cessna'})
+    assert response.status_code == 200
+    assert response.json['model_used'] == 'tiny'
+
+
+@pytest.mark.parametrize('models', ['tiny', [1, 2], {'tiny': 1}])
+def test_compare_requires_a_list_of_model_names(client, models):
+    response = client.post('/api/compare', json={'record': {'Make': 'Cessna'}, 'models': models})
+    assert response.status_code == 400
+    assert response.json == {'error': "'models' must be a list of model names"}
+
+    response = client.post('/api/compare', json=[{'Make': 'Cessna'}])
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/api/batch-predict', '/api/jobs'])
+def test_file_routes_return_404_for_an_unknown_model(client, path):
+    upload = {'file': (io.BytesIO(b'Make\nCessna\n'), 'rows.csv'), 'model': 'missing'}
+    response = client.post(path, data=upload, content_type='multipart/form-data')
+    assert response.status_code == 404
+    assert response.json == {'error': 'Model not found: missing'}
+
+
+def test_compare_returns_404_for_an_unknown_model(client):
+    response = client.post('/api/compare', json={'record': {'Make': 'Cessna'}, 'models': ['tiny', 'missing']})
+    assert response.status_code == 404
+    assert response.json == {'error': 'Model not found: missing'}
@@ -0,0 +1,73 @@
+"""
+Tests for the memory-mappable bundle format
+"""
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from artifact import LazyEstimator, convert_pickle, load_bundle
+from classifier import AviationClassifier
+
+
+def test_converted_bundle_predicts_like_pickle(tmp_path, tiny_model):
+    classifier, rows = tiny_model
+    expected, expected_confidence = classifier.predict_batch(rows)
+
+    bundle_path = convert_pickle(os.path.join(tmp_path, 'tiny.pkl'))
+    os.remove(os.path.join(tmp_path, 'tiny.pkl'))
+
+    reloaded = AviationClassifier(models_directory=str(tmp_path))
+    assert reloaded.get_available_models() == ['tiny']
+    assert reloaded.current_model_name == 'tiny'
+    assert reloaded.feature_names == classifier.feature_names
+    labels, confidence = reloaded.predict_batch(rows)
+
+    assert labels.tolist() == expected.tolist()
+    np.testing.assert_allclose(confidence, expected_confidence)
+    assert reloaded.model_path('tiny') == bundle_path
+
+
+def test_standard_scaler_round_trips_through_manifest(tmp_path):
+    X = np.random.default_rng(0).normal(size=(50, 3))
+    y = (X[:, 0] > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+
+    saver = AviationClassifier(models_directory=str(tmp_path), load_default=False)
+    assert saver.save_model('scaled', LogisticRegression().fit(scaler.transform(X), y),
+                            scaler=scaler, format='bundle', feature_names=['a', 'b', 'c'])
+
+    restored = load_bundle(os.path.join(tmp_path, 'scaled.bundle'))['scaler']
+    np.testing.assert_allclose(restored.transform(X), scaler.transform(X))
+    assert not os.path.exists(os.path.join(tmp_path, 'scaled.bundle', 'scaler.joblib'))
+
+
+@pytest.mark.parametrize('model', [RandomForestClassifier(n_estimators=5, random_state=0), LogisticRegression()])
+def test_compiled_arrays_are_memory_mapped_and_the_estimator_loads_lazily(tiny_model, model):
+    classifier, rows = tiny_model
+    bundle = classifier.get_bundle()
+    X = classifier.preprocess_data(rows, bundle, scale=False)
+    y = rows['Weather.Condition'].to_numpy()
+    classifier.save_model('mapped', model.fit(X, y), label_encoders=bundle.label_encoders, format='bundle')
+
+    loaded = classifier.read_model('mapped')
+    arrays = ([loaded.engine.ensemble.left, loaded.engine.ensemble.threshold, loaded.engine.ensemble.values]
+              if hasattr(loaded.engine, 'ensemble') else [loaded.engine.weights, loaded.engine.bias])
+    assert all(isinstance(array, np.memmap) for array in arrays)
+    assert isinstance(loaded.model, LazyEstimator) and not loaded.model.loaded
+
+    record = rows.iloc[0].to_dict()
+    label, confidence = loaded.infer(loaded.transform(loaded.encode_record(record)))
+    assert not loaded.model.loaded
+    assert label[0] == model.predict(X[:1])[0]
+    assert confidence[0] == pytest.approx(model.predict_proba(X[:1]).max() * 100)
+
+    # A batch above COMPILED_TREE_MAX_ROWS is still scored by the engine
+    assert len(X) > 64
+    labels, _ = loaded.infer(loaded.transform(X))
+    assert labels.tolist() == model.predict(X).tolist()
+    assert not loaded.model.loaded
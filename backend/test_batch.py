@@ -0,0 +1,143 @@
+"""
+Tests for the chunked batch prediction engine
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder
+from sklearn.tree import DecisionTreeClassifier
+
+from batch import BatchPredictor
+
+
+def test_batch_matches_single_predictions(tiny_model):
+    classifier, rows = tiny_model
+    source = io.StringIO(rows.to_csv(index=False))
+
+    body = b''.join(BatchPredictor(classifier, chunk_size=7).stream(source, 'json'))
+    result = json.loads(body)
+
+    assert result['total_rows'] == len(rows)
+    assert [r['row_index'] for r in result['predictions']] == list(range(len(rows)))
+    for record, predicted in zip(rows.head(20).to_dict('records'), result['predictions']):
+        assert predicted['prediction'] == classifier.predict(record)['prediction']
+
+
+def test_csv_chunks_encode_numeric_looking_codes_like_single_records(tiny_model):
+    classifier, _ = tiny_model
+    makes = np.array(['7', '12', '30', 'Unknown'] * 10)
+    encoders = {'Make': LabelEncoder().fit(makes)}
+    model = DecisionTreeClassifier().fit(encoders['Make'].transform(makes).reshape(-1, 1),
+                                         np.where(makes == '12', 'Substantial', 'Minor'))
+    assert classifier.save_model('coded', model, label_encoders=encoders, feature_names=['Make'])
+
+    # The blank in the second chunk would make pandas read its codes as 12.0
+    source = io.StringIO('Make,Note\n12,a\n7,b\n12,c\n,d\n')
+    predictor = BatchPredictor(classifier, chunk_size=2, model_name='coded')
+    assert [value for chunk in predictor.iter_chunks(source) for value in chunk['Make'].dropna()] == ['12', '7', '12']
+    source.seek(0)
+    predicted = [label for _, labels, _ in predictor.iter_results(source) for label in labels]
+    expected = [classifier.predict({'Make': make}, 'coded')['prediction'] for make in ('12', '7', '12', None)]
+    assert predicted == expected == ['Substantial', 'Minor', 'Substantial', 'Minor']
+
+
+def test_batch_streams_csv_and_ndjson(tiny_model):
+    classifier, rows = tiny_model
+    predictor = BatchPredictor(classifier, chunk_size=50)
+
+    csv_body = ''.join(predictor.stream(io.StringIO(rows.to_csv(index=False)), 'csv'))
+    assert csv_body.splitlines()[0] == 'row_index,prediction,confidence'
+    assert len(csv_body.splitlines()) == len(rows) + 1
+
+    ndjson_body = b''.join(predictor.stream(io.StringIO(rows.to_csv(index=False)), 'ndjson'))
+    lines = [json.loads(line) for line in ndjson_body.splitlines()]
+    assert len(lines) == len(rows)
+    assert lines[-1]['row_index'] == len(rows) - 1
+
+    columnar = json.loads(b''.join(predictor.stream(io.StringIO(rows.to_csv(index=False)), 'columnar')))
+    assert columnar['total_rows'] == len(rows)
+    assert columnar['columns'] == ['row_index', 'prediction', 'confidence']
+    row_index = [i for chunk in columnar['chunks'] for i in chunk['row_index']]
+    predictions = [p for chunk in columnar['chunks'] for p in chunk['prediction']]
+    assert row_index == list(range(len(rows)))
+    assert predictions == [line['prediction'] for line in lines]
+
+
+def test_rows_without_feature_columns_are_scored_with_defaults(tiny_model):
+    classifier, rows = tiny_model
+    predictor = BatchPredictor(classifier, chunk_size=7)
+    default = classifier.predict({})['prediction']
+
+    result = json.loads(b''.join(predictor.stream(io.StringIO(rows[['Ignored']].to_csv(index=False)), 'json')))
+    assert result['total_rows'] == len(rows)
+    assert [r['row_index'] for r in result['predictions']] == list(range(len(rows)))
+    assert {r['prediction'] for r in result['predictions']} == {default}
+
+
+def test_batch_reads_and_writes_columnar_formats(tiny_model):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    classifier, rows = tiny_model
+    predictor = BatchPredictor(classifier, chunk_size=30)
+    expected = json.loads(b''.join(predictor.stream(io.StringIO(rows.to_csv(index=False)), 'json')))['predictions']
+
+    table = pa.Table.from_pandas(rows, preserve_index=False)
+    parquet_upload = io.BytesIO()
+    pq.write_table(table, parquet_upload, row_group_size=64)
+    parquet_upload.seek(0)
+    parquet_body = io.BytesIO(b''.join(predictor.stream(parquet_upload, 'parquet', 'parquet')))
+    assert pq.read_table(parquet_body).to_pylist() == expected
+
+    # Dictionary-encoded strings in an Arrow IPC file come back as an IPC stream
+    dictionary_table = pa.table({name: (column.dictionary_encode() if name == 'Make' else column)
+                                 for name, column in zip(table.column_names, table.columns)})
+    arrow_upload = io.BytesIO()
+    with pa.ipc.new_file(arrow_upload, dictionary_table.schema) as writer:
+        writer.write_table(dictionary_table, max_chunksize=75)
+    arrow_upload.seek(0)
+    arrow_body = b''.join(predictor.stream(arrow_upload, 'arrow', 'arrow'))
+    assert pa.ipc.open_stream(arrow_body).read_all().to_pylist() == expected
+
+
+def test_single_record_fast_path_matches_dataframe_path(tiny_model):
+    classifier, rows = tiny_model
+    bundle = classifier.get_bundle()
+    records = rows.head(30).to_dict('records')
+    records[0]['Make'] = None
+    records[1]['Number.of.Engines'] = 'not a number'
+    records[2] = {'Make': 'Unseen'}
+
+    fast = np.vstack([bundle.transform(bundle.encode_record(record)) for record in records])
+    slow = classifier.preprocess_data(pd.DataFrame(records), bundle)
+
+    np.testing.assert_allclose(fast, slow)
+
+
+def test_duplicate_rows_are_scored_once(tiny_model):
+    classifier, rows = tiny_model
+    duplicated = pd.concat([rows] * 5, ignore_index=True)
+
+    predictions, _ = classifier.predict_batch(duplicated)
+
+    distinct = len(rows.drop_duplicates(subset=classifier.feature_names))
+    assert classifier.result_cache.stats()['misses'] == distinct
+    assert len(predictions) == len(duplicated)
+    assert predictions[:len(rows)].tolist() == predictions[len(rows):2 * len(rows)].tolist()
+
+
+def test_large_batches_skip_the_result_cache(tiny_model):
+    classifier, rows = tiny_model
+    classifier.result_cache.max_rows = 5
+    expected, expected_confidence = classifier.predict_batch(rows)
+    assert classifier.result_cache.stats()['entries'] == 0
+
+    classifier.result_cache.max_rows = 100
+    cached, cached_confidence = classifier.predict_batch(rows)
+    assert classifier.result_cache.stats()['entries'] > 5
+    assert cached.tolist() == expected.tolist()
+    np.testing.assert_allclose(cached_confidence, expected_confidence)
@@ -0,0 +1,48 @@
+"""
+Tests for the prediction result cache
+"""
+
+import time
+
+from cache import ResultCache
+
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = ResultCache(max_entries=10, ttl_seconds=0.01)
+    cache.put('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_invalidate_model_keeps_current_version():
+    cache = ResultCache(max_entries=10, ttl_seconds=60)
+    cache.put(('rf', 1, b'row'), 'old')
+    cache.put(('rf', 2, b'row'), 'new')
+    cache.put(('xgb', 1, b'row'), 'other')
+
+    cache.invalidate_model('rf', keep_fingerprint=2)
+
+    assert cache.get(('rf', 1, b'row')) is None
+    assert cache.get(('rf', 2, b'row')) == 'new'
+    assert cache.get(('xgb', 1, b'row')) == 'other'
+
+
+def test_only_small_requests_use_the_cache():
+    cache = ResultCache(max_entries=50, ttl_seconds=60, max_rows=100)
+    assert cache.accepts(50)
+    assert not cache.accepts(51)
+    assert not ResultCache(max_entries=0).accepts(1)
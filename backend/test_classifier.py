@@ -4,8 +4,15 @@ Test script for the Aviation Classifier
 Run this to test if your models are loading correctly
 """
 
-from classifier import AviationClassifier
+from classifier import AviationClassifier, UnknownModelError
+import classifier as classifier_module
 import json
+import os
+import pickle
+import time
+
+import pytest
+
 
 def test_classifier():
     print("=" * 50)
@@ -62,5 +69,118 @@ def test_classifier():
     
     return True
 
+class Payload:
+    """Records that it was unpickled"""
+    loaded = []
+
+    def __reduce__(self):
+        return (Payload.loaded.append, ('unpickled',))
+
+
+@pytest.mark.parametrize('name', ['../outside/evil', 'sub/../../outside/evil', '..', os.path.abspath('x')])
+def test_model_names_cannot_leave_the_models_directory(tmp_path, name):
+    os.makedirs(tmp_path / 'models')
+    os.makedirs(tmp_path / 'outside')
+    with open(tmp_path / 'outside' / 'evil.pkl', 'wb') as f:
+        pickle.dump(Payload(), f)
+    with open(tmp_path / 'models' / 'x.pkl', 'wb') as f:
+        pickle.dump(Payload(), f)
+    classifier = AviationClassifier(models_directory=str(tmp_path / 'models'), load_default=False)
+
+    assert classifier.predict({'Make': 'x'}, name) == {'error': f'Model not found: {name}'}
+    assert classifier.load_model(name) is False
+    with pytest.raises(ValueError):
+        classifier.model_path(name)
+    assert Payload.loaded == []
+
+
+def test_model_listing_is_reused_until_the_directory_changes(tmp_path, tiny_model, monkeypatch):
+    classifier, _ = tiny_model
+    settled = time.time_ns() - 10 * 10**9
+    os.utime(tmp_path, ns=(settled, settled))
+    assert classifier.get_available_models() == ['tiny']
+
+    globs = []
+    original = classifier_module.glob.glob
+    monkeypatch.setattr(classifier_module.glob, 'glob', lambda pattern: globs.append(pattern) or original(pattern))
+    assert classifier.get_available_models() == ['tiny']
+    assert globs == []
+
+    classifier.save_model('other', classifier.model, label_encoders=classifier.label_encoders)
+    assert sorted(classifier.get_available_models()) == ['other', 'tiny']
+    assert globs
+
+
+def test_named_models_are_found_without_listing_the_directory(tiny_model, monkeypatch):
+    classifier, _ = tiny_model
+    classifier.save_model('other', classifier.model, label_encoders=classifier.label_encoders)
+    monkeypatch.setattr(classifier, 'get_available_models', lambda: pytest.fail('models directory listed'))
+
+    assert classifier.get_bundle('other').name == 'other'
+    assert classifier.load_model('other')
+    for name in ('missing', '.hidden', '../tiny'):
+        with pytest.raises(UnknownModelError):
+            classifier.get_bundle(name)
+        assert not classifier.load_model(name)
+
+
+def test_switched_default_is_followed_by_other_processes(tmp_path, tiny_model):
+    first, _ = tiny_model
+    first.save_model('copy', first.model, label_encoders=first.label_encoders)
+    shared = str(tmp_path / 'default-model')
+    first.default_model_file = shared
+
+    # Another server process with the same models directory
+    second = AviationClassifier(models_directory=str(tmp_path), load_default=False)
+    second.default_model_file = shared
+    second.load_default_model()
+    other = 'copy' if second.current_model_name == 'tiny' else 'tiny'
+
+    assert first.switch_model(other)
+    assert second.current_model_name != other
+    second.sync_default()
+    assert second.current_model_name == other
+
+    third = AviationClassifier(models_directory=str(tmp_path), load_default=False)
+    third.default_model_file = shared
+    third.load_default_model()
+    assert third.current_model_name == other
+    assert not first.switch_model('missing')
+    assert open(shared).read() == other
+
+
+def test_save_model_takes_feature_names_without_touching_the_default(tmp_path, tiny_model):
+    classifier, _ = tiny_model
+    features = list(classifier.feature_names)
+    encoders = classifier.label_encoders
+    assert classifier.save_model('narrow', classifier.model, label_encoders=encoders, feature_names=['Make'])
+    assert classifier.feature_names == features
+    with pytest.raises(AttributeError):
+        classifier.feature_names = ['Make']
+
+    with open(tmp_path / 'narrow.pkl', 'rb') as f:
+        assert pickle.load(f)['feature_names'] == ['Make']
+    assert classifier.save_model('same', classifier.model, label_encoders=encoders)
+    with open(tmp_path / 'same.pkl', 'rb') as f:
+        assert pickle.load(f)['feature_names'] == features
+
+
+def test_failing_engine_is_replaced_by_a_new_bundle(tiny_model):
+    classifier, _ = tiny_model
+    bundle = classifier.get_bundle()
+    engine = bundle.engine
+
+    def broken(matrix):
+        raise RuntimeError('broken engine')
+    engine.predict_proba = broken
+
+    result = classifier.predict({'Make': 'Cessna', 'Weather.Condition': 'IMC', 'Number.of.Engines': 1})
+    assert result['prediction'] == 'Substantial'
+    assert bundle.engine is engine
+    replacement = classifier.get_bundle()
+    assert replacement is not bundle and replacement.engine is None
+    assert classifier.registry.get('tiny') is replacement
+
+
 if __name__ == "__main__":
-    test_classifier()
\ No newline at end of file
+    test_classifier()
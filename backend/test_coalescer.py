@@ -0,0 +1,44 @@
+"""
+Tests for the single-record prediction coalescer
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from coalescer import PredictionCoalescer
+
+
+class RecordingClassifier:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def predict_records(self, records, model_name=None):
+        with self.lock:
+            self.calls.append(len(records))
+        return [{'prediction': str(record['value'] * 2), 'model_used': model_name} for record in records]
+
+
+def test_concurrent_requests_are_batched_and_routed_back():
+    classifier = RecordingClassifier()
+    coalescer = PredictionCoalescer(classifier, window_ms=20, max_batch=16)
+
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(lambda v: coalescer.predict({'value': v}), range(64)))
+
+    assert [r['prediction'] for r in results] == [str(v * 2) for v in range(64)]
+    assert sum(classifier.calls) == 64
+    assert max(classifier.calls) <= 16
+    stats = coalescer.stats()
+    assert stats['requests'] == 64
+    assert stats['batches'] < 64
+
+
+def test_records_are_grouped_by_model():
+    classifier = RecordingClassifier()
+    coalescer = PredictionCoalescer(classifier, window_ms=20, max_batch=8)
+
+    futures = [coalescer.submit({'value': v}, 'rf' if v % 2 else 'xgb') for v in range(6)]
+    results = [future.result() for future in futures]
+
+    assert [r['model_used'] for r in results] == ['xgb', 'rf'] * 3
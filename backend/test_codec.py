@@ -0,0 +1,67 @@
+"""
+Tests for the JSON codec and response compression
+"""
+
+import gzip
+import subprocess
+import sys
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+from codec import FastJSONProvider, compress_response, dumps, loads
+
+
+def make_app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    @app.route('/api/echo', methods=['POST'])
+    def echo():
+        data = request.get_json()
+        return jsonify({'received': data, 'values': np.arange(3), 'score': np.float32(0.5)})
+
+    @app.route('/api/stream')
+    def stream():
+        return Response((f'{i},row\n' for i in range(2000)), mimetype='text/csv')
+
+    @app.route('/api/small')
+    def small():
+        return jsonify({'ok': True})
+
+    app.after_request(lambda response: compress_response(response, request))
+    return app
+
+
+def test_codec_writes_numpy_values():
+    assert loads(dumps({'a': np.array([1, 2]), 'b': np.int64(3), 'c': np.array(['x'], dtype=object)})) == \
+        {'a': [1, 2], 'b': 3, 'c': ['x']}
+
+
+def test_codec_does_not_import_numpy():
+    code = 'import sys, codec; codec.dumps({"a": [1]}); print("numpy" in sys.modules)'
+    assert subprocess.check_output([sys.executable, '-c', code], text=True).strip() == 'False'
+
+
+def test_provider_decodes_requests_and_encodes_numpy_responses():
+    client = make_app().test_client()
+    response = client.post('/api/echo', json={'Make': 'Cessna'})
+    assert response.json == {'received': {'Make': 'Cessna'}, 'values': [0, 1, 2], 'score': 0.5}
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_responses_are_gzipped_only_when_accepted_and_large_enough():
+    client = make_app().test_client()
+
+    streamed = client.get('/api/stream', headers={'Accept-Encoding': 'gzip'})
+    assert streamed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in streamed.headers['Vary']
+    assert gzip.decompress(streamed.data).decode() == ''.join(f'{i},row\n' for i in range(2000))
+
+    plain = client.get('/api/stream')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data.startswith(b'0,row\n')
+
+    small = client.get('/api/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert small.json == {'ok': True}
@@ -0,0 +1,66 @@
+"""
+Tests for multi-model comparison and soft voting
+"""
+
+import numpy as np
+import pytest
+
+from compare import compare
+
+
+@pytest.fixture
+def models(tiny_model, save_tree):
+    """tiny plus 'tree' on the same features and 'narrow' on Make alone, with True/False labels"""
+    classifier, rows = tiny_model
+    save_tree('tree', np.where(rows['Number.of.Engines'] > 1, 'Substantial', 'Minor'), max_depth=2)
+    save_tree('narrow', rows['Make'] == 'Boeing', features=['Make'])
+    return classifier, rows
+
+
+def test_compare_encodes_each_layout_once_and_matches_single_predictions(models, monkeypatch):
+    classifier, rows = models
+    calls = []
+    original = classifier.preprocess_data
+    monkeypatch.setattr(classifier, 'preprocess_data', lambda data, bundle, scale: calls.append(bundle.name)
+                        or original(data, bundle, scale))
+
+    records = rows.head(25).to_dict('records')
+    result = compare(classifier, records, ['tiny', 'tree', 'narrow'], ensemble=False)
+    assert result['feature_layouts'] == 2
+    assert len(calls) == 2
+    assert result['ensemble'] is None
+    for name in ('tiny', 'tree', 'narrow'):
+        expected = [classifier.predict(record, name) for record in records]
+        assert result['models'][name]['predictions'] == [r['prediction'] for r in expected]
+        np.testing.assert_allclose(result['models'][name]['confidences'], [r['confidence'] for r in expected])
+
+
+def test_soft_vote_averages_aligned_probabilities(models):
+    classifier, rows = models
+    record = {'Make': 'Cessna', 'Weather.Condition': 'IMC', 'Number.of.Engines': 1}
+
+    result = compare(classifier, record, ['tiny', 'tree'], weights={'tree': 3})
+    expected = {}
+    for name, weight in (('tiny', 1), ('tree', 3)):
+        bundle = classifier.get_bundle(name)
+        proba = bundle.proba(bundle.transform(bundle.encode_record(record)))[0]
+        for label, p in zip(bundle.classes, proba):
+            expected[str(label)] = expected.get(str(label), 0) + weight * p / 4
+    ensemble = result['ensemble']
+    assert ensemble['probabilities'] == pytest.approx(expected)
+    assert ensemble['prediction'] == max(expected, key=expected.get)
+    assert ensemble['confidence'] == pytest.approx(max(expected.values()) * 100)
+
+
+def test_ensemble_leaves_out_models_with_other_label_sets(models):
+    classifier, rows = models
+    record = {'Make': 'Cessna', 'Weather.Condition': 'IMC', 'Number.of.Engines': 1}
+
+    result = compare(classifier, record, ['tiny', 'tree', 'narrow'])
+    assert result['ensemble']['members'] == ['tiny', 'tree']
+    assert result['ensemble']['excluded'] == ['narrow']
+    assert 'True' not in result['ensemble']['probabilities']
+    assert result['ensemble']['probabilities'] == compare(classifier, record, ['tiny', 'tree'])['ensemble']['probabilities']
+
+    with pytest.raises(ValueError):
+        compare(classifier, record, 'tiny')
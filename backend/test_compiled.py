@@ -0,0 +1,114 @@
+"""
+Tests for the compiled array evaluators
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import AdaBoostClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from classifier import ModelBundle
+from compiled import LinearEngine, TreeEngine, compile_model
+
+
+def make_data(n_classes):
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 20, size=(400, 5)).astype(float)
+    y = (X[:, 0] + 2 * X[:, 1] + rng.integers(0, 6, 400)) % n_classes
+    return X, y
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+@pytest.mark.parametrize('model', [
+    RandomForestClassifier(n_estimators=15, random_state=0),
+    GradientBoostingClassifier(n_estimators=15, random_state=0),
+    AdaBoostClassifier(n_estimators=10, random_state=0),
+])
+def test_tree_engines_match_predict_proba(model, n_classes):
+    X, y = make_data(n_classes)
+    model.fit(X, y)
+
+    engine = compile_model(model)
+    assert isinstance(engine, TreeEngine)
+    np.testing.assert_allclose(engine.predict_proba(X), model.predict_proba(X), atol=1e-9)
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_linear_engine_fuses_the_scaler(n_classes):
+    X, y = make_data(n_classes)
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(max_iter=500).fit(scaler.transform(X), y)
+
+    engine = compile_model(model, scaler)
+    assert isinstance(engine, LinearEngine) and engine.fuses_scaler
+    np.testing.assert_allclose(engine.predict_proba(X), model.predict_proba(scaler.transform(X)), atol=1e-9)
+
+
+@pytest.mark.parametrize('with_mean,with_std', [(True, True), (False, True), (True, False), (False, False)])
+def test_bundle_scaling_matches_scaler_transform(with_mean, with_std):
+    X, y = make_data(2)
+    X = X + 10
+    scaler = StandardScaler(with_mean=with_mean, with_std=with_std).fit(X)
+    model = LogisticRegression(max_iter=500).fit(scaler.transform(X), y)
+    names = [f'f{i}' for i in range(X.shape[1])]
+
+    expected = model.predict_proba(scaler.transform(X)).max(axis=1) * 100
+    bundle = ModelBundle('scaled', model, scaler, {}, names)
+    np.testing.assert_allclose(bundle.infer(bundle.transform(X))[1], expected)
+
+    # Without the compiled engine the fused multiply-add does the scaling
+    bundle = bundle.without_engine()
+    assert bundle.scale_factor is not None
+    np.testing.assert_allclose(bundle.transform(X), scaler.transform(X), atol=1e-9)
+    np.testing.assert_allclose(bundle.infer(bundle.transform(X))[1], expected)
+
+
+def test_bundle_falls_back_to_a_scaler_that_does_not_match(monkeypatch):
+    X, y = make_data(2)
+    scaler = StandardScaler().fit(X)
+    scaler.mean_ = scaler.mean_ + 1
+    monkeypatch.setattr(scaler, 'transform', lambda matrix: matrix - 1)
+    bundle = ModelBundle('odd', LogisticRegression().fit(X, y), scaler, {}, [f'f{i}' for i in range(X.shape[1])])
+    assert bundle.scale_factor is None
+
+
+def test_bundle_scores_large_batches_with_the_original_estimator():
+    X, y = make_data(3)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    bundle = ModelBundle('forest', model, None, {}, [f'f{i}' for i in range(5)])
+    assert bundle.engine is not None
+
+    calls = []
+    original = model.predict_proba
+    model.predict_proba = lambda matrix: calls.append(len(matrix)) or original(matrix)
+    bundle.infer(X[:1])
+    bundle.infer(X)
+    assert calls == [len(X)]
+
+
+def test_unsupported_models_are_not_compiled():
+    X, y = make_data(2)
+    model = LogisticRegression().fit(X, y)
+    assert compile_model(model, scaler=object()) is None
+
+
+def test_failing_engine_leaves_the_bundle_unchanged():
+    X, y = make_data(2)
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(max_iter=500).fit(scaler.transform(X), y)
+    failed = []
+    bundle = ModelBundle('scaled', model, scaler, {}, [f'f{i}' for i in range(X.shape[1])],
+                         on_engine_failure=failed.append)
+    engine = bundle.engine
+    assert engine.fuses_scaler
+
+    def broken(matrix):
+        raise RuntimeError('broken engine')
+    engine.predict_proba = broken
+
+    # transform() left the scaling to the engine, so the fallback must scale
+    labels, confidences = bundle.infer(bundle.transform(X))
+    np.testing.assert_allclose(confidences, model.predict_proba(scaler.transform(X)).max(axis=1) * 100)
+    assert bundle.engine is engine
+    assert failed == [bundle]
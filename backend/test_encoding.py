@@ -0,0 +1,41 @@
+"""
+Tests for the precompiled categorical encoding tables
+"""
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from encoding import EncodingTable, UNENCODED, compile_encoders
+
+
+def test_table_matches_label_encoder():
+    encoder = LabelEncoder().fit(['VMC', 'IMC', 'UNK'])
+    table = compile_encoders({'Weather.Condition': encoder})['Weather.Condition']
+
+    values = ['IMC', 'VMC', 'UNK', 'VMC']
+    assert table.encode(values).tolist() == encoder.transform(values).tolist()
+    assert table.encode_value('VMC') == encoder.transform(['VMC'])[0]
+
+
+def test_unseen_values_get_stable_unknown_code():
+    table = EncodingTable(['Cessna', 'Piper'])
+
+    codes = table.encode(['Boeing', 'Cessna', 'Airbus'])
+    assert codes.tolist() == [2, 0, 2]
+    # Encoding never grows the table
+    assert len(table) == 2
+    assert table.encode(['Boeing']).tolist() == [2]
+
+
+def test_tables_are_immutable():
+    table = EncodingTable(['A', 'B'])
+    with pytest.raises(AttributeError):
+        table.unknown_code = 5
+    tables = compile_encoders({'Make': LabelEncoder().fit(['A'])})
+    with pytest.raises(TypeError):
+        tables['Make'] = table
+
+
+def test_unencoded_columns_map_to_zero():
+    assert UNENCODED.encode(np.array(['x', 'y'], dtype=object)).tolist() == [0, 0]
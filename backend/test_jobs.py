@@ -0,0 +1,95 @@
+"""
+Tests for asynchronous batch jobs
+"""
+
+import io
+import time
+
+from jobs import JobRunner, JobStore, RESULTS_FILE, summarize
+
+
+def wait_for(store, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = store.load(job_id)
+        if state['status'] not in ('queued', 'running'):
+            return state
+        time.sleep(0.02)
+    raise AssertionError(f'Job {job_id} did not finish')
+
+
+def upload(rows):
+    return io.BytesIO(rows.to_csv(index=False).encode())
+
+
+def test_job_scores_every_row_and_pages_results(tmp_path, tiny_model):
+    classifier, rows = tiny_model
+    store = JobStore(str(tmp_path / 'jobs'))
+    runner = JobRunner(classifier, store).start()
+
+    state = runner.submit(upload(rows), 'rows.csv', chunk_size=30)
+    state = wait_for(store, state['id'])
+    assert state['status'] == 'completed'
+    assert state['rows_done'] == state['total_rows'] == len(rows)
+    assert summarize(state)['progress'] == 1.0
+
+    expected, _ = classifier.predict_batch(rows.copy(), 'tiny')
+    page = store.read_results(state, offset=45, limit=20)
+    assert [row['row_index'] for row in page] == list(range(45, 65))
+    assert [row['prediction'] for row in page] == list(expected[45:65])
+    assert store.read_results(state, offset=len(rows)) == []
+
+    downloaded = b''.join(store.iter_results_file(state)).decode().splitlines()
+    assert downloaded[0] == 'row_index,prediction,confidence'
+    assert len(downloaded) == len(rows) + 1
+
+
+def test_rows_without_feature_columns_get_result_lines(tmp_path, tiny_model):
+    classifier, rows = tiny_model
+    store = JobStore(str(tmp_path / 'jobs'))
+    runner = JobRunner(classifier, store).start()
+
+    state = wait_for(store, runner.submit(upload(rows[['Ignored']]), 'rows.csv', chunk_size=30)['id'])
+    assert state['status'] == 'completed'
+    assert state['rows_done'] == len(rows)
+    downloaded = b''.join(store.iter_results_file(state)).decode().splitlines()
+    assert len(downloaded) == len(rows) + 1
+    page = store.read_results(state, offset=95, limit=10)
+    assert [row['row_index'] for row in page] == list(range(95, 105))
+
+
+def test_interrupted_job_resumes_from_last_chunk(tmp_path, tiny_model):
+    classifier, rows = tiny_model
+    store = JobStore(str(tmp_path / 'jobs'))
+    runner = JobRunner(classifier, store)
+    state = runner.submit(upload(rows), 'rows.csv', chunk_size=50)
+
+    # Pretend a previous process finished two chunks, then died mid-write
+    expected, _ = classifier.predict_batch(rows.copy(), 'tiny')
+    with open(store.path(state['id'], RESULTS_FILE), 'wb') as f:
+        f.write(b'row_index,prediction,confidence\n')
+        offsets = []
+        for index in range(100):
+            f.write(f'{index},{expected[index]},0.5\n'.encode())
+            if index % 50 == 49:
+                offsets.append(f.tell())
+        f.write(b'100,garb')
+    store.update(state['id'], status='running', total_rows=len(rows), rows_done=100, chunks_done=2,
+                 chunk_offsets=offsets, chunk_rows=[50, 100], result_bytes=offsets[-1])
+
+    JobRunner(classifier, store).start()
+    state = wait_for(store, state['id'])
+    assert state['status'] == 'completed' and state['attempts'] == 1
+    results = store.read_results(state, limit=len(rows))
+    assert [row['row_index'] for row in results] == list(range(len(rows)))
+    assert [row['prediction'] for row in results] == list(expected)
+
+
+def test_cancel_removes_job(tmp_path, tiny_model):
+    classifier, rows = tiny_model
+    store = JobStore(str(tmp_path / 'jobs'))
+    runner = JobRunner(classifier, store)
+
+    state = runner.submit(upload(rows), 'rows.csv')
+    assert runner.cancel(state['id'])['status'] == 'cancelled'
+    assert store.list() == []
@@ -0,0 +1,31 @@
+"""
+Tests for the Prometheus metrics rendering
+"""
+
+from metrics import Counter, Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage='predict')
+    histogram.observe(0.5, stage='predict')
+    histogram.observe(5.0, stage='predict')
+
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{stage="predict",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="predict",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="predict",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="predict"} 3' in lines
+
+
+def test_counter_label_values_are_escaped():
+    counter = Counter('requests_total', 'Requests', ('endpoint',))
+    counter.inc(endpoint='/api/"x"')
+    assert 'requests_total{endpoint="/api/\\"x\\""} 1' in counter.render()
+
+
+def test_registry_renders_extra_values():
+    registry = MetricsRegistry()
+    text = registry.render({'cache_hits_total': ('Hits', 3, 'counter'), 'entries': ('Entries', 7)})
+    assert '# TYPE cache_hits_total counter\ncache_hits_total 3' in text
+    assert '# TYPE entries gauge\nentries 7' in text
@@ -0,0 +1,84 @@
+"""
+Tests for multi-process batch scoring
+"""
+
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics import STAGE_SECONDS
+from parallel import ParallelScorer
+
+pytestmark = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                                reason='requires the fork start method')
+
+
+def test_parallel_results_keep_row_order(tiny_model):
+    classifier, rows = tiny_model
+    classifier.result_cache.max_entries = 0
+    frame = pd.concat([rows] * 3, ignore_index=True)
+    serial_labels, serial_confidences = classifier.predict_batch(frame)
+
+    classifier.parallel = ParallelScorer(classifier, workers=3, min_rows=10)
+    try:
+        labels, confidences = classifier.predict_batch(frame)
+    finally:
+        classifier.parallel.close()
+
+    assert labels.tolist() == serial_labels.tolist()
+    np.testing.assert_allclose(confidences, serial_confidences)
+
+
+def run_in_thread(function, timeout=60):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, 'parallel scoring did not finish'
+    return result[0]
+
+
+def test_workers_forked_while_locks_are_held_do_not_deadlock(tiny_model):
+    classifier, rows = tiny_model
+    bundle = classifier.get_bundle()
+    encoded = classifier.preprocess_data(rows, bundle, scale=False)
+    expected = bundle.infer(bundle.transform(encoded))
+
+    scorer = ParallelScorer(classifier, workers=2, min_rows=10)
+    locks = [STAGE_SECONDS._lock, classifier.registry._lock, classifier.result_cache._lock]
+    for lock in locks:
+        lock.acquire()
+    try:
+        labels, confidences = run_in_thread(lambda: scorer.infer(bundle, encoded))
+    finally:
+        for lock in locks:
+            lock.release()
+        scorer.close()
+    assert labels.tolist() == expected[0].tolist()
+    np.testing.assert_allclose(confidences, expected[1])
+
+
+def test_a_model_changed_since_the_fork_is_scored_in_process(tiny_model, caplog):
+    classifier, rows = tiny_model
+    scorer = ParallelScorer(classifier, workers=2, min_rows=10)
+    encoded = classifier.preprocess_data(rows, scale=False)
+    try:
+        scorer.infer(classifier.get_bundle(), encoded)
+
+        # Loaded after the fork, then replaced on disk again
+        path = os.path.join(classifier.models_directory, 'tiny.pkl')
+        os.utime(path, ns=(1, 1))
+        snapshot = classifier.registry.get('tiny')
+        os.utime(path, ns=(2 * 10**9, 2 * 10**9))
+        assert classifier.model_fingerprint('tiny') != snapshot.fingerprint
+
+        with caplog.at_level('INFO', logger='parallel'):
+            labels, _ = run_in_thread(lambda: scorer.infer(snapshot, encoded))
+    finally:
+        scorer.close()
+    assert 'changed on disk' in caplog.text
+    assert labels.tolist() == snapshot.infer(snapshot.transform(encoded))[0].tolist()
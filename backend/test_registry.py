@@ -0,0 +1,57 @@
+"""
+Tests for the LRU model registry
+"""
+
+import pytest
+
+from registry import ModelRegistry
+
+
+class FakeBundle:
+    def __init__(self, name, size_bytes):
+        self.name = name
+        self.size_bytes = size_bytes
+
+
+def make_registry(max_bytes, versions):
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        return FakeBundle(name, 10)
+
+    return ModelRegistry(loader, versions.get, max_bytes=max_bytes), loads
+
+
+def test_models_stay_resident_until_budget_exceeded():
+    versions = {'rf': 1, 'xgb': 1, 'logreg': 1}
+    registry, loads = make_registry(25, versions)
+
+    rf = registry.get('rf')
+    registry.get('xgb')
+    assert registry.get('rf') is rf
+    assert loads == ['rf', 'xgb']
+
+    # Third model pushes the least recently used one (xgb) out
+    registry.get('logreg')
+    assert registry.resident() == ['rf', 'logreg']
+    assert registry.evictions == 1
+
+
+def test_changed_file_is_reloaded():
+    versions = {'rf': 1}
+    registry, loads = make_registry(100, versions)
+
+    first = registry.get('rf')
+    versions['rf'] = 2
+    second = registry.get('rf')
+
+    assert first is not second
+    assert loads == ['rf', 'rf']
+    assert registry.resident() == ['rf']
+
+
+def test_missing_model_raises():
+    registry, _ = make_registry(100, {})
+    with pytest.raises(KeyError):
+        registry.get('nope')
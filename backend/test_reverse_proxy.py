@@ -0,0 +1,149 @@
+"""
+Tests for the reverse proxy against a local upstream server
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import reverseProxy
+from server import AsyncServer, BoundedExecutor
+
+
+upstream_calls = Counter()
+
+
+def upstream_app(environ, start_response):
+    upstream_calls[environ['PATH_INFO']] += 1
+    if environ['PATH_INFO'] == '/api/features':
+        time.sleep(0.2)
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    headers = {key: value for key, value in environ.items() if key.startswith('HTTP_')}
+    payload = json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'path': environ['PATH_INFO'],
+        'query': environ['QUERY_STRING'],
+        'body': body.decode('latin-1'),
+        'headers': headers,
+        'client_port': environ.get('REMOTE_PORT'),
+    }).encode()
+    headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(payload))),
+               ('Keep-Alive', 'timeout=5')]
+    if environ['PATH_INFO'].startswith('/api/model/'):
+        headers.append(('X-Cache-Invalidate', '/api/models, /api/features'))
+    start_response('200 OK', headers)
+    return [payload]
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # The async server keeps connections alive, unlike werkzeug's dev server
+    loop = asyncio.new_event_loop()
+    server = AsyncServer(upstream_app, BoundedExecutor(2, 2))
+    listener = loop.run_until_complete(asyncio.start_server(server.handle, '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(reverseProxy, 'FLASK_API_URL', f'http://127.0.0.1:{listener.sockets[0].getsockname()[1]}')
+    upstream_calls.clear()
+    reverseProxy.cache.clear()
+    yield
+
+    async def stop():
+        listener.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    reverseProxy.session.close()
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    server.executor.shutdown()
+
+
+def test_request_body_is_forwarded_as_raw_bytes(upstream):
+    client = reverseProxy.app.test_client()
+    raw = b'{"Make": "Cessna",  "Number.of.Engines": 1}'
+    response = client.post('/api/predict?model=tiny', data=raw, content_type='application/json',
+                           headers={'Connection': 'keep-alive, X-Private', 'X-Private': 'secret'})
+
+    echoed = response.get_json()
+    assert echoed['body'] == raw.decode()
+    assert echoed['path'] == '/api/predict' and echoed['query'] == 'model=tiny'
+    assert 'HTTP_X_PRIVATE' not in echoed['headers']
+    assert 'HTTP_X_FORWARDED_FOR' in echoed['headers']
+    assert 'Keep-Alive' not in response.headers
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+
+def test_upstream_connections_are_reused(upstream):
+    client = reverseProxy.app.test_client()
+    ports = {client.post('/api/predict', json={}).get_json()['client_port'] for _ in range(5)}
+    assert len(ports) == 1
+
+
+def test_metadata_is_cached_and_revalidated(upstream):
+    client = reverseProxy.app.test_client()
+    first = client.get('/api/features')
+    second = client.get('/api/features')
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('MISS', 'HIT')
+    assert second.data == first.data and upstream_calls['/api/features'] == 1
+
+    revalidated = client.get('/api/features', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304 and revalidated.data == b''
+
+
+def test_model_list_is_never_cached(upstream):
+    client = reverseProxy.app.test_client()
+    responses = [client.get('/api/models') for _ in range(2)]
+    assert all('X-Cache' not in response.headers for response in responses)
+    assert upstream_calls['/api/models'] == 2
+
+
+def test_only_fingerprinted_frontend_assets_are_cached(upstream, monkeypatch):
+    monkeypatch.setattr(reverseProxy, 'REACT_DEV_SERVER_URL', reverseProxy.FLASK_API_URL)
+    client = reverseProxy.app.test_client()
+    for path in ('/static/js/bundle.js', '/', '/favicon.ico', '/static/js/main.3f9a1c2e.chunk.js'):
+        responses = [client.get(path) for _ in range(2)]
+        assert [response.status_code for response in responses] == [200, 200]
+
+    assert upstream_calls['/static/js/bundle.js'] == 2
+    assert upstream_calls['/'] == 2
+    assert upstream_calls['/favicon.ico'] == 2
+    assert upstream_calls['/static/js/main.3f9a1c2e.chunk.js'] == 1
+
+
+def test_model_switch_invalidates_metadata(upstream):
+    client = reverseProxy.app.test_client()
+    client.get('/api/features')
+    switched = client.post('/api/model/other')
+    assert 'X-Cache-Invalidate' not in switched.headers
+    assert client.get('/api/features').headers['X-Cache'] == 'MISS'
+    assert upstream_calls['/api/features'] == 2
+
+
+def test_concurrent_misses_share_one_upstream_call(upstream):
+    states = []
+
+    def fetch():
+        states.append(reverseProxy.app.test_client().get('/api/features').headers['X-Cache'])
+
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert upstream_calls['/api/features'] == 1
+    assert sorted(states) == ['MISS'] + ['SHARED'] * 4
+
+
+def test_unreachable_backend_returns_503(monkeypatch):
+    monkeypatch.setattr(reverseProxy, 'FLASK_API_URL', 'http://127.0.0.1:9')
+    response = reverseProxy.app.test_client().get('/api/models')
+    assert response.status_code == 503
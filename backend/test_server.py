@@ -0,0 +1,145 @@
+"""
+Tests for the async serving mode, against small WSGI apps
+"""
+
+import asyncio
+import threading
+
+import server
+from server import AsyncServer, BoundedExecutor
+
+
+def hello_app(environ, start_response):
+    body = environ['wsgi.input'].read() or environ['PATH_INFO'].encode()
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [body]
+
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return (part for part in (b'one,', b'two,', b'three'))
+
+
+async def exchange(port, raw):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return data
+
+
+def run_with_server(app, client, threads=2, max_queue=2):
+    async def main():
+        server = AsyncServer(app, BoundedExecutor(threads, max_queue))
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            try:
+                return await client(port)
+            finally:
+                server.executor.shutdown()
+    return asyncio.run(main())
+
+
+def test_keep_alive_and_request_body():
+    async def client(port):
+        return await exchange(port, b'GET /first HTTP/1.1\r\nHost: x\r\n\r\n'
+                                    b'POST /second HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n'
+                                    b'Connection: close\r\n\r\nhello')
+
+    data = run_with_server(hello_app, client)
+    assert data.count(b'HTTP/1.1 200 OK') == 2
+    assert b'Content-Length: 6\r\n' in data and data.split(b'\r\n\r\n')[1].startswith(b'/first')
+    assert data.endswith(b'hello')
+
+
+def test_chunked_request_and_streamed_response():
+    async def client(port):
+        return await exchange(port, b'POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n'
+                                    b'Connection: close\r\n\r\n3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n')
+
+    assert run_with_server(hello_app, client).endswith(b'abcde')
+
+    async def stream_client(port):
+        return await exchange(port, b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+
+    data = run_with_server(streaming_app, stream_client)
+    assert b'Transfer-Encoding: chunked' in data
+    assert data.split(b'\r\n\r\n', 1)[1] == b'4\r\none,\r\n4\r\ntwo,\r\n5\r\nthree\r\n0\r\n\r\n'
+
+
+def test_requests_beyond_capacity_get_429():
+    release = threading.Event()
+
+    def blocking_app(environ, start_response):
+        release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'done']
+
+    async def client(port):
+        request = b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+        busy = [asyncio.create_task(exchange(port, request)) for _ in range(2)]
+        await asyncio.sleep(0.2)
+        rejected = await exchange(port, request)
+        release.set()
+        return rejected, await asyncio.gather(*busy)
+
+    rejected, served = run_with_server(blocking_app, client, threads=1, max_queue=1)
+    assert rejected.startswith(b'HTTP/1.1 429') and b'Retry-After: 1' in rejected
+    assert all(response.endswith(b'done') for response in served)
+
+
+def test_invalid_lengths_are_rejected():
+    async def client(port):
+        responses = []
+        for length in (b'-5', b'+5', b'5_0', b'abc'):
+            responses.append(await exchange(port, b'POST / HTTP/1.1\r\nHost: x\r\nContent-Length: ' + length +
+                                            b'\r\n\r\nhello'))
+        responses.append(await exchange(port, b'POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                              b'-3\r\nabc\r\n0\r\n\r\n'))
+        return responses
+
+    for response in run_with_server(hello_app, client):
+        assert response.startswith(b'HTTP/1.1 400')
+
+
+def test_ambiguous_body_framing_is_rejected():
+    requests = [
+        b'Content-Length: 5\r\nContent-Length: 5\r\n\r\nhello',
+        b'Content-Length: 5\r\nContent-Length: 0\r\n\r\nhello',
+        b'Content-Length: 5\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n',
+        b'Transfer-Encoding: chunked\r\nContent-Length: 5\r\n\r\n5\r\nhello\r\n0\r\n\r\n',
+        b'Content-Length : 5\r\n\r\nhello',
+    ]
+
+    async def client(port):
+        return [await exchange(port, b'POST / HTTP/1.1\r\nHost: x\r\n' + raw) for raw in requests]
+
+    for response in run_with_server(hello_app, client):
+        assert response.startswith(b'HTTP/1.1 400')
+
+
+def test_transfer_codings_other_than_chunked_are_refused():
+    async def client(port):
+        return [await exchange(port, b'POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: ' + coding +
+                               b'\r\n\r\n5\r\nhello\r\n0\r\n\r\n')
+                for coding in (b'xchunked', b'gzip, chunked')]
+
+    for response in run_with_server(hello_app, client):
+        assert response.startswith(b'HTTP/1.1 501')
+
+
+def test_stalled_chunked_body_times_out(monkeypatch):
+    monkeypatch.setattr(server, 'READ_TIMEOUT', 0.2)
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # The chunk's trailing CRLF never arrives
+        writer.write(b'POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc')
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return data
+
+    assert run_with_server(hello_app, client) == b''
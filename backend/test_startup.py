@@ -0,0 +1,65 @@
+"""
+Tests for background start-up and readiness
+"""
+
+import numpy as np
+import pytest
+
+from startup import ModelService, NotReady
+
+
+def wait_until_finished(service):
+    service._thread.join(30)
+    assert not service._thread.is_alive()
+
+
+def test_service_loads_and_warms_the_default_model(tmp_path, tiny_model):
+    service = ModelService(models_directory=str(tmp_path), parallel_workers=0, coalesce_window_ms=0,
+                           jobs_directory=str(tmp_path / 'jobs'))
+    with pytest.raises(NotReady):
+        service.get(timeout=0)
+
+    service.start()
+    wait_until_finished(service)
+
+    status = service.status()
+    assert status['ready'] and status['current_model'] == 'tiny'
+    assert set(status['stage_seconds']) == {'import', 'load', 'warmup'}
+    assert status['ready_seconds'] > 0
+    assert service.get().current_model_name == 'tiny'
+
+
+def test_service_without_models_is_live_but_not_ready(tmp_path):
+    service = ModelService(models_directory=str(tmp_path), parallel_workers=0, coalesce_window_ms=0,
+                           jobs_directory=str(tmp_path / 'jobs')).start()
+    wait_until_finished(service)
+
+    assert not service.ready
+    assert service.status()['state'] == 'no_model'
+    assert service.get().get_available_models() == []
+
+
+class BrokenModel:
+    classes_ = np.array(['Minor', 'Substantial'], dtype=object)
+    n_features_in_ = 3
+
+    def predict_proba(self, X):
+        raise RuntimeError('broken')
+
+    predict = predict_proba
+
+
+def test_models_are_warmed_before_they_become_the_default(tmp_path, tiny_model):
+    service = ModelService(models_directory=str(tmp_path), parallel_workers=0, coalesce_window_ms=0,
+                           jobs_directory=str(tmp_path / 'jobs')).start()
+    wait_until_finished(service)
+    classifier = service.get()
+    assert classifier.save_model('copy', classifier.model, label_encoders=classifier.label_encoders)
+    assert classifier.save_model('broken', BrokenModel(), label_encoders=classifier.label_encoders)
+
+    assert classifier.registry.get('copy').warmed is False
+    assert classifier.switch_model('copy')
+    assert classifier.bundle.warmed and service.ready
+
+    assert not classifier.switch_model('broken')
+    assert classifier.current_model_name == 'copy' and service.ready
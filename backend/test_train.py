@@ -0,0 +1,70 @@
+"""
+Tests for the training pipeline
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from classifier import AviationClassifier
+from train import CATEGORICAL_FEATURES, NUMERIC_COLUMNS, TARGET, main, variance_inflation_factors
+
+
+def write_raw_data(path, n_rows=400):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({column: rng.choice(['A', 'B', 'C'], n_rows) for column in CATEGORICAL_FEATURES})
+    frame['Location'] = rng.choice(['Zürich, ZH', 'Montréal, QC', 'Austin, TX'], n_rows)
+    frame['Weather.Condition'] = rng.choice(['VMC', 'IMC', None], n_rows)
+    for column in NUMERIC_COLUMNS:
+        frame[column] = rng.integers(0, 4, n_rows).astype(float)
+    frame.loc[::17, 'Number.of.Engines'] = np.nan
+    frame[TARGET] = np.where(frame['Weather.Condition'] == 'IMC', 'Destroyed', 'Substantial')
+    frame.loc[::50, TARGET] = 'Unknown'
+    frame['Event.Id'] = range(n_rows)
+    frame.to_csv(path, index=False, encoding='windows-1252')
+
+
+def test_vif_matches_regression_on_the_other_columns():
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(300, 4))
+    matrix[:, 3] = matrix[:, 0] + 0.5 * matrix[:, 1] + rng.normal(scale=0.3, size=300)
+
+    expected = []
+    for i in range(matrix.shape[1]):
+        others = np.column_stack([np.ones(len(matrix)), np.delete(matrix, i, axis=1)])
+        coefficients = np.linalg.lstsq(others, matrix[:, i], rcond=None)[0]
+        residual = matrix[:, i] - others @ coefficients
+        r_squared = 1 - residual.var() / matrix[:, i].var()
+        expected.append(1 / (1 - r_squared))
+    np.testing.assert_allclose(variance_inflation_factors(matrix), expected, rtol=1e-8)
+
+    matrix[:, 2] = 5.0
+    assert np.isinf(variance_inflation_factors(matrix)[2])
+
+
+def test_pipeline_saves_servable_models_and_reuses_cached_stages(tmp_path, capsys):
+    data = tmp_path / 'AviationData.csv'
+    write_raw_data(data)
+    argv = [str(data), '--output', str(tmp_path / 'models'), '--cache-dir', str(tmp_path / 'cache'),
+            '--models', 'logistic_regression', 'decision_tree', '--cv', '2', '--jobs', '1']
+
+    assert main(argv) == 0
+    first = json.loads(capsys.readouterr().out)
+    assert first['cache']['hits'] == []
+    assert set(first['models']) == {'logistic_regression', 'decision_tree'}
+
+    assert main(argv + ['--percentile', '100']) == 0
+    second = json.loads(capsys.readouterr().out)
+    assert second['cache']['hits'] == ['read', 'clean']
+    assert second['rows']['filtered'] == second['rows']['cleaned']
+
+    assert main(argv) == 0
+    third = json.loads(capsys.readouterr().out)
+    assert third['cache']['misses'] == []
+    assert third['models'] == first['models']
+
+    classifier = AviationClassifier(models_directory=str(tmp_path / 'models'), load_default=False)
+    assert classifier.load_model('logistic_regression')
+    result = classifier.predict({'Weather.Condition': 'IMC', 'Location': 'Zürich, ZH'})
+    assert result['prediction'] in ('Destroyed', 'Substantial')
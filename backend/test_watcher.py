@@ -0,0 +1,61 @@
+"""
+Tests for atomic model swaps and the models-directory watcher
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from watcher import ModelWatcher
+
+
+def test_watcher_swaps_in_changed_model_after_it_settles(tmp_path, tiny_model, save_tree):
+    classifier, rows = tiny_model
+    watcher = ModelWatcher(classifier, interval=3600).start()
+    old = classifier.get_bundle()
+    record = {'Make': 'Cessna', 'Weather.Condition': 'IMC', 'Number.of.Engines': 1}
+    assert classifier.predict(record)['prediction'] == 'Substantial'
+
+    save_tree('tiny', np.where(rows['Weather.Condition'] == 'IMC', 'Minor', 'Substantial'))
+    assert watcher.poll() == []
+    assert classifier.get_bundle() is old
+    assert watcher.poll() == ['tiny']
+    assert classifier.get_bundle() is not old
+    assert classifier.predict(record)['prediction'] == 'Minor'
+    # A request still holding the old snapshot keeps its own model
+    assert old.infer(old.encode_record(record))[0][0] == 'Substantial'
+
+    current = classifier.get_bundle()
+    with open(os.path.join(tmp_path, 'tiny.pkl'), 'wb') as f:
+        f.write(b'not a pickle')
+    watcher.poll()
+    assert watcher.poll() == []
+    assert watcher.failures == 1
+    assert classifier.get_bundle() is current
+    watcher.stop()
+
+
+def test_requests_never_see_a_mixed_model(tiny_model, save_tree):
+    classifier, rows = tiny_model
+    # A second model with a different feature layout
+    save_tree('narrow', rows['Make'] == 'Boeing', features=['Make'])
+
+    errors = []
+    stop = threading.Event()
+
+    def predict():
+        while not stop.is_set():
+            result = classifier.predict({'Make': 'Boeing', 'Weather.Condition': 'IMC', 'Number.of.Engines': 2})
+            if 'error' in result:
+                errors.append(result['error'])
+
+    threads = [threading.Thread(target=predict) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(200):
+        assert classifier.load_model('narrow' if i % 2 else 'tiny')
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
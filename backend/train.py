@@ -0,0 +1,364 @@
+"""
+Training pipeline for the aviation damage models.
+
+Replaces the training notebook with one command:
+
+    python train.py data/AviationData.csv --output models
+    python train.py data/AviationData.csv --models random_forest gradient_boosting --jobs 4
+
+The data preparation stages (read, clean, filter, select) each write their
+output as Parquet into a cache directory, under a key made from the hash
+of the input file and every parameter of that stage and the stages before
+it. A re-run with the same inputs reads the cached frames instead of
+parsing the CSV again, and changing one parameter only re-runs the stages
+from there on. Best hyperparameters of each search are cached the same way.
+
+Cleaning mirrors what AviationClassifier.preprocess_data does at serving
+time: missing categorical values become 'Unknown' and numeric values are
+coerced with missing values as 0, so training and serving see the same
+encodings. Feature selection drops features whose variance inflation
+factor is above a threshold, computed for all features at once from the
+inverse of their correlation matrix. Searches run GridSearchCV across
+--jobs processes, and every trained model is saved with its scaler, label
+encoders and feature names through AviationClassifier.save_model.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from classifier import AviationClassifier
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRECTORY = os.environ.get('TRAIN_CACHE_DIRECTORY', '.train_cache')
+TARGET = 'Aircraft.damage'
+CATEGORICAL_FEATURES = [
+    'Investigation.Type', 'Location', 'Country', 'Injury.Severity',
+    'Aircraft.Category', 'Make', 'Amateur.Built', 'Engine.Type',
+    'Purpose.of.flight', 'Weather.Condition', 'Broad.phase.of.flight'
+]
+NUMERIC_COLUMNS = [
+    'Number.of.Engines', 'Total.Fatal.Injuries', 'Total.Serious.Injuries',
+    'Total.Minor.Injuries', 'Total.Uninjured'
+]
+FEATURES = CATEGORICAL_FEATURES + NUMERIC_COLUMNS
+
+# Model name -> (estimator factory, parameter grid, needs a scaler)
+MODELS = {
+    'logistic_regression': (
+        lambda seed: LogisticRegression(class_weight='balanced', max_iter=1000, random_state=seed),
+        {'C': [0.1, 1.0, 10.0]},
+        True,
+    ),
+    'decision_tree': (
+        lambda seed: DecisionTreeClassifier(random_state=seed),
+        {'criterion': ['gini', 'entropy'], 'max_depth': [5, 10, 15, 20], 'min_samples_split': [5, 10]},
+        False,
+    ),
+    'random_forest': (
+        lambda seed: RandomForestClassifier(random_state=seed, n_jobs=1),
+        {'n_estimators': [100, 300], 'max_depth': [None, 10, 15], 'min_samples_split': [5, 10]},
+        False,
+    ),
+    'gradient_boosting': (
+        lambda seed: GradientBoostingClassifier(random_state=seed),
+        {'learning_rate': [0.1, 0.01], 'n_estimators': [200, 500], 'max_depth': [3, 5]},
+        False,
+    ),
+}
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Parquet frames and JSON metadata of pipeline stages, keyed by their inputs"""
+
+    def __init__(self, directory=CACHE_DIRECTORY):
+        self.directory = directory
+        self.hits = []
+        self.misses = []
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(stage, parent, **params):
+        """Key of a stage from its parent's key and its own parameters"""
+        payload = json.dumps({'stage': stage, 'parent': parent, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+    def _path(self, stage, key, suffix):
+        return os.path.join(self.directory, f'{stage}-{key}{suffix}')
+
+    def _publish(self, path, write):
+        # Write under a temporary name so an interrupted run leaves no partial entry
+        staging = f'{path}.tmp'
+        write(staging)
+        os.replace(staging, path)
+
+    def frame(self, stage, key, build):
+        """Return (frame, metadata) of a stage, calling ``build`` only on a miss"""
+        frame_path = self._path(stage, key, '.parquet')
+        meta_path = self._path(stage, key, '.json')
+        if os.path.exists(frame_path) and os.path.exists(meta_path):
+            self.hits.append(stage)
+            logger.info("Stage %s: cached (%s)", stage, key)
+            with open(meta_path) as f:
+                return pd.read_parquet(frame_path), json.load(f)
+
+        self.misses.append(stage)
+        start = time.perf_counter()
+        frame, meta = build()
+        logger.info("Stage %s: built in %.2fs (%d rows)", stage, time.perf_counter() - start, len(frame))
+        self._publish(frame_path, lambda path: frame.to_parquet(path, index=False))
+        self._publish(meta_path, lambda path: self._write_json(path, meta))
+        return frame, meta
+
+    def value(self, stage, key, build):
+        """Return a JSON-serializable result of a stage, calling ``build`` only on a miss"""
+        path = self._path(stage, key, '.json')
+        if os.path.exists(path):
+            self.hits.append(stage)
+            logger.info("Stage %s: cached (%s)", stage, key)
+            with open(path) as f:
+                return json.load(f)
+
+        self.misses.append(stage)
+        start = time.perf_counter()
+        value = build()
+        logger.info("Stage %s: built in %.2fs", stage, time.perf_counter() - start)
+        self._publish(path, lambda staging: self._write_json(staging, value))
+        return value
+
+    @staticmethod
+    def _write_json(path, value):
+        with open(path, 'w') as f:
+            json.dump(value, f, indent=2, default=str)
+
+
+def read_data(path, encoding, columns):
+    """Read the columns needed for training from the raw CSV"""
+    wanted = set(columns)
+    frame = pd.read_csv(path, encoding=encoding, usecols=lambda column: column in wanted, low_memory=False)
+    missing = wanted - set(frame.columns)
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(sorted(missing))}")
+    return frame[list(columns)], {'rows': len(frame)}
+
+
+def clean_data(frame, title_case=False):
+    """Normalize values the way the API does before encoding"""
+    frame = frame.copy()
+    for column in CATEGORICAL_FEATURES:
+        values = frame[column].fillna('Unknown').astype(str)
+        frame[column] = values.str.title() if title_case else values
+    for column in NUMERIC_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0)
+
+    target = frame[TARGET].astype(str).where(frame[TARGET].notna(), '').str.strip().str.title()
+    keep = ~target.isin(['', 'Unknown', 'Unk'])
+    frame[TARGET] = target
+    frame = frame[keep].reset_index(drop=True)
+    return frame, {'rows': len(frame), 'dropped_without_target': int((~keep).sum())}
+
+
+def filter_outliers(frame, percentile):
+    """Drop rows above the given percentile of each numeric column, one column after another"""
+    rows = len(frame)
+    if percentile < 100:
+        for column in NUMERIC_COLUMNS:
+            threshold = np.percentile(frame[column], percentile)
+            frame = frame[frame[column] <= threshold]
+    frame = frame.reset_index(drop=True)
+    return frame, {'rows': len(frame), 'dropped_outliers': rows - len(frame)}
+
+
+def fit_encoders(frame):
+    return {column: LabelEncoder().fit(frame[column]) for column in CATEGORICAL_FEATURES if column in frame}
+
+
+def encoders_from_classes(classes):
+    encoders = {}
+    for column, values in classes.items():
+        encoder = LabelEncoder()
+        encoder.classes_ = np.asarray(values, dtype=object)
+        encoders[column] = encoder
+    return encoders
+
+
+def variance_inflation_factors(matrix):
+    """VIF of every column of ``matrix`` at once
+
+    The diagonal of the inverse correlation matrix is 1 / (1 - R^2) of each
+    column regressed on all the others. Constant columns get infinity.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    spread = matrix.std(axis=0)
+    varying = spread > 0
+    vif = np.full(matrix.shape[1], np.inf)
+    if varying.sum() == 1:
+        vif[varying] = 1.0
+    elif varying.any():
+        correlation = np.atleast_2d(np.corrcoef(matrix[:, varying], rowvar=False))
+        # pinv keeps perfectly collinear columns from raising; they come out huge
+        inverse = np.linalg.pinv(correlation, hermitian=True)
+        vif[varying] = np.maximum(np.diag(inverse), 1.0)
+    return vif
+
+
+def select_features(frame, threshold):
+    """Label-encode the features and keep those with a VIF below ``threshold``"""
+    encoders = fit_encoders(frame)
+    encoded = pd.DataFrame({
+        column: encoders[column].transform(frame[column]) if column in encoders else frame[column].to_numpy()
+        for column in FEATURES
+    })
+    vif = variance_inflation_factors(encoded.to_numpy(dtype=np.float64))
+    selected = [column for column, score in zip(FEATURES, vif) if score < threshold]
+    if not selected:
+        raise ValueError(f'No feature has a VIF below {threshold}')
+    for column, score in zip(FEATURES, vif):
+        logger.info("VIF %-24s %10.3f%s", column, score, '' if score < threshold else '  dropped')
+
+    encoded = encoded[selected]
+    encoded[TARGET] = frame[TARGET].to_numpy()
+    meta = {
+        'vif': {column: (None if np.isinf(score) else float(score)) for column, score in zip(FEATURES, vif)},
+        'selected': selected,
+        'classes': {column: encoders[column].classes_.tolist() for column in selected if column in encoders},
+    }
+    return encoded, meta
+
+
+def search(name, X, y, cv, jobs, seed):
+    """Grid-search one model kind, returning its best parameters and CV score"""
+    factory, grid, scaled = MODELS[name]
+    if scaled:
+        X = StandardScaler().fit_transform(X)
+    grid_search = GridSearchCV(factory(seed), grid, cv=cv, n_jobs=jobs, scoring='f1_weighted')
+    grid_search.fit(X, y)
+    return {'params': grid_search.best_params_, 'cv_score': float(grid_search.best_score_)}
+
+
+def fit_final(name, params, X, y, seed):
+    """Fit a model with the chosen parameters, returning (model, scaler)"""
+    factory, _, scaled = MODELS[name]
+    scaler = StandardScaler().fit(X) if scaled else None
+    model = factory(seed).set_params(**params)
+    model.fit(scaler.transform(X) if scaler is not None else X, y)
+    return model, scaler
+
+
+def run(args):
+    """Run the pipeline and return a report of every stage and model"""
+    cache = StageCache(args.cache_dir)
+    started = time.perf_counter()
+
+    key = cache.key('read', file_hash(args.data), encoding=args.encoding, columns=FEATURES + [TARGET])
+    raw, _ = cache.frame('read', key, lambda: read_data(args.data, args.encoding, FEATURES + [TARGET]))
+
+    key = cache.key('clean', key, title_case=args.title_case)
+    cleaned, clean_meta = cache.frame('clean', key, lambda: clean_data(raw, args.title_case))
+
+    key = cache.key('filter', key, percentile=args.percentile)
+    filtered, filter_meta = cache.frame('filter', key, lambda: filter_outliers(cleaned, args.percentile))
+
+    key = cache.key('select', key, threshold=args.vif_threshold)
+    encoded, selection = cache.frame('select', key, lambda: select_features(filtered, args.vif_threshold))
+
+    features = selection['selected']
+    X = encoded[features].to_numpy(dtype=np.float64)
+    y = encoded[TARGET].to_numpy()
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=args.test_size, random_state=args.seed, stratify=y)
+
+    saver = AviationClassifier(models_directory=args.output, load_default=False)
+    encoders = encoders_from_classes(selection['classes'])
+
+    report = {
+        'data': args.data,
+        'rows': {'cleaned': clean_meta['rows'], 'filtered': filter_meta['rows'], 'train': len(X_train),
+                 'test': len(X_test)},
+        'features': features,
+        'vif': selection['vif'],
+        'models': {},
+    }
+    for name in args.models:
+        search_key = cache.key(f'search-{name}', key, test_size=args.test_size, cv=args.cv, seed=args.seed,
+                               grid=MODELS[name][1])
+        best = cache.value(f'search-{name}', search_key,
+                           lambda: search(name, X_train, y_train, args.cv, args.jobs, args.seed))
+        model, scaler = fit_final(name, best['params'], X_train, y_train, args.seed)
+        predicted = model.predict(scaler.transform(X_test) if scaler is not None else X_test)
+
+        if not saver.save_model(name, model, scaler=scaler, label_encoders=encoders, format=args.format,
+                                feature_names=features):
+            raise RuntimeError(f'Could not save model {name}')
+        report['models'][name] = {
+            'params': best['params'],
+            'cv_score': best['cv_score'],
+            'test_accuracy': float(accuracy_score(y_test, predicted)),
+            'test_f1_weighted': float(f1_score(y_test, predicted, average='weighted')),
+        }
+        logger.info("Model %s: %s", name, report['models'][name])
+
+    report['cache'] = {'hits': cache.hits, 'misses': cache.misses}
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the aviation damage models and save them for serving')
+    parser.add_argument('data', help='AviationData.csv export')
+    parser.add_argument('--encoding', default='windows-1252', help='text encoding of the CSV')
+    parser.add_argument('--output', default='models', help='directory the trained models are saved to')
+    parser.add_argument('--format', choices=['pickle', 'bundle'], default='pickle', help='saved model format')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=sorted(MODELS),
+                        help='model kinds to train')
+    parser.add_argument('--cache-dir', default=CACHE_DIRECTORY, help='directory for cached stage outputs')
+    parser.add_argument('--jobs', type=int, default=-1, help='parallel search processes, -1 for one per CPU')
+    parser.add_argument('--cv', type=int, default=5, help='cross-validation folds')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--percentile', type=float, default=95,
+                        help='drop rows above this percentile of each numeric column, 100 keeps all')
+    parser.add_argument('--vif-threshold', type=float, default=15, help='drop features with a VIF at or above this')
+    parser.add_argument('--title-case', action='store_true',
+                        help='title-case categorical values (clients must then send them title-cased too)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report', help='also write the JSON report to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from logconfig import configure_logging
+    configure_logging()
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Background reloading of models whose files change on disk.
+
+The watcher polls the models directory every MODEL_WATCH_SECONDS seconds
+(0, the default, disables it). A new or changed model file is loaded only
+once its fingerprint has stayed the same for one full interval, so a file
+that is still being copied in is not read half-written. The loaded bundle
+is validated with a sample prediction, registered and, if it is the
+default model, published with one reference swap. Requests never wait for
+the load, and requests already running finish on the bundle they started
+with. A file that fails to load or validate is logged and skipped until it
+changes again; the previous version keeps serving.
+"""
+
+import logging
+import os
+import threading
+
+from metrics import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_SECONDS', 0))
+
+
+class ModelWatcher:
+    def __init__(self, classifier, interval=WATCH_INTERVAL):
+        self.classifier = classifier
+        self.interval = interval
+        self._known = {}
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.swaps = 0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self):
+        """Remember the files present now and start polling for changes"""
+        self._known = self._scan()
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _scan(self):
+        fingerprints = {}
+        for name in self.classifier.get_available_models():
+            fingerprint = self.classifier.model_fingerprint(name)
+            if fingerprint is not None:
+                fingerprints[name] = fingerprint
+        return fingerprints
+
+    def _run(self):
+        current_endpoint.set('watcher')
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Model watcher poll failed")
+
+    def poll(self):
+        """Check the directory once, reloading files that changed and have settled"""
+        reloaded = []
+        for name, fingerprint in self._scan().items():
+            if self._known.get(name) == fingerprint:
+                continue
+            if self._pending.get(name) != fingerprint:
+                # Seen for the first time: wait for it to stop changing
+                self._pending[name] = fingerprint
+                continue
+            del self._pending[name]
+            self._known[name] = fingerprint
+            if self._reload(name, fingerprint):
+                reloaded.append(name)
+        return reloaded
+
+    def _reload(self, name, fingerprint):
+        classifier = self.classifier
+        try:
+            bundle = classifier.read_model(name)
+            if bundle.fingerprint != fingerprint:
+                # Replaced again while it was read; the next poll sees the new version
+                self._known.pop(name, None)
+                return False
+            classifier.validate(bundle)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f'{name}: {e}'
+            logger.error("Not reloading model %s: %s", name, e)
+            return False
+
+        classifier.registry.put(name, bundle)
+        published = classifier.publish(bundle, replace_only=True)
+        self.swaps += 1
+        logger.info("Reloaded model %s from disk%s", name, ' as the default' if published else '')
+        return True
+
+    def stats(self):
+        return {
+            'interval_seconds': self.interval,
+            'known_models': sorted(self._known),
+            'swaps': self.swaps,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }